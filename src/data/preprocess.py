@@ -17,11 +17,18 @@ Date: December 2025
 import pandas as pd
 import numpy as np
 import os
+import sys
 from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import StandardScaler, LabelEncoder
 import warnings
 warnings.filterwarnings('ignore')
 
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+from src.stats.sketches import sketch_chunks, sketch_path, precision_for_error
+
+# Distinct policies per (Province, RiskSegment) are sketched alongside each split
+POLICY_SKETCH_KEYS = ['Province', 'RiskSegment']
+
 
 class InsuranceDataPreprocessor:
     """Complete preprocessing pipeline for insurance data"""
@@ -356,8 +363,41 @@ class InsuranceDataPreprocessor:
         
         return train, val, test
     
-    def save_processed_data(self, train, val, test, output_dir='data/processed'):
-        """Save processed datasets to parquet format"""
+    def save_partitioned(self, df, split_dir, partition_rows):
+        """Write a split as part-NNNNN.parquet files of at most partition_rows rows"""
+        os.makedirs(split_dir, exist_ok=True)
+        for old in os.listdir(split_dir):
+            if old.startswith('part-') and old.endswith('.parquet'):
+                os.remove(os.path.join(split_dir, old))
+        n_parts = 0
+        for n_parts, start in enumerate(range(0, len(df), partition_rows), start=1):
+            df.iloc[start:start + partition_rows].to_parquet(
+                f'{split_dir}/part-{n_parts - 1:05d}.parquet', index=False, compression='snappy'
+            )
+        return n_parts
+    
+    def save_policy_sketches(self, df, data_path, error=0.01):
+        """Save HyperLogLog sketches of PolicyID per (Province, RiskSegment) next to a split
+        
+        Segment reports and other rollups can then estimate distinct policy
+        counts from unions of the sketches without rescanning the split.
+        """
+        keys = [col for col in POLICY_SKETCH_KEYS if col in df.columns]
+        if 'PolicyID' not in df.columns or not keys:
+            return None
+        sketches = sketch_chunks([df], 'PolicyID', keys, precision=precision_for_error(error))
+        return sketches.save(sketch_path(data_path))
+    
+    def save_processed_data(self, train, val, test, output_dir='data/processed', partition_rows=None,
+                            policy_sketch_error=0.01):
+        """Save processed datasets to parquet format
+        
+        With partition_rows, each split is also written as a directory of
+        part files (train/, val/, test/) that out-of-core training and
+        scoring can stream one partition at a time. Each split also gets
+        policy-count sketches ({split}_policy_hll.npz, see
+        save_policy_sketches) at policy_sketch_error relative error.
+        """
         print(f"\nSaving processed data to {output_dir}...")
         
         os.makedirs(output_dir, exist_ok=True)
@@ -366,6 +406,16 @@ class InsuranceDataPreprocessor:
         val.to_parquet(f'{output_dir}/val.parquet', index=False, compression='snappy')
         test.to_parquet(f'{output_dir}/test.parquet', index=False, compression='snappy')
         
+        for name, split in [('train', train), ('val', val), ('test', test)]:
+            path = self.save_policy_sketches(split, f'{output_dir}/{name}.parquet', policy_sketch_error)
+            if path:
+                print(f"  ✓ Saved {os.path.basename(path)}")
+        
+        if partition_rows:
+            for name, split in [('train', train), ('val', val), ('test', test)]:
+                n_parts = self.save_partitioned(split, f'{output_dir}/{name}', partition_rows)
+                print(f"  ✓ Saved {name}/: {n_parts} partitions of up to {partition_rows:,} rows")
+        
         print(f"  ✓ Saved train.parquet: {len(train):,} rows")
         print(f"  ✓ Saved val.parquet: {len(val):,} rows")
         print(f"  ✓ Saved test.parquet: {len(test):,} rows")
@@ -409,7 +459,7 @@ class InsuranceDataPreprocessor:
         
         return all_passed
     
-    def run_pipeline(self, input_file, output_dir='data/processed'):
+    def run_pipeline(self, input_file, output_dir='data/processed', partition_rows=None):
         """Execute complete preprocessing pipeline"""
         print("="*80)
         print("ACIS INSURANCE DATA PREPROCESSING PIPELINE")
@@ -479,7 +529,7 @@ class InsuranceDataPreprocessor:
         print("\n" + "="*80)
         print("SAVING PROCESSED DATA")
         print("="*80)
-        self.save_processed_data(train, val, test, output_dir)
+        self.save_processed_data(train, val, test, output_dir, partition_rows=partition_rows)
         
         print("\n" + "="*80)
         print("PREPROCESSING PIPELINE COMPLETE")
@@ -0,0 +1,151 @@
+import numpy as np
+import pandas as pd
+import logging
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Default strata: claimants are rare, so sampling within (HasClaim, Province,
+# RiskSegment) cells keeps them represented. Missing columns are skipped.
+DEFAULT_STRATA = ('HasClaim', 'Province', 'RiskSegment')
+
+
+def allocate(sizes, n, min_per_stratum=None):
+    """
+    Splits a sample of n rows between strata of the given sizes ({stratum: N_h}).
+
+    Every stratum first gets min_per_stratum rows (default: an equal share of
+    half the sample), so rare strata such as claimants are well covered; the
+    rest is allocated proportionally to the remaining stratum sizes (largest
+    remainders). No stratum gets more rows than it has.
+    Returns {stratum: k_h}.
+    """
+    sizes = {key: int(size) for key, size in sizes.items() if size > 0}
+    if not sizes:
+        return {}
+    if n >= sum(sizes.values()):
+        return dict(sizes)
+    if min_per_stratum is None:
+        min_per_stratum = max(1, n // (2 * len(sizes)))
+    # Too many strata for the floor: spread n as evenly as possible instead
+    min_per_stratum = min(min_per_stratum, n // len(sizes))
+
+    alloc = {key: min(size, min_per_stratum) for key, size in sizes.items()}
+    left = n - sum(alloc.values())
+    spare = {key: sizes[key] - alloc[key] for key in sizes}
+    total_spare = sum(spare.values())
+    if left > 0 and total_spare > 0:
+        share = {key: left * s / total_spare for key, s in spare.items()}
+        extra = {key: min(spare[key], int(np.floor(v))) for key, v in share.items()}
+        # Hand out what flooring left over, largest remainders first
+        order = sorted(share, key=lambda key: share[key] - np.floor(share[key]), reverse=True)
+        remaining = left - sum(extra.values())
+        for key in order:
+            if remaining <= 0:
+                break
+            if extra[key] < spare[key]:
+                extra[key] += 1
+                remaining -= 1
+        for key in extra:
+            alloc[key] += extra[key]
+    return alloc
+
+
+class StratifiedSampler:
+    """
+    Reproducible stratified sampling with Horvitz-Thompson weights.
+
+    Rows are grouped into strata by the strata columns (HasClaim is derived
+    from TotalClaims or a claims series when absent), the sample is split
+    between strata with allocate(), and each stratum is sampled uniformly by
+    taking the rows with the smallest random keys. Every sampled row gets
+    weight N_h / k_h, so weighted sums and means over the sample estimate
+    the full-data ones without bias.
+
+    sample(df) draws from an in-memory frame. For streaming input, update()
+    each chunk and call result(): a per-stratum reservoir keeps the rows
+    with the smallest keys seen so far (at most capacity per stratum), which
+    is a uniform sample of everything streamed.
+    """
+
+    def __init__(self, n, strata=None, min_per_stratum=None, capacity=None, random_state=42):
+        self.n = n
+        self.strata = list(strata) if strata is not None else list(DEFAULT_STRATA)
+        self.min_per_stratum = min_per_stratum
+        self.capacity = capacity or n
+        self.random_state = random_state
+        self._rng = np.random.default_rng(random_state)
+        self._reservoir = None
+        self.counts = {}
+
+    def stratum_keys(self, df, claims=None):
+        """Stratum label of every row of df ('|'-joined strata values)."""
+        key = pd.Series('', index=df.index)
+        for col in self.strata:
+            if col in df.columns:
+                values = df[col]
+            elif col == 'HasClaim' and claims is not None:
+                values = pd.Series(np.asarray(claims) > 0, index=df.index).astype(int)
+            elif col == 'HasClaim' and 'TotalClaims' in df.columns:
+                values = (df['TotalClaims'] > 0).astype(int)
+            else:
+                continue
+            key = key + '|' + values.astype(str)
+        return key
+
+    @staticmethod
+    def _select(keys, random_keys, alloc):
+        """Positions of the alloc[stratum] rows with the smallest random keys in each stratum."""
+        order = np.lexsort((random_keys, keys.to_numpy()))
+        ranked = keys.iloc[order]
+        rank = ranked.groupby(ranked.to_numpy(), sort=False).cumcount().to_numpy()
+        limit = ranked.map(alloc).fillna(0).to_numpy()
+        chosen = order[rank < limit]
+        # Random order, so any prefix of the sample is itself a random subset
+        return chosen[np.argsort(random_keys[chosen], kind='stable')]
+
+    def _weights(self, keys, alloc, sizes):
+        return keys.map({key: sizes[key] / k for key, k in alloc.items() if k > 0}).astype(float)
+
+    def sample(self, df, claims=None):
+        """
+        Stratified sample of df. claims: optional per-row claim amounts (or
+        0/1 flags) used for the HasClaim stratum when df has neither HasClaim
+        nor TotalClaims. Returns (sample frame, weights aligned to it).
+        """
+        keys = self.stratum_keys(df, claims)
+        sizes = keys.value_counts().to_dict()
+        alloc = allocate(sizes, self.n, self.min_per_stratum)
+        random_keys = np.random.default_rng(self.random_state).random(len(df))
+        positions = self._select(keys, random_keys, alloc)
+        sample = df.iloc[positions]
+        weights = self._weights(keys.iloc[positions], alloc, sizes)
+        logging.info(f"Stratified sample of {len(sample):,} / {len(df):,} rows over {len(sizes)} strata")
+        return sample, weights.rename('weight')
+
+    def update(self, chunk, claims=None):
+        """Folds one chunk of a stream into the per-stratum reservoirs."""
+        keys = self.stratum_keys(chunk, claims)
+        for key, count in keys.value_counts().items():
+            self.counts[key] = self.counts.get(key, 0) + int(count)
+        pool = chunk.assign(_stratum=keys.to_numpy(), _key=self._rng.random(len(chunk)))
+        if self._reservoir is not None:
+            pool = pd.concat([self._reservoir, pool])
+        keep = self._select(pool['_stratum'].reset_index(drop=True), pool['_key'].to_numpy(),
+                            {key: self.capacity for key in self.counts})
+        self._reservoir = pool.iloc[keep]
+        return self
+
+    def result(self):
+        """(sample, weights) of everything passed to update so far."""
+        if self._reservoir is None:
+            raise ValueError("No data has been streamed; call update() first")
+        alloc = allocate(self.counts, self.n, self.min_per_stratum)
+        # Reservoirs hold at most capacity rows per stratum
+        alloc = {key: min(k, self.capacity) for key, k in alloc.items()}
+        keys = self._reservoir['_stratum'].reset_index(drop=True)
+        positions = self._select(keys, self._reservoir['_key'].to_numpy(), alloc)
+        sample = self._reservoir.iloc[positions].drop(columns=['_stratum', '_key'])
+        weights = self._weights(keys.iloc[positions], alloc, self.counts)
+        weights.index = sample.index
+        return sample, weights.rename('weight')
@@ -2,9 +2,14 @@
 Data Cleaning Utilities for AlphaCare Insurance Solutions
 """
 
+import os
+import sys
 import pandas as pd
 import numpy as np
-from typing import Tuple, List, Optional
+from typing import Tuple, List, Optional, Dict
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from src.stats.accumulators import GroupStats, accumulate_chunks
 
 
 def detect_missing_values(df: pd.DataFrame) -> pd.DataFrame:
@@ -82,10 +87,66 @@ def detect_outliers_zscore(df: pd.DataFrame, column: str, threshold: float = 3.0
     """
     z_scores = np.abs((df[column] - df[column].mean()) / df[column].std())
     outliers = df[z_scores > threshold]
-    
+
     return outliers
 
 
+def detect_outliers_zscore_chunked(filepath: str,
+                                   column: str,
+                                   threshold: float = 3.0,
+                                   group_col: Optional[str] = None,
+                                   chunksize: int = 100_000,
+                                   sep: str = '|') -> pd.DataFrame:
+    """
+    Detect Z-score outliers in a file too large to load at once.
+
+    The first pass streams the file into mergeable group accumulators
+    (count/mean/M2); the second pass streams it again and keeps only the
+    rows beyond the threshold. Without group_col this matches
+    detect_outliers_zscore on the full dataframe.
+
+    Parameters:
+    -----------
+    filepath : str
+        Path to the delimited data file
+    column : str
+        Column name to check for outliers
+    threshold : float, default 3.0
+        Z-score threshold
+    group_col : str, optional
+        Compute Z-scores within each group instead of globally
+    chunksize : int, default 100_000
+        Rows per chunk
+    sep : str, default '|'
+        Field delimiter
+
+    Returns:
+    --------
+    pd.DataFrame
+        Dataframe containing outliers
+    """
+    usecols = [column] + ([group_col] if group_col else [])
+    acc = accumulate_chunks(
+        pd.read_csv(filepath, sep=sep, usecols=usecols, chunksize=chunksize, low_memory=False),
+        column, group_col, GroupStats()
+    )
+    means, stds = acc.mean, acc.std()
+
+    outliers = []
+    for chunk in pd.read_csv(filepath, sep=sep, chunksize=chunksize, low_memory=False):
+        values = pd.to_numeric(chunk[column], errors='coerce').to_numpy(dtype=float)
+        if group_col:
+            codes = acc.encode(chunk[group_col])
+        else:
+            codes = np.zeros(len(chunk), dtype=np.int64)
+        valid = codes >= 0
+        z_scores = np.full(len(chunk), np.nan)
+        z_scores[valid] = np.abs((values[valid] - means[codes[valid]]) / stds[codes[valid]])
+        outliers.append(chunk[z_scores > threshold])
+
+    return pd.concat(outliers) if outliers else pd.DataFrame()
+
+
 def calculate_loss_ratio(df: pd.DataFrame, 
                          premium_col: str = 'TotalPremium',
                          claims_col: str = 'TotalClaims') -> pd.Series:
@@ -138,19 +199,86 @@ def calculate_loss_ratio_by_group(df: pd.DataFrame,
     pd.DataFrame
         Grouped loss ratio analysis
     """
-    analysis = df.groupby(group_col).agg({
-        premium_col: 'sum',
-        claims_col: 'sum',
-        count_col: 'count'
-    }).reset_index()
-    
-    analysis.columns = [group_col, 'TotalPremium', 'TotalClaims', 'PolicyCount']
-    analysis['LossRatio'] = (analysis['TotalClaims'] / analysis['TotalPremium']) * 100
-    analysis = analysis.sort_values('LossRatio', ascending=True)
-    
+    metrics = calculate_group_metrics(df, [group_col], premium_col, claims_col, count_col)[group_col]
+    analysis = metrics[[group_col, 'TotalPremium', 'TotalClaims', 'PolicyCount', 'LossRatio']]
+
     return analysis
 
 
+def calculate_group_metrics(df: pd.DataFrame,
+                            group_cols: List[str],
+                            premium_col: Optional[str] = 'TotalPremium',
+                            claims_col: str = 'TotalClaims',
+                            count_col: Optional[str] = 'PolicyID') -> Dict[str, pd.DataFrame]:
+    """
+    Calculate premium, claims, policy count, loss ratio, claim frequency and
+    claim severity for several grouping columns at once.
+
+    Each grouping column is factorized once and every metric comes from the
+    same set of masked bincount reductions over its codes, instead of one
+    groupby pass per metric. Each frame can be passed straight to
+    visualization.plot_loss_ratio_by_group.
+
+    Parameters:
+    -----------
+    df : pd.DataFrame
+        Input dataframe
+    group_cols : list
+        Columns to group by
+    premium_col : str, optional, default 'TotalPremium'
+        Column name for premiums; None skips TotalPremium and LossRatio
+    claims_col : str, default 'TotalClaims'
+        Column name for claims
+    count_col : str, optional, default 'PolicyID'
+        Column to count; None skips PolicyCount
+
+    Returns:
+    --------
+    dict
+        {group_col: DataFrame with TotalPremium, TotalClaims, PolicyCount,
+        LossRatio (%), ClaimFrequency (%) and ClaimSeverity, sorted by
+        LossRatio (by group when premium_col is None)}
+    """
+    claims = df[claims_col].to_numpy(dtype=float, na_value=np.nan)
+    has_claim = claims > 0
+    claims = np.where(np.isnan(claims), 0.0, claims)
+    if premium_col is not None:
+        premium = df[premium_col].to_numpy(dtype=float, na_value=np.nan)
+        premium = np.where(np.isnan(premium), 0.0, premium)
+    if count_col is not None:
+        counted = df[count_col].notna().to_numpy(dtype=float)
+
+    results = {}
+    for group_col in group_cols:
+        codes, labels = pd.factorize(df[group_col], sort=True)
+        valid = codes >= 0
+        codes = codes[valid]
+        k = len(labels)
+
+        n_rows = np.bincount(codes, minlength=k)
+        total_claims = np.bincount(codes, weights=claims[valid], minlength=k)
+        claimants = np.bincount(codes, weights=has_claim[valid], minlength=k)
+        claimant_claims = np.bincount(codes, weights=np.where(has_claim, claims, 0.0)[valid], minlength=k)
+
+        metrics = {group_col: labels}
+        with np.errstate(divide='ignore', invalid='ignore'):
+            if premium_col is not None:
+                total_premium = np.bincount(codes, weights=premium[valid], minlength=k)
+                metrics['TotalPremium'] = total_premium
+            metrics['TotalClaims'] = total_claims
+            if count_col is not None:
+                metrics['PolicyCount'] = np.bincount(codes, weights=counted[valid], minlength=k).astype(int)
+            if premium_col is not None:
+                metrics['LossRatio'] = total_claims / total_premium * 100
+            metrics['ClaimFrequency'] = claimants / n_rows * 100
+            metrics['ClaimSeverity'] = claimant_claims / claimants
+        metrics = pd.DataFrame(metrics)
+        results[group_col] = metrics.sort_values('LossRatio' if premium_col is not None else group_col,
+                                                 ascending=True)
+
+    return results
+
+
 def calculate_claim_frequency(df: pd.DataFrame,
                               group_col: Optional[str] = None,
                               claims_col: str = 'TotalClaims') -> pd.Series:
@@ -172,9 +300,9 @@ def calculate_claim_frequency(df: pd.DataFrame,
         Claim frequency values
     """
     if group_col:
-        frequency = df.groupby(group_col).apply(
-            lambda x: ((x[claims_col] > 0).sum() / len(x)) * 100
-        )
+        metrics = calculate_group_metrics(df, [group_col], premium_col=None, claims_col=claims_col,
+                                          count_col=None)[group_col]
+        frequency = metrics.set_index(group_col)['ClaimFrequency'].sort_index().rename(None)
     else:
         frequency = ((df[claims_col] > 0).sum() / len(df)) * 100
     
@@ -201,12 +329,12 @@ def calculate_claim_severity(df: pd.DataFrame,
     pd.Series
         Claim severity values
     """
-    df_with_claims = df[df[claims_col] > 0]
-    
     if group_col:
-        severity = df_with_claims.groupby(group_col)[claims_col].mean()
+        metrics = calculate_group_metrics(df, [group_col], premium_col=None, claims_col=claims_col,
+                                          count_col=None)[group_col]
+        severity = metrics.set_index(group_col)['ClaimSeverity'].dropna().sort_index().rename(claims_col)
     else:
-        severity = df_with_claims[claims_col].mean()
+        severity = df.loc[df[claims_col] > 0, claims_col].mean()
     
     return severity
 
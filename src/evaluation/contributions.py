@@ -0,0 +1,311 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+import logging
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import joblib
+import xgboost as xgb
+from threadpoolctl import threadpool_limits
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+from src.models.xgb_training import BoosterModel
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+# KernelExplainer logs every row's solution at INFO
+logging.getLogger('shap').setLevel(logging.WARNING)
+
+# Per-worker state, loaded once by _init_worker
+_EXPLAINER = {}
+
+
+class ContributionStats:
+    """
+    Mergeable streaming summary of per-row SHAP contributions.
+
+    Keeps, per feature, the row count, sum of |SHAP| and sum of SHAP, and a
+    histogram over the feature's values (fixed bin edges, e.g. training
+    quantiles) with the row count and SHAP sum of each bin, which gives the
+    SHAP dependence curve. Memory is O(features x bins) regardless of how
+    many rows are explained; partial results from chunks or worker
+    processes combine with merge.
+    """
+
+    def __init__(self, feature_names, edges):
+        self.feature_names = list(feature_names)
+        self.edges = [np.asarray(e, dtype=np.float64) for e in edges]
+        p = len(self.feature_names)
+        self.count = 0
+        self.base_sum = 0.0
+        self.abs_sum = np.zeros(p)
+        self.sum = np.zeros(p)
+        self.sq_sum = np.zeros(p)
+        self.bin_count = [np.zeros(len(e) + 1) for e in self.edges]
+        self.bin_shap = [np.zeros(len(e) + 1) for e in self.edges]
+
+    @classmethod
+    def from_data(cls, X, n_bins=20):
+        """Empty accumulator with bin edges at the quantiles of each column of X."""
+        quantiles = np.linspace(0, 1, n_bins + 1)[1:-1]
+        values = np.asarray(X, dtype=np.float64)
+        edges = [np.unique(np.nanquantile(values[:, j], quantiles)) for j in range(values.shape[1])]
+        return cls(X.columns, edges)
+
+    def update(self, X, contributions, base=None):
+        """Folds one chunk: X (n x p feature values), contributions (n x p SHAP values)."""
+        X = np.asarray(X, dtype=np.float64)
+        contributions = np.asarray(contributions, dtype=np.float64)
+        self.count += len(contributions)
+        if base is not None:
+            self.base_sum += float(np.sum(base))
+        self.abs_sum += np.abs(contributions).sum(axis=0)
+        self.sum += contributions.sum(axis=0)
+        self.sq_sum += (contributions ** 2).sum(axis=0)
+        for j, edges in enumerate(self.edges):
+            bins = np.searchsorted(edges, X[:, j], side='right')
+            self.bin_count[j] += np.bincount(bins, minlength=len(edges) + 1)
+            self.bin_shap[j] += np.bincount(bins, weights=contributions[:, j], minlength=len(edges) + 1)
+        return self
+
+    def merge(self, other):
+        """Adds another accumulator with the same features and edges."""
+        self.count += other.count
+        self.base_sum += other.base_sum
+        self.abs_sum += other.abs_sum
+        self.sum += other.sum
+        self.sq_sum += other.sq_sum
+        for j in range(len(self.edges)):
+            self.bin_count[j] += other.bin_count[j]
+            self.bin_shap[j] += other.bin_shap[j]
+        return self
+
+    def to_arrays(self):
+        """Flat numpy arrays holding the full state (see from_arrays), e.g. for np.savez."""
+        return {
+            'feature_names': np.array(self.feature_names, dtype=str),
+            'edge_offsets': np.cumsum([0] + [len(e) for e in self.edges]),
+            'edges': np.concatenate(self.edges) if self.edges else np.empty(0),
+            'count': np.array(self.count), 'base_sum': np.array(self.base_sum),
+            'abs_sum': self.abs_sum, 'sum': self.sum, 'sq_sum': self.sq_sum,
+            'bin_count': np.concatenate(self.bin_count) if self.edges else np.empty(0),
+            'bin_shap': np.concatenate(self.bin_shap) if self.edges else np.empty(0),
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        offsets = arrays['edge_offsets']
+        edges = [arrays['edges'][a:b] for a, b in zip(offsets[:-1], offsets[1:])]
+        stats = cls(arrays['feature_names'].tolist(), edges)
+        stats.count = int(arrays['count'])
+        stats.base_sum = float(arrays['base_sum'])
+        stats.abs_sum, stats.sum, stats.sq_sum = arrays['abs_sum'], arrays['sum'], arrays['sq_sum']
+        # Each feature has len(edges) + 1 bins
+        bin_offsets = offsets + np.arange(len(offsets))
+        stats.bin_count = [arrays['bin_count'][a:b] for a, b in zip(bin_offsets[:-1], bin_offsets[1:])]
+        stats.bin_shap = [arrays['bin_shap'][a:b] for a, b in zip(bin_offsets[:-1], bin_offsets[1:])]
+        return stats
+
+    @property
+    def mean_abs(self):
+        return self.abs_sum / max(self.count, 1)
+
+    @property
+    def expected_value(self):
+        return self.base_sum / max(self.count, 1)
+
+    def importance(self):
+        """Mean |SHAP|, mean SHAP and SHAP std per feature, most important first."""
+        n = max(self.count, 1)
+        mean = self.sum / n
+        return pd.DataFrame({
+            'feature': self.feature_names,
+            'importance': self.mean_abs,
+            'mean_shap': mean,
+            'std_shap': np.sqrt(np.maximum(self.sq_sum / n - mean ** 2, 0)),
+        }).sort_values('importance', ascending=False).reset_index(drop=True)
+
+    def dependence(self, feature):
+        """Row count and mean SHAP per value bin of a feature."""
+        j = self.feature_names.index(feature)
+        edges = self.edges[j]
+        lower = np.concatenate([[-np.inf], edges])
+        upper = np.concatenate([edges, [np.inf]])
+        count = self.bin_count[j]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = self.bin_shap[j] / count
+        return pd.DataFrame({'lower': lower, 'upper': upper, 'count': count, 'mean_shap': mean})
+
+
+def _unwrap(model):
+    """(kind, model) for the supported tree models: 'booster', 'xgb' or 'sklearn'."""
+    if isinstance(model, BoosterModel):
+        return 'booster', model
+    if isinstance(model, xgb.XGBModel):
+        return 'xgb', model
+    if hasattr(model, 'estimators_') and hasattr(model.estimators_[0], 'tree_'):
+        return 'sklearn', model
+    raise TypeError(f"No native tree contributions for {type(model).__name__}")
+
+
+def explainer_kind(model):
+    """
+    How a model is explained: 'tree' (native tree contributions), 'linear'
+    (closed form from coef_ / intercept_) or 'kernel' (sampling-based).
+    """
+    try:
+        _unwrap(model)
+        return 'tree'
+    except (TypeError, AttributeError, IndexError):
+        pass
+    coef = getattr(model, 'coef_', None)
+    # Single-output models only (regression, binary classification)
+    if coef is not None and hasattr(model, 'intercept_') and (np.ndim(coef) == 1 or np.shape(coef)[0] == 1):
+        return 'linear'
+    return 'kernel'
+
+
+def linear_contributions(model, X, mean):
+    """
+    Exact SHAP values (n x p) and base values (n) of a linear model under
+    feature independence: coef * (x - mean), with mean the background
+    (training) feature means. Classifiers and GLMs are explained on the
+    link scale (log-odds for logistic regression).
+    """
+    coef = np.ravel(model.coef_)
+    values = (np.asarray(X, dtype=np.float64) - mean) * coef
+    base = float(np.ravel(model.intercept_)[0] + coef @ mean)
+    return values, np.full(len(values), base)
+
+
+def _prediction_fn(model, columns):
+    """Scalar output explained by the kernel explainer: P(class 1) or the prediction."""
+    if hasattr(model, 'predict_proba'):
+        return lambda X: model.predict_proba(pd.DataFrame(X, columns=columns))[:, 1]
+    return lambda X: model.predict(pd.DataFrame(X, columns=columns))
+
+
+def kernel_contributions(model, X, background, time_budget=60.0, n_background=20, batch_rows=10,
+                         nsamples='auto'):
+    """
+    Sampling-based SHAP (KernelExplainer) for models without a closed form.
+    The background set is summarised to n_background weighted k-means
+    centroids, and rows of X are explained batch_rows at a time until
+    time_budget seconds are spent (at least one batch).
+    Returns (values, base values, number of leading rows of X explained).
+    """
+    import shap
+    start = time.perf_counter()
+    summary = shap.kmeans(np.asarray(background, dtype=np.float64), min(n_background, len(background)))
+    explainer = shap.KernelExplainer(_prediction_fn(model, list(X.columns)), summary)
+    values = []
+    for lo in range(0, len(X), batch_rows):
+        batch = np.asarray(X.iloc[lo:lo + batch_rows], dtype=np.float64)
+        values.append(np.asarray(explainer.shap_values(batch, nsamples=nsamples, silent=True)))
+        if time.perf_counter() - start > time_budget:
+            break
+    values = np.concatenate(values)
+    logging.info(f"KernelExplainer explained {len(values):,} of {len(X):,} rows "
+                 f"in {time.perf_counter() - start:.1f}s (budget {time_budget:.0f}s)")
+    return values, np.full(len(values), float(np.ravel(explainer.expected_value)[0])), len(values)
+
+
+def tree_contributions(model, X, n_threads=1):
+    """
+    Per-row SHAP values (n x p) and base values (n) of a tree ensemble.
+
+    XGBoost uses the booster's native pred_contribs (margin space, i.e.
+    log-odds for classifiers); sklearn forests use the TreeSHAP algorithm of
+    shap.TreeExplainer (class-1 probability for classifiers).
+    """
+    kind, model = _unwrap(model)
+    if kind == 'sklearn':
+        import shap
+        explainer = _EXPLAINER.get('tree') or shap.TreeExplainer(model)
+        values = np.asarray(explainer.shap_values(X, check_additivity=False))
+        if values.ndim == 3:
+            values = values[..., -1]
+        return values, np.full(len(values), np.ravel(explainer.expected_value)[-1])
+
+    if kind == 'booster':
+        booster, dmatrix = model.booster, model._dmatrix(X)
+        iteration_range = (0, model.best_iteration + 1)
+    else:
+        booster = model.get_booster()
+        dmatrix = xgb.DMatrix(X, enable_categorical=True)
+        best = getattr(model, 'best_iteration', None)
+        iteration_range = (0, best + 1) if best is not None else (0, 0)
+    with threadpool_limits(limits=n_threads):
+        contribs = booster.predict(dmatrix, pred_contribs=True, iteration_range=iteration_range)
+    return contribs[:, :-1], contribs[:, -1]
+
+
+def _init_worker(model_path):
+    # One thread per worker: parallelism comes from the process pool
+    _EXPLAINER['limits'] = threadpool_limits(limits=1)
+    _EXPLAINER['model'] = joblib.load(model_path)
+    if _unwrap(_EXPLAINER['model'])[0] == 'sklearn':
+        import shap
+        _EXPLAINER['tree'] = shap.TreeExplainer(_EXPLAINER['model'])
+
+
+def _explain_range(data_dir, start, stop, stats):
+    chunk = joblib.load(os.path.join(data_dir, 'X.joblib'), mmap_mode='r').iloc[start:stop]
+    values, base = tree_contributions(_EXPLAINER['model'], chunk)
+    return stats.update(chunk, values, base)
+
+
+def stream_contributions(model, X, chunk_rows=20_000, n_workers=None, n_bins=20):
+    """
+    Explains every row of X with tree_contributions in chunk_rows chunks,
+    spread over n_workers processes (default: all cores) that memory-map one
+    shared copy of X, and streams the results into a ContributionStats
+    instead of materialising the n x p SHAP matrix. Linear models use the
+    closed form in-process (it is a few vectorised operations per chunk).
+    """
+    kind = explainer_kind(model)
+    if kind == 'kernel':
+        raise TypeError(f"No closed-form or tree contributions for {type(model).__name__}")
+    n_workers = n_workers or os.cpu_count() or 1
+    stats = ContributionStats.from_data(X, n_bins=n_bins)
+    bounds = [(start, min(start + chunk_rows, len(X))) for start in range(0, len(X), chunk_rows)]
+    n_workers = min(n_workers, len(bounds))
+    start_time = time.perf_counter()
+
+    if kind == 'linear':
+        n_workers = 1
+        mean = X.mean().to_numpy(dtype=np.float64)
+        for start, stop in bounds:
+            chunk = X.iloc[start:stop]
+            stats.update(chunk, *linear_contributions(model, chunk, mean))
+    elif n_workers <= 1:
+        kind, _ = _unwrap(model)
+        if kind == 'sklearn':
+            import shap
+            _EXPLAINER['tree'] = shap.TreeExplainer(model)
+        try:
+            for start, stop in bounds:
+                chunk = X.iloc[start:stop]
+                values, base = tree_contributions(model, chunk, n_threads=os.cpu_count() or 1)
+                stats.update(chunk, values, base)
+        finally:
+            _EXPLAINER.pop('tree', None)
+    else:
+        data_dir = tempfile.mkdtemp(prefix='acis_shap_')
+        try:
+            joblib.dump(X, os.path.join(data_dir, 'X.joblib'))
+            joblib.dump(model, os.path.join(data_dir, 'model.joblib'))
+            empty = ContributionStats(stats.feature_names, stats.edges)
+            with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker,
+                                     initargs=(os.path.join(data_dir, 'model.joblib'),)) as pool:
+                for partial in pool.map(_explain_range, [data_dir] * len(bounds),
+                                        *zip(*bounds), [empty] * len(bounds)):
+                    stats.merge(partial)
+        finally:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    logging.info(f"Explained {stats.count:,} rows in {len(bounds)} chunks with {n_workers} workers "
+                 f"in {time.perf_counter() - start_time:.1f}s")
+    return stats
@@ -4,33 +4,116 @@ import pandas as pd
 import numpy as np
 import logging
 import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+from src.evaluation.contributions import (stream_contributions, explainer_kind, tree_contributions,
+                                          linear_contributions, kernel_contributions, ContributionStats)
+from src.evaluation.shap_cache import ShapCache, SHAP_CACHE_DIR
+from src.models.xgb_training import frame_fingerprint
+from src.data.sampling import StratifiedSampler
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# Rows in the stratified SHAP sample (summary plot and non-full importances)
+SHAP_SAMPLE_ROWS = 1000
+
 class ModelInterpreter:
-    def __init__(self, model, X_train, feature_names=None):
+    """
+    SHAP interpretation of a fitted model. With full=True, feature
+    importances come from native tree contributions over every row of
+    X_train (see calculate_shap_full) instead of a 1,000-row sample. The
+    sample is stratified by claim status (from y), Province and RiskSegment
+    with StratifiedSampler, and its weights keep sample importances unbiased.
+    The explainer follows the model: tree contributions for ensembles, exact
+    coef * (x - mean) for linear models, and otherwise a KernelExplainer on
+    a k-means background summary that stops after time_budget seconds.
+    Results are cached on disk under cache_dir, keyed by the model and the
+    explained rows (None disables the cache).
+    """
+
+    def __init__(self, model, X_train, feature_names=None, full=False, chunk_rows=20_000, n_workers=None,
+                 cache_dir=SHAP_CACHE_DIR, time_budget=60.0, n_background=20, y=None):
         self.model = model
         self.X_train = X_train
         self.feature_names = feature_names if feature_names is not None else X_train.columns
         self.explainer = None
         self.shap_values = None
+        self.full = full
+        self.chunk_rows = chunk_rows
+        self.n_workers = n_workers
+        self.contribution_stats = None
+        self.expected_value = None
+        self.cache = ShapCache(cache_dir) if cache_dir else None
+        self.method = explainer_kind(model)
+        self.time_budget = time_budget
+        self.n_background = n_background
+        self.explained_rows = None
+        self.y = y
+        self.sample_weights = None
+        self._sample_rows = None
+
+    def _sample(self):
+        if self._sample_rows is None:
+            sampler = StratifiedSampler(SHAP_SAMPLE_ROWS)
+            self._sample_rows, self.sample_weights = sampler.sample(self.X_train, claims=self.y)
+        return self._sample_rows
 
     def calculate_shap(self):
         """
-        Calculates SHAP values.
+        Calculates SHAP values for the stratified SHAP_SAMPLE_ROWS-row sample
+        (for kernel explanations, as many of its rows as fit in time_budget).
         """
-        logging.info("Calculating SHAP values...")
-        try:
-            # TreeExplainer for Tree models (XGBoost, RF)
-            self.explainer = shap.TreeExplainer(self.model)
-            # Use a sample for speed if dataset is large
-            sample_size = min(1000, self.X_train.shape[0])
-            self.shap_values = self.explainer.shap_values(self.X_train.iloc[:sample_size])
-            logging.info("SHAP values calculated.")
-        except Exception as e:
-            logging.warning(f"TreeExplainer failed, falling back to KernelExplainer or Linear: {e}")
-            # Fallback could be implemented here
-            pass
+        sample = self._sample()
+        settings = {'method': self.method}
+        if self.method != 'tree':
+            # Linear and kernel explanations also depend on the background data
+            settings.update(background=frame_fingerprint(self.X_train), time_budget=self.time_budget,
+                            n_background=self.n_background)
+        key = self.cache.key(self.model, sample, **settings) if self.cache else None
+        cached = self.cache.load(key) if self.cache else None
+        if cached is not None:
+            self.shap_values, self.expected_value = cached['shap_values'], cached['expected_value']
+            self.explained_rows = len(self.shap_values)
+            return
+
+        logging.info(f"Calculating SHAP values ({self.method} explainer)...")
+        if self.method == 'tree':
+            values, base = tree_contributions(self.model, sample, n_threads=self.n_workers or os.cpu_count() or 1)
+        elif self.method == 'linear':
+            values, base = linear_contributions(self.model, sample, self.X_train.mean().to_numpy(dtype=np.float64))
+        else:
+            background = self.X_train.sample(min(len(self.X_train), 10_000), random_state=42)
+            values, base, _ = kernel_contributions(self.model, sample, background, time_budget=self.time_budget,
+                                                   n_background=self.n_background)
+        self.shap_values, self.expected_value = values, base[:1]
+        self.explained_rows = len(values)
+        logging.info("SHAP values calculated.")
+        if self.cache:
+            self.cache.save(key, shap_values=self.shap_values, expected_value=self.expected_value)
+
+    def calculate_shap_full(self, n_bins=20):
+        """
+        SHAP contributions of every training row, computed in chunks across
+        worker processes (XGBoost pred_contribs, TreeSHAP for sklearn
+        forests) and streamed into mean-|SHAP| and per-feature value
+        histogram accumulators. Returns the ContributionStats.
+        """
+        if self.method == 'kernel':
+            logging.warning(f"No tree or linear contributions for {type(self.model).__name__}; using the SHAP sample.")
+            return None
+        key = self.cache.key(self.model, self.X_train, method='contributions', n_bins=n_bins) if self.cache else None
+        cached = self.cache.load(key) if self.cache else None
+        if cached is not None:
+            self.contribution_stats = ContributionStats.from_arrays(cached)
+            return self.contribution_stats
+
+        logging.info(f"Calculating SHAP contributions for all {len(self.X_train):,} rows...")
+        self.contribution_stats = stream_contributions(self.model, self.X_train, chunk_rows=self.chunk_rows,
+                                                       n_workers=self.n_workers, n_bins=n_bins)
+        if self.cache:
+            self.cache.save(key, **self.contribution_stats.to_arrays())
+        return self.contribution_stats
 
     def plot_top_features(self, output_path='outputs/shap_summary.png'):
         """
@@ -40,7 +123,7 @@ class ModelInterpreter:
             self.calculate_shap()
         
         plt.figure(figsize=(10, 8))
-        shap.summary_plot(self.shap_values, self.X_train.iloc[:min(1000, self.X_train.shape[0])], 
+        shap.summary_plot(self.shap_values, self._sample().iloc[:self.explained_rows], 
                           feature_names=self.feature_names, show=False)
         plt.tight_layout()
         plt.savefig(output_path)
@@ -49,12 +132,20 @@ class ModelInterpreter:
 
     def get_top_features_df(self, n=10):
         """
-        Returns a dataframe of top N important features based on mean |SHAP|.
+        Returns a dataframe of top N important features based on mean |SHAP|
+        (over the whole training set when full=True, else weighted over the sample).
         """
+        if self.full and self.contribution_stats is None:
+            self.calculate_shap_full()
+        if self.contribution_stats is not None:
+            df_imp = self.contribution_stats.importance()[['feature', 'importance']]
+            return df_imp.head(n)
+
         if self.shap_values is None:
             self.calculate_shap()
-            
-        feature_importance = np.abs(self.shap_values).mean(0)
+
+        weights = self.sample_weights.to_numpy()[:self.explained_rows]
+        feature_importance = np.average(np.abs(self.shap_values), axis=0, weights=weights)
         df_imp = pd.DataFrame({
             'feature': self.feature_names,
             'importance': feature_importance
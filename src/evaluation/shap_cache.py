@@ -0,0 +1,93 @@
+import os
+import sys
+import copy
+import json
+import pickle
+import hashlib
+import tempfile
+import logging
+import numpy as np
+import xgboost as xgb
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+from src.models.xgb_training import frame_fingerprint, BoosterModel, prune_cache, touch_cache_entry
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+SHAP_CACHE_DIR = os.path.join(tempfile.gettempdir(), 'acis_shap_cache')
+# Entries beyond this total size are evicted, least recently used first
+SHAP_CACHE_MAX_BYTES = 2**30
+
+
+def model_fingerprint(model):
+    """
+    Content hash of a fitted model. XGBoost models hash their serialized
+    trees (plus the best iteration); other models their pickle, with n_jobs
+    cleared so the thread budget a model was trained with does not matter.
+    """
+    h = hashlib.sha1(type(model).__name__.encode())
+    if isinstance(model, BoosterModel):
+        h.update(bytes(model.booster.save_raw('json')))
+        h.update(repr((model.objective, model.best_iteration, model.categories)).encode())
+    elif isinstance(model, xgb.XGBModel):
+        h.update(bytes(model.get_booster().save_raw('json')))
+        h.update(repr(getattr(model, 'best_iteration', None)).encode())
+    else:
+        if hasattr(model, 'get_params') and 'n_jobs' in model.get_params(deep=False):
+            model = copy.copy(model)
+            model.set_params(n_jobs=None)
+        h.update(pickle.dumps(model, protocol=4))
+    return h.hexdigest()
+
+
+class ShapCache:
+    """
+    On-disk cache of explanation results. Entries are compressed .npz files
+    named by a hash of the model, the explained data and the explanation
+    settings, so a rerun with an unchanged model and data loads the arrays
+    instead of explaining again, and any change simply misses. Each save
+    evicts least recently used entries beyond max_bytes (None: unbounded).
+    """
+
+    def __init__(self, root=SHAP_CACHE_DIR, max_bytes=SHAP_CACHE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+
+    def key(self, model, X, **settings):
+        payload = json.dumps(settings, sort_keys=True, default=str)
+        return hashlib.sha1(f"{model_fingerprint(model)}-{frame_fingerprint(X)}-{payload}".encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.root, f'{key}.npz')
+
+    def load(self, key):
+        """Cached arrays for key ({name: array}), or None on a miss."""
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                arrays = {name: data[name] for name in data.files}
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable SHAP cache entry {path}: {e}")
+            return None
+        logging.info(f"Loaded cached SHAP results from {path}")
+        touch_cache_entry(path)
+        return arrays
+
+    def save(self, key, **arrays):
+        """Stores arrays under key (written to a temporary file, then renamed)."""
+        os.makedirs(self.root, exist_ok=True)
+        path = self._path(key)
+        tmp_path = f'{path[:-4]}.{os.getpid()}.tmp.npz'
+        np.savez_compressed(tmp_path, **arrays)
+        os.replace(tmp_path, path)
+        prune_cache(self.root, self.max_bytes, keep=[path])
+        return path
+
+    def clear(self):
+        if not os.path.isdir(self.root):
+            return
+        for name in os.listdir(self.root):
+            if name.endswith('.npz'):
+                os.remove(os.path.join(self.root, name))
@@ -2,6 +2,7 @@ import pandas as pd
 import numpy as np
 import os
 import sys
+import joblib
 from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import LabelEncoder
 import logging
@@ -9,6 +10,32 @@ import logging
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# Numeric precision policy: feature matrices are float32 (what the tree
+# libraries use internally) and category codes the smallest signed integer
+# that holds them. Integer-valued columns too large to be exact in float32
+# (IDs, codes above 2**24) stay float64.
+FEATURE_DTYPE = np.float32
+FLOAT32_EXACT_INT = 2 ** 24
+
+def code_dtype(n_levels):
+    """Smallest signed integer dtype holding codes 0..n_levels-1 and -1 (unseen)."""
+    for dtype in (np.int8, np.int16, np.int32):
+        if n_levels <= np.iinfo(dtype).max:
+            return dtype
+    return np.int64
+
+def numeric_dtype(values):
+    """FEATURE_DTYPE, unless values are integers beyond float32's exact range."""
+    values = pd.to_numeric(values, errors='coerce')
+    finite = values[np.isfinite(values)]
+    if len(finite) and (finite % 1 == 0).all() and finite.abs().max() > FLOAT32_EXACT_INT:
+        return np.float64
+    return FEATURE_DTYPE
+
+def matrix_dtype(dtypes):
+    """Dtype of a dense matrix of columns with these dtypes (at least FEATURE_DTYPE)."""
+    return np.result_type(FEATURE_DTYPE, *dtypes)
+
 def clean_data(df):
     """
     Handles missing values and basic data cleaning.
@@ -77,6 +104,13 @@ def feature_engineering(df):
     logging.info("Feature engineering completed.")
     return df
 
+def as_levels(series):
+    """
+    String category labels of a column, with missing values as the level 'nan'
+    (pandas 3 keeps NaN missing under astype(str), and sorting it with strings fails).
+    """
+    return series.astype(str).fillna('nan')
+
 def encode_categorical(df, target_col=None):
     """
     Encodes categorical variables using Label Encoding (simple baseline).
@@ -88,11 +122,81 @@ def encode_categorical(df, target_col=None):
     for col in categorical_cols:
         if col != target_col:
             le = LabelEncoder()
-            df[col] = le.fit_transform(df[col].astype(str))
+            df[col] = le.fit_transform(as_levels(df[col])).astype(code_dtype(len(le.classes_)))
             le_dict[col] = le
             
     return df, le_dict
 
+class FeatureTransformer:
+    """
+    Persistable feature encoding: learns the feature columns, categorical levels
+    and numeric fill values once and applies the identical mapping to any later
+    data (the other model's subset, new months, batch scoring chunks).
+    Category codes match encode_categorical (sorted string levels); levels
+    unseen at fit time map to -1.
+    precision='float32' applies the precision policy (float32 numerics,
+    int8/int16 codes); 'float64' keeps float64 numerics and int64 codes.
+    """
+
+    def __init__(self, exclude=None, precision='float32'):
+        if precision not in ('float32', 'float64'):
+            raise ValueError("precision must be 'float32' or 'float64'")
+        self.exclude = list(exclude or [])
+        self.precision = precision
+        self.feature_cols = []
+        self.categorical_cols = []
+        self.levels = {}
+        self.fill_values = {}
+        self.dtypes = {}
+
+    def fit(self, df):
+        """
+        Learns feature columns, categorical levels and numeric medians from df.
+        """
+        logging.info("Fitting feature transformer...")
+        self.feature_cols = [c for c in df.columns if c not in self.exclude]
+        self.categorical_cols = [c for c in self.feature_cols
+                                 if not pd.api.types.is_numeric_dtype(df[c]) and not pd.api.types.is_bool_dtype(df[c])]
+        self.levels = {c: sorted(as_levels(df[c]).unique()) for c in self.categorical_cols}
+        self.fill_values = {c: float(pd.to_numeric(df[c], errors='coerce').median())
+                            for c in self.feature_cols if c not in self.levels}
+        if self.precision == 'float32':
+            self.dtypes = {c: code_dtype(len(self.levels[c])) if c in self.levels else numeric_dtype(df[c])
+                           for c in self.feature_cols}
+        else:
+            self.dtypes = {c: np.int64 if c in self.levels else np.float64 for c in self.feature_cols}
+        return self
+
+    def transform(self, df):
+        """
+        Encodes df with the fitted mapping. Returns the feature columns only.
+        """
+        missing = [c for c in self.feature_cols if c not in df.columns]
+        if missing:
+            raise KeyError(f"Columns missing for transform: {missing}")
+        out = {}
+        for col in self.feature_cols:
+            if col in self.levels:
+                codes = pd.Categorical(as_levels(df[col]), categories=self.levels[col]).codes
+                out[col] = codes.astype(self.dtypes[col])
+            else:
+                values = pd.to_numeric(df[col], errors='coerce').fillna(self.fill_values[col])
+                out[col] = values.astype(self.dtypes[col])
+        return pd.DataFrame(out, index=df.index)
+
+    def fit_transform(self, df):
+        return self.fit(df).transform(df)
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        joblib.dump(self, path)
+        logging.info(f"Feature transformer saved to {path}")
+        return path
+
+    @staticmethod
+    def load(path):
+        return joblib.load(path)
+
 def prepare_modeling_data(df):
     """
     Master pipeline to Clean -> Winsorize -> Feature Engineer -> Encode -> Split.
@@ -1,11 +1,15 @@
 import os
 import sys
+import argparse
 import pandas as pd
 import logging
 from src.data.data_loader import load_data
-from src.features.preprocessing import prepare_modeling_data, encode_categorical, split_data
-from src.models.modeling_severity import SeverityModeler
-from src.models.modeling_premium import PremiumModeler
+from src.features.preprocessing import prepare_modeling_data, FeatureTransformer, split_data
+from src.models.modeling_severity import SeverityModeler, regression_metrics
+from src.models.modeling_premium import PremiumModeler, classification_metrics
+from src.models.modeling_pure_premium import PurePremiumModeler
+from src.models.registry import ModelRegistry
+from src.models.training import compare_precision
 
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
@@ -14,10 +18,59 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 
 DATA_PATH = r"C:\Users\yoga\code\10_Academy\week_3\data\raw\MachineLearningRating_v3.txt"
 OUTPUT_DIR = "outputs"
+MODEL_DIR = "models"
+TRANSFORMER_PATH = os.path.join(MODEL_DIR, "feature_transformer.joblib")
+REGISTRY_DIR = os.path.join(MODEL_DIR, "registry")
+# Total CPU threads shared by concurrently trained candidate models
+CPU_BUDGET = os.cpu_count()
+# Fraction of zero-claim rows kept when training the claim-probability models (None = all)
+NEGATIVE_FRACTION = None
+# Run the successive-halving hyperparameter search before training
+TUNE_HYPERPARAMETERS = False
+# Report PolicyID-grouped K-fold mean/std metrics alongside the holdout split
+RUN_CROSS_VALIDATION = False
+# Also fit expected claim cost directly (Tweedie) and benchmark it against P(Claim) * E(Severity)
+RUN_PURE_PREMIUM = False
+# Also train one model per value of this column (e.g. 'Province', 'VehicleType'); None = global models only
+SEGMENT_COL = None
+# Refit the candidates on float64 copies of the features and report metric differences to float32
+VALIDATE_PRECISION = False
+# Empty the cross-validation fold and SHAP result caches first (both are capped
+# and evict least recently used entries, but old data versions linger until then)
+CLEAR_CACHES = False
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
-def main():
+def retrain(df_clean, force_full=False):
+    """
+    Retraining mode: brings the stored severity and claim boosters up to date
+    with the months ingested since their last run, continuing boosting where
+    drift is small and refitting otherwise (see src.models.incremental).
+    """
+    from src.models.incremental import retrain_from_frame
+
+    logging.info("--- 3. Incremental Retraining ---")
+    summary = retrain_from_frame(df_clean, force_full=force_full)
+    if summary.empty:
+        logging.info("Models are up to date.")
+        return summary
+    summary.to_csv(os.path.join(OUTPUT_DIR, 'retrain_summary.csv'), index=False)
+    print(summary[['Model', 'Decision', 'MaxPSI', 'PrevScore', 'NewScore', 'Accepted', 'Version']])
+    return summary
+
+def clear_caches():
+    """Deletes cached cross-validation folds and SHAP results."""
+    from src.models.cross_validation import clear_cv_cache
+    from src.evaluation.shap_cache import ShapCache
+
+    clear_cv_cache()
+    ShapCache().clear()
+    logging.info("Cleared cross-validation and SHAP caches.")
+
+def main(mode='full', force_full=False):
     try:
+        if CLEAR_CACHES:
+            clear_caches()
+        
         # 1. Load Data
         logging.info("--- 1. Data Loading ---")
         df = load_data(DATA_PATH)
@@ -25,37 +78,90 @@ def main():
         # 2. Preprocessing
         logging.info("--- 2. Preprocessing ---")
         df_clean = prepare_modeling_data(df)
+
+        if mode == 'retrain':
+            retrain(df_clean, force_full=force_full)
+            logging.info("Pipeline Completed Successfully.")
+            return
         
         # 3. Model 1: Claim Severity (Regression)
         logging.info("--- 3. Severity Model (Regression) ---")
         # Filter for claims > 0
         df_claims = df_clean[df_clean['TotalClaims'] > 0].copy()
         
-        # Encoder needs to be consistent, but for simplicity we re-fit here for regression task
-        # Ideally we persistence the encoder or use a pipeline
-        df_claims_encoded, _ = encode_categorical(df_claims, target_col='TotalClaims')
+        # One persisted encoder for both models, so batch scoring reproduces training features
+        transformer = FeatureTransformer(exclude=['TotalClaims', 'HasClaim']).fit(df_clean)
+        transformer.save(TRANSFORMER_PATH)
+        df_claims_encoded = transformer.transform(df_claims).assign(TotalClaims=df_claims['TotalClaims'])
         print("df_claims_encoded shape:", df_claims_encoded.shape)
         print(df_claims_encoded.head())
         X_train_s, X_test_s, y_train_s, y_test_s = split_data(df_claims_encoded, 'TotalClaims')
         
         severity_modeler = SeverityModeler(df_claims_encoded)
-        severity_modeler.train_evaluate(X_train_s, X_test_s, y_train_s, y_test_s)
-        best_severity_path = severity_modeler.save_best_model()
+        if TUNE_HYPERPARAMETERS:
+            severity_modeler.tune(X_train_s, y_train_s, n_jobs=CPU_BUDGET)
+        if RUN_CROSS_VALIDATION:
+            severity_modeler.cross_validate(df_claims_encoded, n_cpus=CPU_BUDGET)
+        if VALIDATE_PRECISION:
+            print(compare_precision(severity_modeler.models, regression_metrics,
+                                    X_train_s, X_test_s, y_train_s, y_test_s, n_cpus=CPU_BUDGET))
+        severity_modeler.train_evaluate(X_train_s, X_test_s, y_train_s, y_test_s, n_cpus=CPU_BUDGET)
+        severity_modeler.train_xgboost_hist(X_train_s, X_test_s, y_train_s, y_test_s,
+                                            categorical_cols=transformer.categorical_cols)
+        best_severity_path = severity_modeler.save_best_model(MODEL_DIR)
+        segment_labels = dict(enumerate(transformer.levels.get(SEGMENT_COL, [])))
+        if SEGMENT_COL:
+            severity_modeler.train_segmented(X_train_s, X_test_s, y_train_s, y_test_s, SEGMENT_COL,
+                                             labels=segment_labels, n_cpus=CPU_BUDGET, output_dir=MODEL_DIR)
+            print(severity_modeler.segment_results)
+        registry = ModelRegistry(REGISTRY_DIR)
+        severity_modeler.register_models(registry, preprocessor=transformer, data=df_claims_encoded)
 
         # 4. Model 2: Premium Optimization (Classification)
         logging.info("--- 4. Premium Model (Classification) ---")
         # Use full dataset
         df_clean['HasClaim'] = (df_clean['TotalClaims'] > 0).astype(int)
         
-        df_full_encoded, _ = encode_categorical(df_clean, target_col='HasClaim')
-        # Drop TotalClaims and other leakages
-        if 'TotalClaims' in df_full_encoded.columns:
-            df_full_encoded = df_full_encoded.drop(columns=['TotalClaims'])
-            
+        # TotalClaims (leakage) is excluded by the transformer
+        df_full_encoded = transformer.transform(df_clean).assign(HasClaim=df_clean['HasClaim'])
+
         X_train_p, X_test_p, y_train_p, y_test_p = split_data(df_full_encoded, 'HasClaim')
         
         premium_modeler = PremiumModeler(df_full_encoded)
-        premium_modeler.train_evaluate(X_train_p, X_test_p, y_train_p, y_test_p)
+        if TUNE_HYPERPARAMETERS:
+            premium_modeler.tune(X_train_p, y_train_p, n_jobs=CPU_BUDGET)
+        if RUN_CROSS_VALIDATION:
+            premium_modeler.cross_validate(df_full_encoded, n_cpus=CPU_BUDGET)
+        if VALIDATE_PRECISION:
+            print(compare_precision(premium_modeler.models, classification_metrics,
+                                    X_train_p, X_test_p, y_train_p, y_test_p, n_cpus=CPU_BUDGET))
+        premium_modeler.train_evaluate(X_train_p, X_test_p, y_train_p, y_test_p, n_cpus=CPU_BUDGET,
+                                       negative_fraction=NEGATIVE_FRACTION)
+        premium_modeler.train_xgboost_hist(X_train_p, X_test_p, y_train_p, y_test_p,
+                                           categorical_cols=transformer.categorical_cols)
+        best_claim_path = premium_modeler.save_best_model(MODEL_DIR)
+        if SEGMENT_COL:
+            premium_modeler.train_segmented(X_train_p, X_test_p, y_train_p, y_test_p, SEGMENT_COL,
+                                            labels=segment_labels, n_cpus=CPU_BUDGET, output_dir=MODEL_DIR)
+            print(premium_modeler.segment_results)
+        premium_modeler.register_models(registry, preprocessor=transformer, data=df_full_encoded)
+
+        if RUN_PURE_PREMIUM:
+            logging.info("--- 4b. Pure Premium Model (Tweedie) ---")
+            df_cost_encoded = df_full_encoded.drop(columns='HasClaim').assign(TotalClaims=df_clean['TotalClaims'])
+            # Same random_state and row count as the HasClaim split, so the test policies match
+            X_train_t, X_test_t, y_train_t, y_test_t = split_data(df_cost_encoded, 'TotalClaims')
+            pure_premium_modeler = PurePremiumModeler(df_cost_encoded, categorical_cols=transformer.categorical_cols)
+            pure_premium_modeler.train_evaluate(X_train_t, X_test_t, y_train_t, y_test_t, n_cpus=CPU_BUDGET)
+            two_model_fit_time = sum(res['WallTime'] for modeler in (severity_modeler, premium_modeler)
+                                     for res in modeler.results.values() if res['model'] is modeler.best_model)
+            benchmark = pure_premium_modeler.benchmark(X_test_t, y_test_t, premium_modeler.best_model,
+                                                       severity_modeler.best_model, two_model_fit_time)
+            benchmark.to_csv(os.path.join(OUTPUT_DIR, 'pure_premium_benchmark.csv'), index=False)
+            print(benchmark)
+            pure_premium_modeler.save_best_model(MODEL_DIR)
+            pure_premium_modeler.register_models(registry, preprocessor=transformer, data=df_cost_encoded)
+        print(registry.list()[['Name', 'Version', 'ModelClass', 'Promoted', 'RMSE', 'AUC']])
         
         # 5. Interpretation
         logging.info("--- 5. Interpretation (SHAP) ---")
@@ -65,7 +171,8 @@ def main():
         # Using the trained XGBoost model from the dictionary if available
         if 'XGBoost' in severity_modeler.results:
             model_to_interpret = severity_modeler.results['XGBoost']['model']
-            interpreter = ModelInterpreter(model_to_interpret, X_train_s, feature_names=X_train_s.columns)
+            interpreter = ModelInterpreter(model_to_interpret, X_train_s, feature_names=X_train_s.columns,
+                                           full=True, n_workers=CPU_BUDGET, y=y_train_s)
             interpreter.plot_top_features(output_path=os.path.join(OUTPUT_DIR, 'shap_severity.png'))
             top_features = interpreter.get_top_features_df()
             print("\nTop 10 Features for Severity Model:")
@@ -79,4 +186,10 @@ def main():
         raise e
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="ACIS severity and claim-probability modeling pipeline")
+    parser.add_argument('--mode', choices=['full', 'retrain'], default='full',
+                        help="full: train every candidate from scratch; retrain: update the stored boosters with new months")
+    parser.add_argument('--force-full', action='store_true',
+                        help="in retrain mode, refit from scratch regardless of drift")
+    args = parser.parse_args()
+    main(mode=args.mode, force_full=args.force_full)
@@ -0,0 +1,130 @@
+import os
+import sys
+import time
+import argparse
+import logging
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+from threadpoolctl import threadpool_limits
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+from src.features.preprocessing import FeatureTransformer
+from src.models.external_memory import list_partitions, ID_COLUMNS
+from src.models.tree_export import load_model
+from src.models.registry import registered_scoring_paths
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Per-worker state, loaded once by _init_worker
+_SCORER = {}
+
+
+def risk_premium_frame(transformer, frequency_model, severity_model, frame, base_premium=0.0):
+    """
+    Scores one chunk: P(Claim), E(Severity | claim), the risk premium
+    P(Claim) * E(Severity) and the quoted premium (risk premium + base_premium),
+    keyed by whichever ID columns the chunk carries.
+    """
+    X = transformer.transform(frame)
+    prob_claim = frequency_model.predict_proba(X)[:, 1]
+    exp_severity = severity_model.predict(X)
+    out = frame[[c for c in ID_COLUMNS if c in frame.columns]].reset_index(drop=True)
+    out['PClaim'] = prob_claim
+    out['ExpectedSeverity'] = exp_severity
+    out['RiskPremium'] = prob_claim * exp_severity
+    out['Premium'] = out['RiskPremium'] + base_premium
+    return out
+
+
+def _init_worker(transformer_path, frequency_path, severity_path, base_premium):
+    # One thread per worker: parallelism comes from the process pool
+    _SCORER['limits'] = threadpool_limits(limits=1)
+    _SCORER['transformer'] = FeatureTransformer.load(transformer_path)
+    _SCORER['base_premium'] = base_premium
+    for key, path in (('frequency', frequency_path), ('severity', severity_path)):
+        model = load_model(path)
+        if hasattr(model, 'get_params') and 'n_jobs' in model.get_params():
+            model.set_params(n_jobs=1)
+        _SCORER[key] = model
+
+
+def _score_partition(path, part_index, output_dir, chunk_rows):
+    """Streams one Parquet partition in chunk_rows batches; writes one output file per batch."""
+    transformer = _SCORER['transformer']
+    columns = list(dict.fromkeys(transformer.feature_cols +
+                                 [c for c in ID_COLUMNS if c in pq.read_schema(path).names]))
+    n_rows = 0
+    for batch_index, batch in enumerate(pq.ParquetFile(path).iter_batches(batch_size=chunk_rows, columns=columns)):
+        scored = risk_premium_frame(transformer, _SCORER['frequency'], _SCORER['severity'],
+                                    batch.to_pandas(), _SCORER['base_premium'])
+        scored.to_parquet(os.path.join(output_dir, f'part-{part_index:05d}-{batch_index:05d}.parquet'),
+                          index=False, compression='snappy')
+        n_rows += len(scored)
+    return n_rows
+
+
+def score_book(book_path, transformer_path, frequency_path, severity_path, output_dir,
+               base_premium=0.0, n_workers=None, chunk_rows=100_000):
+    """
+    Rescores a Parquet book (a file or a directory of part files) with the
+    persisted feature transformer and claim-frequency / severity models.
+
+    Partitions are distributed over n_workers processes (default: all
+    cores); each worker loads the transformer and both models once, keeps
+    its BLAS/OpenMP pools at one thread, and streams its partition in
+    chunk_rows batches, so memory stays bounded regardless of book size.
+    Output is one Parquet file per input batch in output_dir.
+    Returns a summary dict with Rows, Partitions, Seconds and RowsPerSec.
+    """
+    files = list_partitions(book_path)
+    n_workers = min(n_workers or os.cpu_count() or 1, len(files))
+    os.makedirs(output_dir, exist_ok=True)
+    for old in os.listdir(output_dir):
+        if old.startswith('part-') and old.endswith('.parquet'):
+            os.remove(os.path.join(output_dir, old))
+
+    start = time.perf_counter()
+    init_args = (transformer_path, frequency_path, severity_path, base_premium)
+    if n_workers == 1:
+        _init_worker(*init_args)
+        n_rows = sum(_score_partition(f, i, output_dir, chunk_rows) for i, f in enumerate(files))
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker, initargs=init_args) as pool:
+            n_rows = sum(pool.map(_score_partition, files, range(len(files)),
+                                  [output_dir] * len(files), [chunk_rows] * len(files)))
+    elapsed = time.perf_counter() - start
+
+    summary = {'Rows': n_rows, 'Partitions': len(files), 'Workers': n_workers,
+               'Seconds': elapsed, 'RowsPerSec': n_rows / elapsed if elapsed > 0 else np.nan}
+    logging.info(f"Scored {n_rows:,} rows from {len(files)} partitions with {n_workers} workers in "
+                 f"{elapsed:.2f}s ({summary['RowsPerSec']:,.0f} rows/s) -> {output_dir}")
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch risk-premium scoring over Parquet partitions.")
+    parser.add_argument('book', help="Parquet file or directory of part files to score")
+    parser.add_argument('--registry', default=None,
+                        help="model registry directory: score with the promoted claim/severity versions")
+    parser.add_argument('--transformer', default=os.path.join('models', 'feature_transformer.joblib'))
+    parser.add_argument('--frequency-model', help="joblib claim-probability model or exported tree directory")
+    parser.add_argument('--severity-model', help="joblib claim-severity model or exported tree directory")
+    parser.add_argument('--base-premium', type=float, default=0.0,
+                        help="loading added to every risk premium")
+    parser.add_argument('--output', default=os.path.join('outputs', 'scores'))
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--chunk-rows', type=int, default=100_000)
+    args = parser.parse_args()
+    if args.registry:
+        args.transformer, args.frequency_model, args.severity_model = registered_scoring_paths(args.registry)
+    elif not (args.frequency_model and args.severity_model):
+        parser.error("--frequency-model and --severity-model are required without --registry")
+
+    score_book(args.book, args.transformer, args.frequency_model, args.severity_model, args.output,
+               base_premium=args.base_premium, n_workers=args.workers, chunk_rows=args.chunk_rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import logging
+import multiprocessing as mp
+import numpy as np
+import pandas as pd
+from sklearn.base import clone
+from sklearn.model_selection import GroupKFold, StratifiedGroupKFold
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+from src.models.training import split_thread_budget, _fit_and_score
+from src.models.xgb_training import frame_fingerprint, prune_cache, touch_cache_entry
+from src.features.preprocessing import matrix_dtype
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+CV_CACHE_DIR = os.path.join(tempfile.gettempdir(), 'acis_cv_cache')
+# Folds of older data versions are evicted, least recently used first, beyond this size
+CV_CACHE_MAX_BYTES = 10 * 2**30
+
+
+def clear_cv_cache(cache_dir=None):
+    """Deletes every cached fold set."""
+    shutil.rmtree(cache_dir or CV_CACHE_DIR, ignore_errors=True)
+
+
+def materialize_folds(df, target_col, group_col='PolicyID', n_splits=5, stratify=False,
+                      cache_dir=None):
+    """
+    Splits df into n_splits group-aware folds (no group_col value appears in
+    both train and test of a fold) and writes each fold's X_train / X_test /
+    y_train / y_test as .npy files (features in matrix_dtype, float32 for
+    transformer output; targets float64). group_col only defines the folds
+    and is excluded from the features.
+
+    Folds are cached under a content fingerprint of the data, so re-running
+    cross-validation after a model change reuses the matrices instead of
+    re-encoding and re-splitting. The cache keeps at most CV_CACHE_MAX_BYTES,
+    dropping the least recently used fold sets (clear_cv_cache empties it).
+    Returns the fold directory.
+    """
+    X = df.drop(columns=[target_col, group_col])
+    y = df[target_col]
+    groups = df[group_col].to_numpy()
+    key = frame_fingerprint(X, y, df[group_col]) + f'-{group_col}-{n_splits}-{int(stratify)}'
+    fold_dir = os.path.join(cache_dir or CV_CACHE_DIR, key)
+    manifest_path = os.path.join(fold_dir, 'manifest.json')
+    if os.path.exists(manifest_path):
+        logging.info(f"Reusing cached folds in {fold_dir}")
+        touch_cache_entry(fold_dir)
+        return fold_dir
+
+    start = time.perf_counter()
+    os.makedirs(fold_dir, exist_ok=True)
+    X_arr = np.ascontiguousarray(X.to_numpy(dtype=matrix_dtype(X.dtypes)))
+    y_arr = y.to_numpy(dtype=np.float64)
+    splitter = StratifiedGroupKFold(n_splits) if stratify else GroupKFold(n_splits)
+    for k, (train_idx, test_idx) in enumerate(splitter.split(X_arr, y_arr, groups)):
+        for name, arr in (('X_train', X_arr[train_idx]), ('X_test', X_arr[test_idx]),
+                          ('y_train', y_arr[train_idx]), ('y_test', y_arr[test_idx])):
+            np.save(os.path.join(fold_dir, f'fold{k}_{name}.npy'), arr)
+    with open(manifest_path, 'w') as f:
+        json.dump({'n_splits': n_splits, 'columns': list(X.columns), 'target': target_col,
+                   'group_col': group_col, 'n_rows': len(df)}, f)
+    logging.info(f"Materialized {n_splits} folds of {len(df):,} rows in {time.perf_counter() - start:.2f}s")
+    prune_cache(cache_dir or CV_CACHE_DIR, CV_CACHE_MAX_BYTES, keep=[fold_dir])
+    return fold_dir
+
+
+def _load_fold(fold_dir, k, integer_target):
+    arrays = [np.load(os.path.join(fold_dir, f'fold{k}_{name}.npy'), mmap_mode='r')
+              for name in ('X_train', 'X_test', 'y_train', 'y_test')]
+    if integer_target:
+        arrays[2], arrays[3] = arrays[2].astype(int), arrays[3].astype(int)
+    return arrays
+
+
+def _fold_task(name, model, k, n_threads, metric_fn, fold_dir, integer_target):
+    X_train, X_test, y_train, y_test = _load_fold(fold_dir, k, integer_target)
+    _, metrics = _fit_and_score(name, model, n_threads, metric_fn, X_train, X_test, y_train, y_test, None)
+    metrics.pop('model')
+    return name, k, metrics
+
+
+def summarize_folds(per_fold):
+    """Mean and standard deviation of every metric across folds, one row per model."""
+    metrics = [c for c in per_fold.columns if c not in ('Model', 'Fold')]
+    summary = per_fold.groupby('Model', sort=False)[metrics].agg(['mean', 'std'])
+    summary.columns = [f'{metric}_{stat}' for metric, stat in summary.columns]
+    return summary.reset_index()
+
+
+def cross_validate_models(models, df, target_col, metric_fn, group_col='PolicyID', n_splits=5,
+                          stratify=False, n_cpus=None, parallel=True, cache_dir=None):
+    """
+    K-fold cross-validation of every model in models ({name: estimator})
+    with folds grouped by group_col.
+
+    Fold matrices are materialized once (see materialize_folds) and
+    memory-mapped by the worker processes; every (model, fold) pair is one
+    task, run concurrently under a budget of n_cpus threads split with
+    split_thread_budget. metric_fn(model, X_test, y_test) -> dict is the
+    modeler's own metric function.
+    Returns (summary with <metric>_mean / <metric>_std per model, per-fold results).
+    """
+    n_cpus = n_cpus or os.cpu_count() or 1
+    fold_dir = materialize_folds(df, target_col, group_col, n_splits, stratify, cache_dir)
+    integer_target = pd.api.types.is_integer_dtype(df[target_col]) or pd.api.types.is_bool_dtype(df[target_col])
+
+    tasks = {f'{name}/fold{k}': (name, k) for name in models for k in range(n_splits)}
+    budget, concurrency = split_thread_budget(
+        {task: models[name] for task, (name, _) in tasks.items()}, n_cpus)
+
+    start = time.perf_counter()
+    rows = []
+    if not parallel or concurrency == 1:
+        for task, (name, k) in tasks.items():
+            rows.append(_fold_task(name, clone(models[name]), k, n_cpus, metric_fn, fold_dir, integer_target))
+    else:
+        ctx = mp.get_context('spawn')
+        with ctx.Pool(processes=concurrency, maxtasksperchild=1) as pool:
+            pending = [pool.apply_async(_fold_task, (name, clone(models[name]), k, budget[task],
+                                                     metric_fn, fold_dir, integer_target))
+                       for task, (name, k) in sorted(tasks.items(), key=lambda t: -budget[t[0]])]
+            rows = [job.get() for job in pending]
+
+    per_fold = pd.DataFrame([{'Model': name, 'Fold': k, **metrics} for name, k, metrics in rows])
+    per_fold['Model'] = pd.Categorical(per_fold['Model'], categories=list(models))
+    per_fold = per_fold.sort_values(['Model', 'Fold']).reset_index(drop=True)
+    per_fold['Model'] = per_fold['Model'].astype(str)
+    logging.info(f"Cross-validated {len(models)} models x {n_splits} folds in "
+                 f"{time.perf_counter() - start:.1f}s ({concurrency} concurrent tasks)")
+    return summarize_folds(per_fold), per_fold
@@ -0,0 +1,183 @@
+import os
+import glob
+import time
+import shutil
+import tempfile
+import logging
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import xgboost as xgb
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Columns of the processed data that are derived from the claims outcome
+# and must not be used as features for the claim-probability model.
+LEAKAGE_COLUMNS = [
+    'TotalClaims', 'TotalClaims_capped', 'ClaimFrequency', 'ClaimSeverity',
+    'LossRatio', 'has_outlier', 'RiskSegment', 'HasClaim',
+]
+
+# Identifiers and free-text columns that carry no generalisable signal.
+ID_COLUMNS = ['UnderwrittenCoverID', 'PolicyID']
+
+
+def list_partitions(path):
+    """Parquet files of a split: a single file, or every part file in a directory."""
+    if os.path.isdir(path):
+        return sorted(glob.glob(os.path.join(path, '*.parquet')))
+    return [path]
+
+
+def infer_feature_columns(files, exclude=None):
+    """Numeric, boolean and categorical/string columns of the schema, minus leakage and IDs."""
+    exclude = set(LEAKAGE_COLUMNS + ID_COLUMNS + list(exclude or []))
+    schema = pq.read_schema(files[0])
+    features = []
+    for field in schema:
+        t = field.type
+        if field.name in exclude or field.name.startswith('__index'):
+            continue
+        if (pa.types.is_integer(t) or pa.types.is_floating(t) or pa.types.is_boolean(t)
+                or pa.types.is_dictionary(t) or pa.types.is_string(t) or pa.types.is_large_string(t)):
+            features.append(field.name)
+    return features
+
+
+def scan_categories(files, feature_cols):
+    """
+    Category levels of every non-numeric feature across all partitions,
+    reading one column at a time so codes are consistent between batches.
+    """
+    schema = pq.read_schema(files[0])
+    cat_cols = [c for c in feature_cols
+                if not (pa.types.is_integer(schema.field(c).type)
+                        or pa.types.is_floating(schema.field(c).type)
+                        or pa.types.is_boolean(schema.field(c).type))]
+    levels = {c: set() for c in cat_cols}
+    for f in files:
+        for col in cat_cols:
+            values = pq.read_table(f, columns=[col]).column(col).to_pandas()
+            levels[col].update(values.dropna().astype(str).unique())
+    return {c: sorted(v) for c, v in levels.items()}
+
+
+def _label_from_batch(frame, label_col):
+    if label_col in frame.columns:
+        return frame[label_col].astype(int).to_numpy()
+    return (frame['TotalClaims'] > 0).astype(int).to_numpy()
+
+
+def iter_feature_batches(files, feature_cols, categories, label_col='ClaimFrequency', batch_rows=100_000):
+    """Yields (X, y) pandas batches with categories mapped to the fixed levels."""
+    read_cols = list(dict.fromkeys(feature_cols + [label_col]))
+    for f in files:
+        pf = pq.ParquetFile(f)
+        available = [c for c in read_cols if c in pf.schema_arrow.names]
+        if label_col not in available:
+            available.append('TotalClaims')
+        for batch in pf.iter_batches(batch_size=batch_rows, columns=available):
+            frame = batch.to_pandas()
+            X = frame[feature_cols].copy()
+            for col, levels in categories.items():
+                X[col] = pd.Categorical(X[col].astype(str).where(X[col].notna()), categories=levels)
+            for col in X.columns:
+                if X[col].dtype == bool:
+                    X[col] = X[col].astype(np.int8)
+            yield X, _label_from_batch(frame, label_col)
+
+
+class ParquetBatchIter(xgb.DataIter):
+    """XGBoost data iterator streaming feature batches from Parquet partitions."""
+
+    def __init__(self, files, feature_cols, categories, label_col='ClaimFrequency',
+                 batch_rows=100_000, cache_prefix=None):
+        self.files = files
+        self.feature_cols = feature_cols
+        self.categories = categories
+        self.label_col = label_col
+        self.batch_rows = batch_rows
+        self._batches = None
+        super().__init__(cache_prefix=cache_prefix)
+
+    def reset(self):
+        self._batches = None
+
+    def next(self, input_data):
+        if self._batches is None:
+            self._batches = iter_feature_batches(self.files, self.feature_cols, self.categories,
+                                                 self.label_col, self.batch_rows)
+        try:
+            X, y = next(self._batches)
+        except StopIteration:
+            return False
+        input_data(data=X, label=y)
+        return True
+
+
+def external_memory_matrix(iterator, max_bin=256, ref=None):
+    """
+    Builds an external-memory quantile matrix from a data iterator. Uses
+    ExtMemQuantileDMatrix where available (XGBoost >= 3.0), otherwise the
+    cache-backed external-memory DMatrix.
+    """
+    if hasattr(xgb, 'ExtMemQuantileDMatrix'):
+        return xgb.ExtMemQuantileDMatrix(iterator, max_bin=max_bin, ref=ref, enable_categorical=True)
+    return xgb.DMatrix(iterator, enable_categorical=True)
+
+
+def train_external_memory(data_dir, params, feature_cols=None, label_col='ClaimFrequency',
+                          num_boost_round=1000, early_stopping_rounds=50, batch_rows=100_000,
+                          cache_dir=None):
+    """
+    Trains a booster over the train/ and val/ Parquet partitions of data_dir
+    without loading either split into memory. The page cache goes to
+    cache_dir if given (and is left there), else to a temporary directory
+    removed once training ends.
+    Returns (booster, feature_cols, categories).
+    """
+    train_files = list_partitions(os.path.join(data_dir, 'train'))
+    if not train_files or not os.path.exists(train_files[0]):
+        train_files = list_partitions(os.path.join(data_dir, 'train.parquet'))
+    val_files = list_partitions(os.path.join(data_dir, 'val'))
+    if not val_files or not os.path.exists(val_files[0]):
+        val_files = list_partitions(os.path.join(data_dir, 'val.parquet'))
+
+    feature_cols = feature_cols or infer_feature_columns(train_files)
+    categories = scan_categories(train_files, feature_cols)
+    # Page caches are as large as the data; only a caller-supplied cache_dir outlives training
+    owned = cache_dir is None
+    if owned:
+        cache_dir = tempfile.mkdtemp(prefix='acis_xgb_cache_')
+    max_bin = params.get('max_bin', 256)
+
+    try:
+        start = time.perf_counter()
+        dtrain = external_memory_matrix(
+            ParquetBatchIter(train_files, feature_cols, categories, label_col, batch_rows,
+                             cache_prefix=os.path.join(cache_dir, 'train')), max_bin=max_bin)
+        dvalid = external_memory_matrix(
+            ParquetBatchIter(val_files, feature_cols, categories, label_col, batch_rows,
+                             cache_prefix=os.path.join(cache_dir, 'val')), max_bin=max_bin, ref=dtrain)
+        logging.info(f"Built external-memory matrices over {len(train_files)} train / {len(val_files)} val "
+                     f"partitions in {time.perf_counter() - start:.2f}s")
+
+        booster = xgb.train(params, dtrain, num_boost_round=num_boost_round,
+                            evals=[(dvalid, 'valid')], early_stopping_rounds=early_stopping_rounds,
+                            verbose_eval=False)
+        del dtrain, dvalid
+    finally:
+        if owned:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+    return booster, feature_cols, categories
+
+
+def predict_partitions(model, files, feature_cols, categories, label_col='ClaimFrequency',
+                       batch_rows=100_000):
+    """Streams predict_proba over Parquet partitions. Returns (y_true, y_prob)."""
+    y_true, y_prob = [], []
+    for X, y in iter_feature_batches(files, feature_cols, categories, label_col, batch_rows):
+        y_true.append(y)
+        y_prob.append(model.predict_proba(X)[:, 1])
+    return np.concatenate(y_true), np.concatenate(y_prob)
@@ -0,0 +1,302 @@
+import os
+import sys
+import json
+import time
+import logging
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+from sklearn.metrics import roc_auc_score, mean_squared_error
+from sklearn.model_selection import train_test_split
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+from src.models.xgb_training import HIST_PARAMS, as_native_categorical
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+MODEL_STORE = os.path.join('models', 'store')
+
+# Boosters maintained by the retraining mode: objective, validation metric,
+# target and the rows each one is trained on.
+RETRAIN_TARGETS = {
+    'severity': {'objective': 'reg:squarederror', 'eval_metric': 'rmse',
+                 'target': 'TotalClaims', 'claims_only': True},
+    'claim': {'objective': 'binary:logistic', 'eval_metric': 'auc',
+              'target': 'HasClaim', 'claims_only': False},
+}
+
+# Outcome-derived and time columns that are never features
+EXCLUDED_COLUMNS = ['TotalClaims', 'HasClaim', 'TransactionMonth', 'PolicyID', 'UnderwrittenCoverID']
+
+# PSI above this on any feature means the new months look different enough to refit
+PSI_THRESHOLD = 0.25
+# Relative validation-metric loss of the stored model that forces a full refit
+MAX_DEGRADATION = 0.05
+
+
+def month_of(df, month_col='TransactionMonth'):
+    """Calendar month (as 'YYYY-MM' strings, which sort chronologically) of every row."""
+    return pd.to_datetime(df[month_col], errors='coerce').dt.strftime('%Y-%m')
+
+
+def feature_reference(X, n_bins=10):
+    """
+    Reference distribution of every feature for PSI drift checks: decile
+    edges and bin shares for numeric columns, level shares for categoricals.
+    """
+    reference = {}
+    for col in X.columns:
+        values = X[col]
+        # Anything non-numeric (object, pandas 3 str, category) is compared level by level
+        if isinstance(values.dtype, pd.CategoricalDtype) or not pd.api.types.is_numeric_dtype(values):
+            shares = values.astype(str).value_counts(normalize=True)
+            reference[col] = {'type': 'categorical', 'levels': shares.index.tolist(),
+                              'shares': shares.tolist()}
+        else:
+            values = pd.to_numeric(values, errors='coerce').dropna().to_numpy(dtype=float)
+            edges = np.unique(np.quantile(values, np.linspace(0, 1, n_bins + 1))) if len(values) else np.array([])
+            counts = np.bincount(np.searchsorted(edges[1:-1], values, side='right'), minlength=max(len(edges) - 1, 1))
+            reference[col] = {'type': 'numeric', 'edges': edges.tolist(),
+                              'shares': (counts / max(len(values), 1)).tolist()}
+    return reference
+
+
+def population_stability_index(expected, actual, eps=1e-4):
+    """PSI = sum((a - e) * ln(a / e)) over bins, with empty bins floored at eps."""
+    expected = np.clip(np.asarray(expected, dtype=float), eps, None)
+    actual = np.clip(np.asarray(actual, dtype=float), eps, None)
+    return float(np.sum((actual - expected) * np.log(actual / expected)))
+
+
+def feature_drift(reference, X):
+    """PSI of every referenced feature between the reference and X, largest first."""
+    psi = {}
+    for col, ref in reference.items():
+        if col not in X.columns:
+            continue
+        if ref['type'] == 'categorical':
+            shares = X[col].astype(str).value_counts(normalize=True)
+            # Levels unseen in the reference are pooled into one extra bin
+            actual = [shares.get(level, 0.0) for level in ref['levels']]
+            actual.append(shares.drop(ref['levels'], errors='ignore').sum())
+            expected = ref['shares'] + [0.0]
+        else:
+            values = pd.to_numeric(X[col], errors='coerce').dropna().to_numpy(dtype=float)
+            edges = np.asarray(ref['edges'])
+            n_bins = max(len(edges) - 1, 1)
+            counts = np.bincount(np.searchsorted(edges[1:-1], values, side='right'), minlength=n_bins)
+            actual, expected = counts / max(len(values), 1), ref['shares']
+        psi[col] = population_stability_index(expected, actual)
+    return pd.Series(psi, dtype=float).sort_values(ascending=False)
+
+
+class ModelStore:
+    """
+    Versioned booster store on disk: <root>/<name>/v<k>/model.json plus
+    meta.json (features, categories, parameters, validation score, PSI
+    reference, last month trained on and lineage).
+    """
+
+    def __init__(self, root=MODEL_STORE):
+        self.root = root
+
+    def versions(self, name):
+        path = os.path.join(self.root, name)
+        if not os.path.isdir(path):
+            return []
+        return sorted(int(d[1:]) for d in os.listdir(path) if d.startswith('v') and d[1:].isdigit())
+
+    def save(self, name, booster, meta):
+        version = (self.versions(name) or [0])[-1] + 1
+        path = os.path.join(self.root, name, f'v{version}')
+        os.makedirs(path, exist_ok=True)
+        booster.save_model(os.path.join(path, 'model.json'))
+        with open(os.path.join(path, 'meta.json'), 'w') as f:
+            json.dump({**meta, 'version': version}, f, indent=2, default=str)
+        logging.info(f"Saved {name} v{version} to {path}")
+        return version
+
+    def load(self, name, version=None):
+        """(booster, meta) of the given (default: latest) version, or (None, None)."""
+        versions = self.versions(name)
+        if not versions:
+            return None, None
+        path = os.path.join(self.root, name, f'v{version or versions[-1]}')
+        booster = xgb.Booster()
+        booster.load_model(os.path.join(path, 'model.json'))
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        return booster, meta
+
+
+def _score(eval_metric, y, pred):
+    if eval_metric == 'auc':
+        return roc_auc_score(y, pred)
+    return float(np.sqrt(mean_squared_error(y, pred)))
+
+
+class IncrementalTrainer:
+    """
+    Keeps one booster in a ModelStore up to date as new months arrive.
+
+    Each update scores the stored version on fresh validation data and
+    measures feature drift (PSI against the reference saved at the last full
+    refit). Without material drift or degradation the stored booster is
+    extended with xgb.train(..., xgb_model=previous) on the new months only;
+    otherwise the model is refit from scratch on all history. A candidate is
+    only saved if it validates at least as well as the stored version.
+    """
+
+    def __init__(self, store, name, objective, eval_metric, params=None, psi_threshold=PSI_THRESHOLD,
+                 max_degradation=MAX_DEGRADATION, num_boost_round=1000, incremental_rounds=200,
+                 early_stopping_rounds=50):
+        self.store = store
+        self.name = name
+        self.params = {**HIST_PARAMS, 'objective': objective, 'eval_metric': eval_metric, **(params or {})}
+        self.eval_metric = eval_metric
+        self.maximize = eval_metric in ('auc', 'aucpr')
+        self.psi_threshold = psi_threshold
+        self.max_degradation = max_degradation
+        self.num_boost_round = num_boost_round
+        self.incremental_rounds = incremental_rounds
+        self.early_stopping_rounds = early_stopping_rounds
+
+    def _matrix(self, X, y, categories):
+        X, _ = as_native_categorical(X, categories=categories)
+        return xgb.DMatrix(X, label=y, enable_categorical=True)
+
+    def _degradation(self, stored, current):
+        """Relative loss of the validation metric (positive = worse)."""
+        if not stored:
+            return 0.0
+        return (stored - current) / abs(stored) if self.maximize else (current - stored) / abs(stored)
+
+    def _train(self, dtrain, dvalid, num_boost_round, xgb_model=None):
+        return xgb.train(self.params, dtrain, num_boost_round=num_boost_round, evals=[(dvalid, 'valid')],
+                         early_stopping_rounds=self.early_stopping_rounds, verbose_eval=False,
+                         xgb_model=xgb_model)
+
+    def _best_rounds(self, booster):
+        try:
+            return booster.best_iteration + 1
+        except AttributeError:
+            return booster.num_boosted_rounds()
+
+    def update(self, X_new, y_new, X_val, y_val, last_month, X_history=None, y_history=None,
+               force_full=False):
+        """
+        Brings the stored model up to date with the new months (X_new, y_new),
+        validated on (X_val, y_val). X_history / y_history (all earlier months)
+        are only used if a full refit is needed.
+        Returns a summary dict: Decision, MaxPSI, DriftedFeatures, PrevScore,
+        NewScore, Accepted, Version.
+        """
+        start = time.perf_counter()
+        previous, meta = self.store.load(self.name)
+        summary = {'Model': self.name, 'PrevVersion': meta['version'] if meta else None,
+                   'PrevScore': np.nan, 'MaxPSI': np.nan, 'DriftedFeatures': []}
+
+        reasons = []
+        if previous is None:
+            reasons.append('no stored model')
+        elif list(X_new.columns) != meta['features']:
+            reasons.append('feature set changed')
+        else:
+            previous = previous[:meta['best_rounds']]
+            summary['PrevScore'] = _score(self.eval_metric, y_val,
+                                          previous.predict(self._matrix(X_val, y_val, meta['categories'])))
+            drift = feature_drift(meta['reference'], X_new)
+            summary['MaxPSI'] = float(drift.max()) if len(drift) else 0.0
+            summary['DriftedFeatures'] = drift[drift > self.psi_threshold].index.tolist()
+            degradation = self._degradation(meta['val_score'], summary['PrevScore'])
+            if summary['DriftedFeatures']:
+                reasons.append(f"PSI {summary['MaxPSI']:.3f} > {self.psi_threshold} on {summary['DriftedFeatures']}")
+            if degradation > self.max_degradation:
+                reasons.append(f"validation {self.eval_metric} degraded {degradation:.1%}")
+        if force_full:
+            reasons.append('forced')
+
+        if reasons:
+            summary['Decision'] = 'full'
+            logging.info(f"{self.name}: full refit ({'; '.join(reasons)})")
+            if X_history is not None and len(X_history):
+                X_train = pd.concat([X_history, X_new])
+                y_train = pd.concat([pd.Series(y_history), pd.Series(y_new)])
+            else:
+                X_train, y_train = X_new, y_new
+            X_native, categories = as_native_categorical(X_train)
+            dtrain = xgb.DMatrix(X_native, label=y_train, enable_categorical=True)
+            booster = self._train(dtrain, self._matrix(X_val, y_val, categories), self.num_boost_round)
+            reference = feature_reference(X_train)
+            parent = None
+        else:
+            summary['Decision'] = 'incremental'
+            logging.info(f"{self.name}: continuing v{meta['version']} on {len(X_new):,} new rows "
+                         f"(max PSI {summary['MaxPSI']:.3f})")
+            categories = meta['categories']
+            booster = self._train(self._matrix(X_new, y_new, categories), self._matrix(X_val, y_val, categories),
+                                  self.incremental_rounds, xgb_model=previous)
+            reference, parent = meta['reference'], meta['version']
+
+        best_rounds = self._best_rounds(booster)
+        features = list(X_new.columns)
+        summary['NewScore'] = _score(self.eval_metric, y_val,
+                                     booster[:best_rounds].predict(self._matrix(X_val, y_val, categories)))
+        prev_score = summary['PrevScore']
+        summary['Accepted'] = bool(np.isnan(prev_score) or
+                                   (summary['NewScore'] >= prev_score if self.maximize
+                                    else summary['NewScore'] <= prev_score))
+        summary['Version'] = meta['version'] if meta else None
+        if summary['Accepted']:
+            summary['Version'] = self.store.save(self.name, booster[:best_rounds], {
+                'features': features, 'categories': categories, 'params': self.params,
+                'eval_metric': self.eval_metric, 'val_score': summary['NewScore'],
+                'best_rounds': best_rounds, 'reference': reference, 'last_month': last_month,
+                'mode': summary['Decision'], 'parent': parent, 'trained_at': datetime.now().isoformat(),
+                'n_rows': int(len(X_new)),
+            })
+        else:
+            logging.warning(f"{self.name}: candidate {self.eval_metric}={summary['NewScore']:.4f} worse than "
+                            f"stored {prev_score:.4f}; keeping v{summary['Version']}")
+        summary['WallTime'] = time.perf_counter() - start
+        logging.info(f"{self.name}: {summary['Decision']} update, {self.eval_metric} "
+                     f"{prev_score:.4f} -> {summary['NewScore']:.4f} in {summary['WallTime']:.1f}s")
+        return summary
+
+
+def retrain_from_frame(df, store=None, targets=None, month_col='TransactionMonth', val_size=0.2,
+                       force_full=False, **trainer_kwargs):
+    """
+    Retraining mode over a cleaned policy frame (prepare_modeling_data
+    output): for every RETRAIN_TARGETS entry, rows from months after the
+    stored model's last_month are the new data (a val_size share of them is
+    held out for validation) and earlier rows are the history.
+    Returns one summary row per model.
+    """
+    store = store or ModelStore()
+    df = df.copy()
+    df['HasClaim'] = (df['TotalClaims'] > 0).astype(int)
+    months = month_of(df, month_col)
+
+    rows = []
+    for name in targets or list(RETRAIN_TARGETS):
+        spec = RETRAIN_TARGETS[name]
+        _, meta = store.load(name)
+        last_month = meta['last_month'] if meta and not force_full else None
+        mask = df['TotalClaims'] > 0 if spec['claims_only'] else pd.Series(True, index=df.index)
+        is_new = mask & (months > last_month) if last_month else mask
+        if not is_new.any():
+            logging.info(f"{name}: no months after {last_month}, nothing to retrain")
+            continue
+
+        features = [c for c in df.columns if c not in EXCLUDED_COLUMNS]
+        new = df[is_new]
+        train_new, val = train_test_split(new, test_size=val_size, random_state=42)
+        history = df[mask & ~is_new]
+        trainer = IncrementalTrainer(store, name, spec['objective'], spec['eval_metric'], **trainer_kwargs)
+        rows.append(trainer.update(
+            train_new[features], train_new[spec['target']], val[features], val[spec['target']],
+            last_month=months[is_new].max(), X_history=history[features],
+            y_history=history[spec['target']], force_full=force_full))
+    return pd.DataFrame(rows)
@@ -4,55 +4,319 @@ from sklearn.linear_model import LogisticRegression
 from sklearn.ensemble import RandomForestClassifier
 from xgboost import XGBClassifier
 from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score, roc_auc_score
+from sklearn.base import clone
 import joblib
 import os
+import sys
+import time
 import logging
 
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+from src.models.training import TrainingScheduler
+from src.models.tuning import tune_models
+from src.models.cross_validation import cross_validate_models
+from src.models.registry import jsonable_metrics
+from src.models.segmented import train_segments, MIN_SEGMENT_ROWS
+from src.models.xgb_training import DMatrixCache, fit_hist_candidates, frame_fingerprint, BoosterModel, HIST_PARAMS
+from src.models.external_memory import train_external_memory, predict_partitions, list_partitions
+
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+def classification_metrics(model, X_test, y_test):
+    """
+    Accuracy, precision, recall, F1 and AUC of a fitted classifier on the test set.
+    """
+    y_pred = model.predict(X_test)
+    y_prob = model.predict_proba(X_test)[:, 1]
+    return classification_scores(y_test, y_pred, y_prob)
+
+def classification_scores(y_test, y_pred, y_prob):
+    """
+    Accuracy, precision, recall, F1 and AUC from predictions.
+    """
+    return {
+        'Accuracy': accuracy_score(y_test, y_pred),
+        'Precision': precision_score(y_test, y_pred, zero_division=0),
+        'Recall': recall_score(y_test, y_pred),
+        'F1': f1_score(y_test, y_pred),
+        'AUC': roc_auc_score(y_test, y_prob),
+    }
+
+def downsample_negatives(X, y, negative_fraction, random_state=42):
+    """
+    Keeps every positive row and a random negative_fraction of the negatives.
+    Sampled negatives get weight 1 / negative_fraction so the weighted class
+    balance (and hence predicted probabilities) matches the full data.
+    Returns (X_sampled, y_sampled, sample_weight).
+    """
+    if not 0 < negative_fraction <= 1:
+        raise ValueError("negative_fraction must be in (0, 1]")
+    y_arr = np.asarray(y)
+    rng = np.random.default_rng(random_state)
+    keep = (y_arr == 1) | (rng.random(len(y_arr)) < negative_fraction)
+    weight = np.where(y_arr[keep] == 1, 1.0, 1.0 / negative_fraction)
+    return X[keep], y[keep], weight
+
+def _without_rebalancing(models):
+    """
+    Unfitted copies of the models with class_weight / scale_pos_weight removed,
+    so the only reweighting is the sampling weight and probabilities stay calibrated.
+    """
+    calibrated = {}
+    for name, model in models.items():
+        model = clone(model)
+        params = model.get_params()
+        if 'class_weight' in params:
+            model.set_params(class_weight=None)
+        if 'scale_pos_weight' in params:
+            model.set_params(scale_pos_weight=1)
+        calibrated[name] = model
+    return calibrated
+
 class PremiumModeler:
     def __init__(self, data, target_col='HasClaim'):
         self.data = data
         self.target_col = target_col
-        # Ensure target is present or created
-        if target_col not in data.columns and 'TotalClaims' in data.columns:
+        # Ensure target is present or created (data may be None for external-memory training)
+        if data is not None and target_col not in data.columns and 'TotalClaims' in data.columns:
             self.data[target_col] = (self.data['TotalClaims'] > 0).astype(int)
             
         self.models = {
             'LogisticRegression': LogisticRegression(max_iter=1000),
             'RandomForest': RandomForestClassifier(n_estimators=100, random_state=42, n_jobs=-1, class_weight='balanced'),
-            'XGBoost': XGBClassifier(n_estimators=100, learning_rate=0.1, random_state=42, n_jobs=-1, scale_pos_weight=10) # Adjust scale_pos_weight
+            'XGBoost': XGBClassifier(n_estimators=100, learning_rate=0.1, random_state=42, n_jobs=-1, scale_pos_weight=10, tree_method='hist') # Adjust scale_pos_weight
         }
         self.results = {}
+        self.best_model = None
+        self.search_results = {}
+        self.cv_results = {}
+        self.segment_router = None
+        self.segment_results = None
+        self.dmatrix_cache = DMatrixCache()
 
-    def train_evaluate(self, X_train, X_test, y_train, y_test):
+    def train_evaluate(self, X_train, X_test, y_train, y_test, n_cpus=None, parallel=True,
+                       negative_fraction=None, random_state=42):
         """
-        Trains and evaluates classification models.
+        Trains and evaluates classification models concurrently under a
+        budget of n_cpus threads (default: all cores). parallel=False trains
+        them one after another, each with the full budget.
+
+        negative_fraction: train on all positives plus this fraction of the
+        negatives, weighted by the inverse sampling rate. class_weight and
+        scale_pos_weight are dropped in this mode so probabilities stay calibrated.
         """
         logging.info("Starting Probability Model Training...")
-        
-        for name, model in self.models.items():
-            logging.info(f"Training {name}...")
-            model.fit(X_train, y_train)
-            
-            y_pred = model.predict(X_test)
-            y_prob = model.predict_proba(X_test)[:, 1]
-            
-            acc = accuracy_score(y_test, y_pred)
-            prec = precision_score(y_test, y_pred, zero_division=0)
-            rec = recall_score(y_test, y_pred)
-            f1 = f1_score(y_test, y_pred)
-            auc = roc_auc_score(y_test, y_prob)
-            
-            self.results[name] = {
-                'Accuracy': acc,
-                'Precision': prec,
-                'Recall': rec,
-                'F1': f1,
-                'AUC': auc,
-                'model': model
-            }
-            logging.info(f"{name} - AUC: {auc:.4f}, F1: {f1:.4f}")
+
+        models, fit_params = self.models, None
+        if negative_fraction is not None:
+            n_rows = len(y_train)
+            X_train, y_train, weight = downsample_negatives(X_train, y_train, negative_fraction, random_state)
+            models = _without_rebalancing(self.models)
+            fit_params = {'__all__': {'sample_weight': weight}}
+            logging.info(f"Downsampled negatives to {negative_fraction:.0%}: "
+                         f"{len(y_train):,} of {n_rows:,} training rows")
+
+        scheduler = TrainingScheduler(n_cpus=n_cpus, parallel=parallel)
+        results = scheduler.run(models, classification_metrics, X_train, X_test, y_train, y_test,
+                                fit_params=fit_params)
+
+        for name, res in results.items():
+            res['NegativeFraction'] = negative_fraction if negative_fraction is not None else 1.0
+            res['MeanProb'] = res['model'].predict_proba(X_test)[:, 1].mean()
+            self.models[name] = res['model']
+            self.results[name] = res
+            logging.info(f"{name} - AUC: {res['AUC']:.4f}, F1: {res['F1']:.4f} "
+                         f"(wall {res['WallTime']:.1f}s, cpu {res['CPUTime']:.1f}s, {res['Threads']} threads)")
+        return results
+
+    def compare_downsampling(self, X_train, X_test, y_train, y_test, negative_fraction=0.1,
+                             n_cpus=None, parallel=True, random_state=42):
+        """
+        Fits every model on the full training set and on the negative-downsampled
+        set (both without class rebalancing, so only the sampling differs) and
+        reports fit-time speedup, AUC difference and calibration. self.models and
+        self.results hold the downsampled fits afterwards.
+        Returns one row per model.
+        """
+        base_models = self.models
+        self.models = _without_rebalancing(base_models)
+        full = self.train_evaluate(X_train, X_test, y_train, y_test, n_cpus, parallel)
+        self.models = _without_rebalancing(base_models)
+        sampled = self.train_evaluate(X_train, X_test, y_train, y_test, n_cpus, parallel,
+                                      negative_fraction=negative_fraction, random_state=random_state)
+
+        observed = float(np.mean(y_test))
+        rows = []
+        for name in base_models:
+            f, s = full[name], sampled[name]
+            rows.append({
+                'Model': name,
+                'NegativeFraction': negative_fraction,
+                'FullFitTime': f['WallTime'],
+                'SampledFitTime': s['WallTime'],
+                'Speedup': f['WallTime'] / s['WallTime'] if s['WallTime'] > 0 else np.nan,
+                'FullAUC': f['AUC'],
+                'SampledAUC': s['AUC'],
+                'AUCDiff': s['AUC'] - f['AUC'],
+                'ObservedRate': observed,
+                'FullMeanProb': f['MeanProb'],
+                'SampledMeanProb': s['MeanProb'],
+            })
+            logging.info(f"{name} - {rows[-1]['Speedup']:.1f}x faster, AUC diff {rows[-1]['AUCDiff']:+.4f}, "
+                         f"mean prob {s['MeanProb']:.4f} vs observed {observed:.4f}")
+        return pd.DataFrame(rows)
+
+    def tune(self, X_train, y_train, model_names=None, n_candidates=32, factor=3, cv=3,
+             n_jobs=None, output_dir='models'):
+        """
+        Successive-halving hyperparameter search for the models in self.models
+        (see src.models.tuning). Tuned, unfitted estimators replace the fixed
+        ones for the next train_evaluate; the search results and best
+        configuration of each model are saved to output_dir next to the model artifacts.
+        """
+        logging.info("Starting Probability Model Hyperparameter Search...")
+        tuned, searches = tune_models(self.models, X_train, y_train, 'roc_auc', output_dir=output_dir,
+                                      prefix='premium_', model_names=model_names,
+                                      n_candidates=n_candidates, factor=factor, cv=cv, n_jobs=n_jobs)
+        self.models.update(tuned)
+        self.search_results = searches
+        return tuned
+
+    def cross_validate(self, df, group_col='PolicyID', n_splits=5, n_cpus=None, parallel=True):
+        """
+        Group-aware K-fold cross-validation of self.models on df (features plus
+        self.target_col), keeping each group_col value in a single fold. Folds
+        are stratified by the target so every fold sees claims. Fold matrices
+        are cached and folds run in parallel worker processes.
+        Returns the per-model mean/std summary (also kept in self.cv_results).
+        """
+        logging.info("Starting Probability Model Cross-Validation...")
+        summary, per_fold = cross_validate_models(
+            self.models, df, self.target_col, classification_metrics, group_col=group_col, n_splits=n_splits,
+            stratify=True, n_cpus=n_cpus, parallel=parallel)
+        self.cv_results = {'summary': summary, 'folds': per_fold}
+        for _, row in summary.iterrows():
+            logging.info(f"{row['Model']} - CV AUC: {row['AUC_mean']:.4f} +/- {row['AUC_std']:.4f}")
+        return summary
+
+    def train_xgboost_hist(self, X_train, X_test, y_train, y_test, param_grid=None,
+                           categorical_cols=None, num_boost_round=1000, early_stopping_rounds=50):
+        """
+        Trains XGBoost on a cached QuantileDMatrix ('hist' trees, native
+        categorical splits, early stopping on a stratified validation split)
+        for each entry of param_grid, and records the best as 'XGBoostHist'.
+        """
+        logging.info("Training XGBoostHist...")
+        start = time.perf_counter()
+        model, trials = fit_hist_candidates(
+            self.dmatrix_cache, 'binary:logistic', 'auc', X_train, y_train,
+            param_grid=param_grid, stratify=True, categorical_cols=categorical_cols,
+            num_boost_round=num_boost_round, early_stopping_rounds=early_stopping_rounds)
+
+        res = classification_metrics(model, X_test, y_test)
+        res.update({'WallTime': time.perf_counter() - start, 'Trials': trials, 'model': model})
+        self.results['XGBoostHist'] = res
+        logging.info(f"XGBoostHist - AUC: {res['AUC']:.4f}, F1: {res['F1']:.4f} "
+                     f"(wall {res['WallTime']:.1f}s, {len(trials)} trials)")
+        return model
+
+    def train_external_memory(self, data_dir, params=None, feature_cols=None, num_boost_round=1000,
+                              early_stopping_rounds=50, batch_rows=100_000, cache_dir=None):
+        """
+        Trains the claim-probability XGBoost model out of core, streaming the
+        train/val/test Parquet partitions written by
+        InsuranceDataPreprocessor.save_processed_data through a data iterator,
+        so the book never has to fit in memory. Recorded as 'XGBoostExtMem'.
+        """
+        logging.info(f"Training XGBoostExtMem over {data_dir}...")
+        params = {**HIST_PARAMS, 'objective': 'binary:logistic', 'eval_metric': 'auc', **(params or {})}
+
+        start = time.perf_counter()
+        booster, feature_cols, categories = train_external_memory(
+            data_dir, params, feature_cols=feature_cols, num_boost_round=num_boost_round,
+            early_stopping_rounds=early_stopping_rounds, batch_rows=batch_rows, cache_dir=cache_dir)
+        model = BoosterModel(booster, params['objective'], categories)
+        fit_time = time.perf_counter() - start
+
+        test_path = os.path.join(data_dir, 'test')
+        test_files = list_partitions(test_path if os.path.isdir(test_path) else test_path + '.parquet')
+        y_test, y_prob = predict_partitions(model, test_files, feature_cols, categories, batch_rows=batch_rows)
+
+        res = classification_scores(y_test, (y_prob >= 0.5).astype(int), y_prob)
+        res.update({'WallTime': fit_time, 'Features': feature_cols, 'model': model})
+        self.results['XGBoostExtMem'] = res
+        logging.info(f"XGBoostExtMem - AUC: {res['AUC']:.4f}, F1: {res['F1']:.4f} "
+                     f"(fit {fit_time:.1f}s, {len(y_test):,} test rows)")
+        return model
+
+    def train_segmented(self, X_train, X_test, y_train, y_test, segment_col, labels=None,
+                        min_rows=MIN_SEGMENT_ROWS, n_cpus=None, parallel=True, output_dir=None):
+        """
+        Trains the candidates of self.models separately for every value of
+        segment_col (e.g. the encoded Province or RiskSegment code) in a pool
+        of worker processes sharing memory-mapped inputs, keeping the best
+        per segment on AUC. Segments with fewer than min_rows training
+        rows are scored by the global best model. Segments
+        with a single class in either split also fall back. Returns a
+        SegmentRouter that routes scoring by segment (saved to output_dir if given).
+        """
+        logging.info(f"Starting Segmented Probability Model Training by {segment_col}...")
+        fallback = self.best_model
+        if fallback is None:
+            best_name = max(self.results, key=lambda x: self.results[x]['AUC'])
+            fallback = self.results[best_name]['model']
+
+        router, report, _ = train_segments(
+            self.models, classification_metrics, 'AUC', X_train, X_test, y_train, y_test, segment_col, fallback,
+            min_rows=min_rows, classification=True, labels=labels, n_cpus=n_cpus, parallel=parallel)
+        self.segment_router = router
+        self.segment_results = report
+
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+            path = os.path.join(output_dir, f'segmented_claim_model_{segment_col}.joblib')
+            joblib.dump(router, path)
+            logging.info(f"Segmented model saved to {path}")
+        return router
+
+    def save_best_model(self, output_dir='models'):
+        """
+        Saves the best model based on AUC.
+        """
+        if not self.results:
+            logging.warning("No models trained yet.")
+            return
+
+        best_name = max(self.results, key=lambda x: self.results[x]['AUC'])
+        self.best_model = self.results[best_name]['model']
+
+        os.makedirs(output_dir, exist_ok=True)
+        path = os.path.join(output_dir, f'best_claim_model_{best_name}.joblib')
+        joblib.dump(self.best_model, path)
+        logging.info(f"{best_name} saved to {path}")
+        return path
+
+    def register_models(self, registry, preprocessor=None, data=None, promote_best=True):
+        """
+        Registers every trained candidate as a new version of 'claim' in a
+        ModelRegistry, with the fitted preprocessor, feature list, metrics,
+        training time and a hash of data. With promote_best, the best of
+        this run on AUC is promoted if it beats the promoted version.
+        Returns {candidate name: version}.
+        """
+        if not self.results:
+            logging.warning("No models trained yet.")
+            return {}
+
+        data_hash = frame_fingerprint(data) if data is not None else None
+        versions = {}
+        for name, res in self.results.items():
+            versions[name] = registry.register(
+                'claim', res['model'], preprocessor=preprocessor, metrics=jsonable_metrics(res),
+                data_hash=data_hash, training_time=res.get('WallTime'), tags={'candidate': name})
+        if promote_best:
+            registry.promote_best('claim', 'AUC', versions=list(versions.values()))
+        return versions
 
     def calculate_risk_premium(self, X_data, severity_model, probability_model, base_premium=0):
         """
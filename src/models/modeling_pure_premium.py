@@ -0,0 +1,208 @@
+import pandas as pd
+import numpy as np
+from sklearn.linear_model import TweedieRegressor
+from sklearn.compose import ColumnTransformer
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import OneHotEncoder, StandardScaler
+from sklearn.metrics import mean_squared_error, mean_absolute_error, mean_tweedie_deviance
+from xgboost import XGBRegressor
+import joblib
+import os
+import sys
+import time
+import logging
+from functools import partial
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+from src.models.training import TrainingScheduler
+from src.models.registry import jsonable_metrics
+from src.models.xgb_training import frame_fingerprint
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Tweedie variance power: 1 < p < 2 is a compound Poisson-gamma distribution,
+# i.e. a Poisson number of gamma-distributed claims per policy.
+TWEEDIE_POWER = 1.5
+
+# np.trapz was renamed np.trapezoid in numpy 2.0 (requirements allow numpy>=1.24)
+_trapezoid = getattr(np, 'trapezoid', None) or np.trapz
+
+def gini_coefficient(y_true, y_pred, weight=None):
+    """
+    Normalised Gini of the ordered Lorenz curve: how well y_pred ranks
+    policies by actual claim cost (1 = perfect ranking, 0 = random).
+    """
+    y_true, y_pred = np.asarray(y_true, dtype=float), np.asarray(y_pred, dtype=float)
+    weight = np.ones_like(y_true) if weight is None else np.asarray(weight, dtype=float)
+
+    def gini(score):
+        order = np.argsort(score, kind='stable')
+        cum_weight = np.cumsum(weight[order]) / weight.sum()
+        cum_loss = np.cumsum((y_true * weight)[order]) / (y_true * weight).sum()
+        return 1 - 2 * _trapezoid(cum_loss, cum_weight)
+
+    perfect = gini(y_true)
+    return gini(y_pred) / perfect if perfect else np.nan
+
+def pure_premium_scores(y_test, y_pred, power=TWEEDIE_POWER, weight=None):
+    """
+    Tweedie deviance, RMSE, MAE, normalised Gini and calibration (total
+    predicted / total actual cost) of expected-claim-cost predictions.
+    """
+    y_pred = np.clip(np.asarray(y_pred, dtype=float), 1e-9, None)
+    return {
+        'Deviance': mean_tweedie_deviance(y_test, y_pred, power=power, sample_weight=weight),
+        'RMSE': np.sqrt(mean_squared_error(y_test, y_pred, sample_weight=weight)),
+        'MAE': mean_absolute_error(y_test, y_pred, sample_weight=weight),
+        'Gini': gini_coefficient(y_test, y_pred, weight),
+        'Calibration': np.average(y_pred, weights=weight) / np.average(y_test, weights=weight),
+    }
+
+def pure_premium_metrics(model, X_test, y_test, power=TWEEDIE_POWER):
+    """
+    Pure-premium scores of a fitted expected-claim-cost model on the test set.
+    """
+    return pure_premium_scores(y_test, model.predict(X_test), power)
+
+def sparse_glm(numeric_cols, categorical_cols, power=TWEEDIE_POWER, alpha=1e-4):
+    """
+    Tweedie GLM (log link) on a sparse design: one-hot categorical codes
+    (unseen levels ignored) plus scaled numeric columns.
+    """
+    design = ColumnTransformer([
+        ('categorical', OneHotEncoder(handle_unknown='ignore', min_frequency=10), categorical_cols),
+        ('numeric', StandardScaler(), numeric_cols),
+    ], sparse_threshold=1.0)
+    return Pipeline([
+        ('design', design),
+        ('glm', TweedieRegressor(power=power, link='log', alpha=alpha, max_iter=1000)),
+    ])
+
+class PurePremiumModeler:
+    """
+    Single-model alternative to the frequency x severity pair: fits the
+    expected claim cost per unit of exposure directly on all policies with a
+    Tweedie (compound Poisson-gamma) objective, weighting every policy by
+    its exposure. One predict call per policy prices it.
+    """
+
+    def __init__(self, data, target_col='TotalClaims', exposure_col=None, categorical_cols=None,
+                 power=TWEEDIE_POWER):
+        self.data = data
+        self.target_col = target_col
+        self.exposure_col = exposure_col
+        self.categorical_cols = list(categorical_cols or [])
+        self.power = power
+        self.models = {
+            'XGBoostTweedie': XGBRegressor(objective='reg:tweedie', tweedie_variance_power=power,
+                                           n_estimators=300, learning_rate=0.05, max_depth=6,
+                                           random_state=42, n_jobs=-1, tree_method='hist'),
+        }
+        self.results = {}
+        self.best_model = None
+
+    def exposure(self, X):
+        """Exposure of each row (1 per row when no exposure column is set)."""
+        if self.exposure_col and self.exposure_col in X.columns:
+            return X[self.exposure_col].clip(lower=1e-6).to_numpy(dtype=float)
+        return np.ones(len(X))
+
+    def train_evaluate(self, X_train, X_test, y_train, y_test, n_cpus=None, parallel=True):
+        """
+        Trains the Tweedie XGBoost model and the sparse Tweedie GLM on claim
+        cost per unit exposure, each weighted by exposure, concurrently under
+        a budget of n_cpus threads.
+        """
+        logging.info("Starting Pure Premium (Tweedie) Model Training...")
+        numeric_cols = [c for c in X_train.columns if c not in self.categorical_cols]
+        self.models['TweedieGLM'] = sparse_glm(numeric_cols, self.categorical_cols, self.power)
+
+        exposure = self.exposure(X_train)
+        y_rate = np.asarray(y_train, dtype=float) / exposure
+        fit_params = {'XGBoostTweedie': {'sample_weight': exposure},
+                      'TweedieGLM': {'glm__sample_weight': exposure}}
+
+        scheduler = TrainingScheduler(n_cpus=n_cpus, parallel=parallel)
+        y_test_rate = np.asarray(y_test, dtype=float) / self.exposure(X_test)
+        metric_fn = partial(pure_premium_metrics, power=self.power)
+        results = scheduler.run(self.models, metric_fn, X_train, X_test, y_rate, y_test_rate, fit_params=fit_params)
+
+        for name, res in results.items():
+            self.models[name] = res['model']
+            self.results[name] = res
+            logging.info(f"{name} - Deviance: {res['Deviance']:.2f}, Gini: {res['Gini']:.4f}, "
+                         f"Calibration: {res['Calibration']:.3f} (wall {res['WallTime']:.1f}s)")
+        return results
+
+    def benchmark(self, X_test, y_test, probability_model, severity_model, two_model_fit_time=None,
+                  repeats=3):
+        """
+        Compares each Tweedie model with the two-model product
+        P(Claim) * E(Severity) on the same test policies: pure-premium
+        accuracy, training time and scoring time (best of repeats).
+        two_model_fit_time: combined fit time of the frequency and severity models.
+        """
+        def timed(predict):
+            best, pred = np.inf, None
+            for _ in range(repeats):
+                start = time.perf_counter()
+                pred = predict(X_test)
+                best = min(best, time.perf_counter() - start)
+            return pred, best
+
+        candidates = {name: (res['model'].predict, res['WallTime']) for name, res in self.results.items()}
+        candidates['FrequencyxSeverity'] = (
+            lambda X: probability_model.predict_proba(X)[:, 1] * severity_model.predict(X), two_model_fit_time)
+
+        y_test = np.asarray(y_test, dtype=float) / self.exposure(X_test)
+        rows = []
+        for name, (predict, fit_time) in candidates.items():
+            pred, score_time = timed(predict)
+            rows.append({'Approach': name, **pure_premium_scores(y_test, pred, self.power),
+                         'FitTime': fit_time, 'ScoreTime': score_time,
+                         'ScoreRowsPerSec': len(X_test) / score_time if score_time > 0 else np.nan})
+        table = pd.DataFrame(rows)
+        logging.info("Pure premium benchmark:\n" + table.to_string(index=False))
+        return table
+
+    def save_best_model(self, output_dir='models'):
+        """
+        Saves the best model based on Tweedie deviance.
+        """
+        if not self.results:
+            logging.warning("No models trained yet.")
+            return
+
+        best_name = min(self.results, key=lambda x: self.results[x]['Deviance'])
+        self.best_model = self.results[best_name]['model']
+
+        os.makedirs(output_dir, exist_ok=True)
+        path = os.path.join(output_dir, f'best_pure_premium_model_{best_name}.joblib')
+        joblib.dump(self.best_model, path)
+        logging.info(f"{best_name} saved to {path}")
+        return path
+
+    def register_models(self, registry, preprocessor=None, data=None, promote_best=True):
+        """
+        Registers every trained candidate as a new version of 'pure_premium'
+        in a ModelRegistry; with promote_best, the lowest-deviance one of
+        this run is promoted if it beats the promoted version.
+        Returns {candidate name: version}.
+        """
+        if not self.results:
+            logging.warning("No models trained yet.")
+            return {}
+
+        data_hash = frame_fingerprint(data) if data is not None else None
+        versions = {}
+        for name, res in self.results.items():
+            versions[name] = registry.register(
+                'pure_premium', res['model'], preprocessor=preprocessor, metrics=jsonable_metrics(res),
+                data_hash=data_hash, training_time=res.get('WallTime'),
+                tags={'candidate': name, 'power': self.power})
+        if promote_best:
+            registry.promote_best('pure_premium', 'Deviance', versions=list(versions.values()))
+        return versions
+
+if __name__ == "__main__":
+    pass
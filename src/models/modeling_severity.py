@@ -6,10 +6,33 @@ from xgboost import XGBRegressor
 from sklearn.metrics import mean_squared_error, mean_absolute_error, r2_score
 import joblib
 import os
+import sys
+import time
 import logging
 
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+from src.models.training import TrainingScheduler
+from src.models.tuning import tune_models
+from src.models.cross_validation import cross_validate_models
+from src.models.registry import jsonable_metrics
+from src.models.segmented import train_segments, MIN_SEGMENT_ROWS
+from src.models.xgb_training import DMatrixCache, fit_hist_candidates, frame_fingerprint
+
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+def regression_metrics(model, X_test, y_test):
+    """
+    RMSE, MAE and R2 of a fitted regressor on the test set.
+    """
+    y_pred = model.predict(X_test)
+
+    mse = mean_squared_error(y_test, y_pred)
+    rmse = np.sqrt(mse)
+    mae = mean_absolute_error(y_test, y_pred)
+    r2 = r2_score(y_test, y_pred)
+
+    return {'RMSE': rmse, 'MAE': mae, 'R2': r2}
+
 class SeverityModeler:
     def __init__(self, data, target_col='TotalClaims'):
         self.data = data
@@ -17,35 +40,114 @@ class SeverityModeler:
         self.models = {
             'LinearRegression': LinearRegression(),
             'RandomForest': RandomForestRegressor(n_estimators=100, random_state=42, n_jobs=-1),
-            'XGBoost': XGBRegressor(n_estimators=100, learning_rate=0.1, random_state=42, n_jobs=-1)
+            'XGBoost': XGBRegressor(n_estimators=100, learning_rate=0.1, random_state=42, n_jobs=-1, tree_method='hist')
         }
         self.results = {}
+        self.search_results = {}
+        self.cv_results = {}
+        self.segment_router = None
+        self.segment_results = None
         self.best_model = None
+        self.dmatrix_cache = DMatrixCache()
 
-    def train_evaluate(self, X_train, X_test, y_train, y_test):
+    def train_evaluate(self, X_train, X_test, y_train, y_test, n_cpus=None, parallel=True):
         """
-        Trains and evaluates all defined models.
+        Trains and evaluates all defined models concurrently under a budget
+        of n_cpus threads (default: all cores). parallel=False trains them
+        one after another, each with the full budget.
         """
         logging.info("Starting Severity Model Training...")
-        
-        for name, model in self.models.items():
-            logging.info(f"Training {name}...")
-            model.fit(X_train, y_train)
-            
-            y_pred = model.predict(X_test)
-            
-            mse = mean_squared_error(y_test, y_pred)
-            rmse = np.sqrt(mse)
-            mae = mean_absolute_error(y_test, y_pred)
-            r2 = r2_score(y_test, y_pred)
-            
-            self.results[name] = {
-                'RMSE': rmse,
-                'MAE': mae,
-                'R2': r2,
-                'model': model
-            }
-            logging.info(f"{name} - RMSE: {rmse:.2f}, R2: {r2:.4f}")
+
+        scheduler = TrainingScheduler(n_cpus=n_cpus, parallel=parallel)
+        results = scheduler.run(self.models, regression_metrics, X_train, X_test, y_train, y_test)
+
+        for name, res in results.items():
+            self.models[name] = res['model']
+            self.results[name] = res
+            logging.info(f"{name} - RMSE: {res['RMSE']:.2f}, R2: {res['R2']:.4f} "
+                         f"(wall {res['WallTime']:.1f}s, cpu {res['CPUTime']:.1f}s, {res['Threads']} threads)")
+
+    def tune(self, X_train, y_train, model_names=None, n_candidates=32, factor=3, cv=3,
+             n_jobs=None, output_dir='models'):
+        """
+        Successive-halving hyperparameter search for the models in self.models
+        (see src.models.tuning). Tuned, unfitted estimators replace the fixed
+        ones for the next train_evaluate; the search results and best
+        configuration of each model are saved to output_dir next to the model artifacts.
+        """
+        logging.info("Starting Severity Model Hyperparameter Search...")
+        tuned, searches = tune_models(self.models, X_train, y_train, 'neg_root_mean_squared_error', output_dir=output_dir,
+                                      prefix='severity_', model_names=model_names,
+                                      n_candidates=n_candidates, factor=factor, cv=cv, n_jobs=n_jobs)
+        self.models.update(tuned)
+        self.search_results = searches
+        return tuned
+
+    def cross_validate(self, df, group_col='PolicyID', n_splits=5, n_cpus=None, parallel=True):
+        """
+        Group-aware K-fold cross-validation of self.models on df (features plus
+        self.target_col), keeping each group_col value in a single fold. Fold
+        matrices are cached and folds run in parallel worker processes.
+        Returns the per-model mean/std summary (also kept in self.cv_results).
+        """
+        logging.info("Starting Severity Model Cross-Validation...")
+        summary, per_fold = cross_validate_models(
+            self.models, df, self.target_col, regression_metrics, group_col=group_col, n_splits=n_splits,
+            stratify=False, n_cpus=n_cpus, parallel=parallel)
+        self.cv_results = {'summary': summary, 'folds': per_fold}
+        for _, row in summary.iterrows():
+            logging.info(f"{row['Model']} - CV RMSE: {row['RMSE_mean']:.4f} +/- {row['RMSE_std']:.4f}")
+        return summary
+
+    def train_xgboost_hist(self, X_train, X_test, y_train, y_test, param_grid=None,
+                           categorical_cols=None, num_boost_round=1000, early_stopping_rounds=50):
+        """
+        Trains XGBoost on a cached QuantileDMatrix ('hist' trees, native
+        categorical splits, early stopping on a validation split) for each
+        entry of param_grid, and records the best as 'XGBoostHist'.
+        """
+        logging.info("Training XGBoostHist...")
+        start = time.perf_counter()
+        model, trials = fit_hist_candidates(
+            self.dmatrix_cache, 'reg:squarederror', 'rmse', X_train, y_train,
+            param_grid=param_grid, categorical_cols=categorical_cols,
+            num_boost_round=num_boost_round, early_stopping_rounds=early_stopping_rounds)
+
+        res = regression_metrics(model, X_test, y_test)
+        res.update({'WallTime': time.perf_counter() - start, 'Trials': trials, 'model': model})
+        self.results['XGBoostHist'] = res
+        logging.info(f"XGBoostHist - RMSE: {res['RMSE']:.2f}, R2: {res['R2']:.4f} "
+                     f"(wall {res['WallTime']:.1f}s, {len(trials)} trials)")
+        return model
+
+    def train_segmented(self, X_train, X_test, y_train, y_test, segment_col, labels=None,
+                        min_rows=MIN_SEGMENT_ROWS, n_cpus=None, parallel=True, output_dir=None):
+        """
+        Trains the candidates of self.models separately for every value of
+        segment_col (e.g. the encoded Province or RiskSegment code) in a pool
+        of worker processes sharing memory-mapped inputs, keeping the best
+        per segment on RMSE. Segments with fewer than min_rows training
+        rows are scored by the global best model. Returns a SegmentRouter
+        that routes scoring by segment (saved to output_dir if given).
+        """
+        logging.info(f"Starting Segmented Severity Model Training by {segment_col}...")
+        fallback = self.best_model
+        if fallback is None:
+            best_name = min(self.results, key=lambda x: self.results[x]['RMSE'])
+            fallback = self.results[best_name]['model']
+
+        router, report, _ = train_segments(
+            self.models, regression_metrics, 'RMSE', X_train, X_test, y_train, y_test, segment_col, fallback,
+            min_rows=min_rows, classification=False, labels=labels, n_cpus=n_cpus, parallel=parallel)
+        self.segment_router = router
+        self.segment_results = report
+
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+            path = os.path.join(output_dir, f'segmented_severity_model_{segment_col}.joblib')
+            joblib.dump(router, path)
+            logging.info(f"Segmented model saved to {path}")
+        return router
 
     def save_best_model(self, output_dir='models'):
         """
@@ -66,6 +168,28 @@ class SeverityModeler:
         logging.info(f"Examples of {best_name} saved to {path}")
         return path
 
+    def register_models(self, registry, preprocessor=None, data=None, promote_best=True):
+        """
+        Registers every trained candidate as a new version of 'severity' in a
+        ModelRegistry, with the fitted preprocessor, feature list, metrics,
+        training time and a hash of data. With promote_best, the best of
+        this run on RMSE is promoted if it beats the promoted version.
+        Returns {candidate name: version}.
+        """
+        if not self.results:
+            logging.warning("No models trained yet.")
+            return {}
+
+        data_hash = frame_fingerprint(data) if data is not None else None
+        versions = {}
+        for name, res in self.results.items():
+            versions[name] = registry.register(
+                'severity', res['model'], preprocessor=preprocessor, metrics=jsonable_metrics(res),
+                data_hash=data_hash, training_time=res.get('WallTime'), tags={'candidate': name})
+        if promote_best:
+            registry.promote_best('severity', 'RMSE', versions=list(versions.values()))
+        return versions
+
 if __name__ == "__main__":
     # Test stub
     pass
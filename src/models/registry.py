@@ -0,0 +1,227 @@
+import os
+import sys
+import json
+import shutil
+import logging
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import joblib
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+from src.models.xgb_training import frame_fingerprint
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+REGISTRY_DIR = os.path.join('models', 'registry')
+
+# Metrics where lower is better; everything else is compared higher-is-better
+LOWER_IS_BETTER = {'RMSE', 'MAE', 'WallTime', 'CPUTime', 'PeakMemoryMB', 'Deviance'}
+
+
+def jsonable_metrics(result):
+    """Scalar numeric entries of a modeler result dict (drops models, frames, lists)."""
+    metrics = {}
+    for key, value in result.items():
+        if isinstance(value, (bool, np.bool_)):
+            continue
+        if isinstance(value, (int, float, np.integer, np.floating)) and np.isfinite(value):
+            metrics[key] = float(value)
+    return metrics
+
+
+class RegisteredModel:
+    """
+    Lazy handle on one registry version: meta.json is read up front, the
+    model and preprocessor are only unpickled on first access, with large
+    numpy arrays memory-mapped (joblib mmap_mode='r').
+    """
+
+    def __init__(self, path, mmap=True):
+        self.path = path
+        self.mmap_mode = 'r' if mmap else None
+        with open(os.path.join(path, 'meta.json')) as f:
+            self.meta = json.load(f)
+        self._model = None
+        self._preprocessor = None
+
+    @property
+    def version(self):
+        return self.meta['version']
+
+    @property
+    def model_path(self):
+        return os.path.join(self.path, 'model.joblib')
+
+    @property
+    def preprocessor_path(self):
+        path = os.path.join(self.path, 'preprocessor.joblib')
+        return path if os.path.exists(path) else None
+
+    @property
+    def model(self):
+        if self._model is None:
+            self._model = joblib.load(self.model_path, mmap_mode=self.mmap_mode)
+        return self._model
+
+    @property
+    def preprocessor(self):
+        if self._preprocessor is None and self.preprocessor_path:
+            self._preprocessor = joblib.load(self.preprocessor_path, mmap_mode=self.mmap_mode)
+        return self._preprocessor
+
+    def __repr__(self):
+        return f"RegisteredModel({self.meta['name']!r}, v{self.version}, {self.meta['model_class']})"
+
+
+class ModelRegistry:
+    """
+    Versioned on-disk model registry.
+
+    Layout: <root>/<name>/v<k>/ holds model.joblib, preprocessor.joblib
+    (optional) and meta.json (model class, features, metrics, data hash,
+    training time, registration time); <root>/<name>/PROMOTED holds the
+    version scorers should use. Artifacts are written uncompressed so they
+    can be memory-mapped on load.
+    """
+
+    def __init__(self, root=REGISTRY_DIR):
+        self.root = root
+
+    def versions(self, name):
+        path = os.path.join(self.root, name)
+        if not os.path.isdir(path):
+            return []
+        return sorted(int(d[1:]) for d in os.listdir(path) if d.startswith('v') and d[1:].isdigit())
+
+    def names(self):
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(d for d in os.listdir(self.root) if self.versions(d))
+
+    def _version_dir(self, name, version):
+        return os.path.join(self.root, name, f'v{version}')
+
+    def register(self, name, model, preprocessor=None, features=None, metrics=None, data=None,
+                 data_hash=None, training_time=None, params=None, tags=None):
+        """
+        Stores a fitted model as the next version of name. data (frame or
+        array the model was trained on) is hashed into data_hash unless a hash
+        is given. Returns the new version number.
+        """
+        version = (self.versions(name) or [0])[-1] + 1
+        path = self._version_dir(name, version)
+        os.makedirs(path)
+        try:
+            joblib.dump(model, os.path.join(path, 'model.joblib'))
+            if preprocessor is not None:
+                joblib.dump(preprocessor, os.path.join(path, 'preprocessor.joblib'))
+            if features is None and getattr(model, 'feature_names_in_', None) is not None:
+                features = list(model.feature_names_in_)
+            if params is None and hasattr(model, 'get_params'):
+                params = {k: v for k, v in model.get_params().items()
+                          if isinstance(v, (str, int, float, bool, type(None)))}
+            meta = {
+                'name': name, 'version': version, 'model_class': type(model).__name__,
+                'features': list(features) if features is not None else None,
+                'metrics': metrics or {}, 'params': params or {},
+                'data_hash': data_hash or (frame_fingerprint(data) if data is not None else None),
+                'training_time': training_time, 'registered_at': datetime.now().isoformat(),
+                'tags': tags or {},
+            }
+            with open(os.path.join(path, 'meta.json'), 'w') as f:
+                json.dump(meta, f, indent=2, default=str)
+        except Exception:
+            shutil.rmtree(path, ignore_errors=True)
+            raise
+        logging.info(f"Registered {name} v{version} ({meta['model_class']})")
+        return version
+
+    def promote(self, name, version):
+        """Marks a version as the one scorers load by default."""
+        if version not in self.versions(name):
+            raise ValueError(f"{name} has no version {version}")
+        with open(os.path.join(self.root, name, 'PROMOTED'), 'w') as f:
+            f.write(str(version))
+        logging.info(f"Promoted {name} v{version}")
+
+    def promoted_version(self, name):
+        path = os.path.join(self.root, name, 'PROMOTED')
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return int(f.read().strip())
+
+    def get(self, name, version=None, mmap=True):
+        """Lazy handle on a version (default: promoted, else latest)."""
+        versions = self.versions(name)
+        if not versions:
+            raise KeyError(f"No registered versions of {name!r} in {self.root}")
+        version = version or self.promoted_version(name) or versions[-1]
+        return RegisteredModel(self._version_dir(name, version), mmap=mmap)
+
+    def load(self, name, version=None, mmap=True):
+        """The model object of a version (default: promoted, else latest)."""
+        return self.get(name, version, mmap).model
+
+    def list(self, name=None):
+        """One row per version: Name, Version, ModelClass, Promoted, DataHash, TrainingTime, RegisteredAt + metrics."""
+        rows = []
+        for model_name in ([name] if name else self.names()):
+            promoted = self.promoted_version(model_name)
+            for version in self.versions(model_name):
+                meta = self.get(model_name, version).meta
+                rows.append({'Name': model_name, 'Version': version, 'ModelClass': meta['model_class'],
+                             'Promoted': version == promoted, 'DataHash': (meta['data_hash'] or '')[:12],
+                             'TrainingTime': meta['training_time'], 'RegisteredAt': meta['registered_at'],
+                             **meta['metrics']})
+        return pd.DataFrame(rows)
+
+    def compare(self, name, metric, versions=None):
+        """
+        Versions of name ranked by metric (best first), with the difference to
+        the promoted version (which need not be among versions).
+        """
+        table = self.list(name)
+        if metric not in table.columns:
+            raise KeyError(f"No version of {name!r} records {metric!r}")
+        promoted = table.loc[table['Promoted'], metric]
+        if versions is not None:
+            table = table[table['Version'].isin(versions)]
+        ascending = metric in LOWER_IS_BETTER
+        table = table.sort_values(metric, ascending=ascending).reset_index(drop=True)
+        if len(promoted):
+            table[f'{metric}VsPromoted'] = table[metric] - promoted.iloc[0]
+        return table
+
+    def promote_best(self, name, metric, versions=None):
+        """
+        Promotes the best version of name on metric (among versions, e.g. those
+        of the current run) if it improves on the currently promoted version;
+        a worse retrain leaves the promoted version in place.
+        Returns the promoted version.
+        """
+        table = self.compare(name, metric, versions)
+        best = int(table['Version'].iloc[0])
+        delta = table[f'{metric}VsPromoted'].iloc[0] if f'{metric}VsPromoted' in table.columns else np.nan
+        improves = delta < 0 if metric in LOWER_IS_BETTER else delta > 0
+        current = self.promoted_version(name)
+        if current is not None and not pd.isna(delta) and not improves:
+            logging.info(f"Keeping {name} v{current}: best new version v{best} does not improve {metric} "
+                         f"({delta:+.6g} vs promoted)")
+            return current
+        self.promote(name, best)
+        return best
+
+
+def registered_scoring_paths(root=REGISTRY_DIR, frequency_name='claim', severity_name='severity'):
+    """
+    (transformer, frequency model, severity model) file paths of the promoted
+    claim and severity versions, for the batch scorer and quote service.
+    """
+    registry = ModelRegistry(root)
+    frequency, severity = registry.get(frequency_name), registry.get(severity_name)
+    transformer = frequency.preprocessor_path or severity.preprocessor_path
+    if transformer is None:
+        raise ValueError("Promoted models were registered without a preprocessor")
+    return transformer, frequency.model_path, severity.model_path
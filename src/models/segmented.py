@@ -0,0 +1,170 @@
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import logging
+import multiprocessing as mp
+import numpy as np
+import pandas as pd
+from sklearn.base import clone
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+from src.models.training import split_thread_budget, _fit_and_score
+from src.models.registry import LOWER_IS_BETTER
+from src.features.preprocessing import matrix_dtype
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Segments with fewer training rows than this are scored by the global model
+MIN_SEGMENT_ROWS = 500
+
+
+class SegmentRouter:
+    """
+    Routes scoring by segment: rows whose segment_col value has its own model
+    are scored by it, every other row (small or unseen segments) by the
+    global fallback model. Exposes predict / predict_proba like the models
+    it wraps, so batch scoring and the quote service can use it unchanged.
+    """
+
+    def __init__(self, segment_col, segment_models, fallback, labels=None):
+        self.segment_col = segment_col
+        self.segment_models = dict(segment_models)
+        self.fallback = fallback
+        self.labels = dict(labels or {})
+        feature_names = getattr(fallback, 'feature_names_in_', None)
+        if feature_names is not None:
+            self.feature_names_in_ = feature_names
+
+    def _route(self, X, method):
+        X = X if isinstance(X, pd.DataFrame) else pd.DataFrame(X, columns=self.feature_names_in_)
+        segments = X[self.segment_col].to_numpy()
+        out = None
+        for segment in np.unique(segments):
+            rows = np.flatnonzero(segments == segment)
+            model = self.segment_models.get(segment, self.fallback)
+            pred = getattr(model, method)(X.iloc[rows])
+            if out is None:
+                out = np.empty((len(X),) + pred.shape[1:], dtype=pred.dtype)
+            out[rows] = pred
+        return out if out is not None else getattr(self.fallback, method)(X)
+
+    def predict(self, X):
+        return self._route(X, 'predict')
+
+    def predict_proba(self, X):
+        return self._route(X, 'predict_proba')
+
+    def __repr__(self):
+        return (f"SegmentRouter({self.segment_col!r}, {len(self.segment_models)} segment models, "
+                f"fallback={type(self.fallback).__name__})")
+
+
+def _segment_task(segment, name, model, n_threads, metric_fn, data_dir):
+    with open(os.path.join(data_dir, 'columns.json')) as f:
+        columns = json.load(f)
+    X_train, X_test, y_train, y_test = [np.load(os.path.join(data_dir, f'{part}.npy'), mmap_mode='r')
+                                        for part in ('X_train', 'X_test', 'y_train', 'y_test')]
+    train_idx = np.load(os.path.join(data_dir, f'segment{segment}_train.npy'))
+    test_idx = np.load(os.path.join(data_dir, f'segment{segment}_test.npy'))
+    # Only this segment's rows are copied out of the shared memory-mapped matrices
+    _, metrics = _fit_and_score(
+        name, model, n_threads, metric_fn,
+        pd.DataFrame(X_train[train_idx], columns=columns), pd.DataFrame(X_test[test_idx], columns=columns),
+        y_train[train_idx], y_test[test_idx], None)
+    return segment, name, metrics
+
+
+def _usable_segment(y_train, y_test, min_rows, classification):
+    if len(y_train) < min_rows or len(y_test) == 0:
+        return False
+    # A classifier (and its AUC) needs both classes on each side of the split
+    return not classification or (len(np.unique(y_train)) > 1 and len(np.unique(y_test)) > 1)
+
+
+def train_segments(models, metric_fn, metric, X_train, X_test, y_train, y_test, segment_col, fallback,
+                   min_rows=MIN_SEGMENT_ROWS, classification=False, labels=None, n_cpus=None, parallel=True):
+    """
+    Trains every candidate in models ({name: estimator}) separately on each
+    value of segment_col and keeps the best one per segment on metric
+    (direction from registry.LOWER_IS_BETTER).
+
+    The full train/test matrices are written once as .npy files; each
+    (segment, candidate) pair is one task in a spawn process pool that
+    memory-maps them and takes its segment's rows, with the CPU budget split
+    by split_thread_budget. Segments with fewer than min_rows training rows
+    (or, with classification, a single class) keep the global fallback
+    model. The fallback is also scored on every segment's test rows so the
+    report shows what the segment model gains over it.
+    Returns (SegmentRouter, per-segment report, {(segment, name): metrics}).
+    """
+    n_cpus = n_cpus or os.cpu_count() or 1
+    lower_is_better = metric in LOWER_IS_BETTER
+    y_train, y_test = np.asarray(y_train), np.asarray(y_test)
+    train_codes, test_codes = X_train[segment_col].to_numpy(), X_test[segment_col].to_numpy()
+    labels = labels or {}
+
+    rows, tasks = [], {}
+    for segment in np.unique(np.concatenate([train_codes, test_codes])):
+        train_idx = np.flatnonzero(train_codes == segment)
+        test_idx = np.flatnonzero(test_codes == segment)
+        row = {'Segment': labels.get(segment, segment), 'Code': segment,
+               'TrainRows': len(train_idx), 'TestRows': len(test_idx)}
+        if len(test_idx) and (not classification or len(np.unique(y_test[test_idx])) > 1):
+            row[f'Global{metric}'] = metric_fn(fallback, X_test.iloc[test_idx], y_test[test_idx])[metric]
+        if _usable_segment(y_train[train_idx], y_test[test_idx], min_rows, classification):
+            tasks.update({(segment, name): (train_idx, test_idx) for name in models})
+        rows.append(row)
+
+    start = time.perf_counter()
+    results = {}
+    if tasks:
+        budget, concurrency = split_thread_budget({task: models[task[1]] for task in tasks}, n_cpus)
+        data_dir = tempfile.mkdtemp(prefix='acis_segments_')
+        try:
+            X_dtype = matrix_dtype(X_train.dtypes)
+            for part, arr, dtype in (('X_train', X_train, X_dtype), ('X_test', X_test, X_dtype),
+                                     ('y_train', y_train, None), ('y_test', y_test, None)):
+                np.save(os.path.join(data_dir, f'{part}.npy'), np.ascontiguousarray(arr, dtype=dtype))
+            with open(os.path.join(data_dir, 'columns.json'), 'w') as f:
+                json.dump(list(X_train.columns), f)
+            for (segment, _), (train_idx, test_idx) in tasks.items():
+                np.save(os.path.join(data_dir, f'segment{segment}_train.npy'), train_idx)
+                np.save(os.path.join(data_dir, f'segment{segment}_test.npy'), test_idx)
+
+            # Largest segments and heaviest models first
+            order = sorted(tasks, key=lambda task: (-budget[task], -len(tasks[task][0])))
+            if not parallel or concurrency == 1:
+                done = [_segment_task(segment, name, clone(models[name]), n_cpus, metric_fn, data_dir)
+                        for segment, name in order]
+            else:
+                ctx = mp.get_context('spawn')
+                with ctx.Pool(processes=concurrency, maxtasksperchild=1) as pool:
+                    pending = [pool.apply_async(_segment_task, (segment, name, clone(models[name]),
+                                                                budget[(segment, name)], metric_fn, data_dir))
+                               for segment, name in order]
+                    done = [job.get() for job in pending]
+        finally:
+            shutil.rmtree(data_dir, ignore_errors=True)
+        results = {(segment, name): metrics for segment, name, metrics in done}
+
+    segment_models = {}
+    for row in rows:
+        candidates = {name: res for (segment, name), res in results.items() if segment == row['Code']}
+        if not candidates:
+            row.update({'Model': 'Global', 'Fallback': True})
+            continue
+        pick = min if lower_is_better else max
+        best = pick(candidates, key=lambda name: candidates[name][metric])
+        segment_models[row['Code']] = candidates[best]['model']
+        row.update({'Model': best, 'Fallback': False, metric: candidates[best][metric],
+                    'WallTime': candidates[best]['WallTime']})
+
+    report = pd.DataFrame(rows)
+    n_fallback = int(report['Fallback'].sum()) if len(report) else 0
+    logging.info(f"Fitted {len(results)} candidates over {len(report) - n_fallback} {segment_col} segments "
+                 f"in {time.perf_counter() - start:.1f}s ({n_fallback} segments use the global model)")
+    router = SegmentRouter(segment_col, segment_models, fallback, labels=labels)
+    return router, report, results
@@ -0,0 +1,188 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+import logging
+import multiprocessing as mp
+import joblib
+import pandas as pd
+from joblib import parallel_config
+from sklearn.base import clone
+from threadpoolctl import threadpool_limits
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+def _reset_peak_memory():
+    """Resets the kernel's peak-RSS mark for this process (Linux), so the peak is per model."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def _peak_memory_mb():
+    """Peak resident memory of the current process in MB (None where unsupported)."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes on Linux
+    return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
+
+
+def _is_ensemble(model):
+    return 'n_estimators' in model.get_params()
+
+
+def split_thread_budget(models, n_cpus):
+    """
+    Splits n_cpus threads between candidate models without oversubscription.
+    Single-threaded models (linear) get 1 thread, ensembles share the rest evenly.
+    Returns ({name: threads}, number of models that may run at once).
+    """
+    names = list(models)
+    if n_cpus <= len(names):
+        return {name: 1 for name in names}, max(1, n_cpus)
+
+    heavy = [name for name in names if _is_ensemble(models[name])]
+    budget = {name: 1 for name in names}
+    spare = n_cpus - len(names)
+    for i, name in enumerate(heavy):
+        budget[name] += spare // len(heavy) + (1 if i < spare % len(heavy) else 0)
+    return budget, len(names)
+
+
+def _fit_and_score(name, model, n_threads, metric_fn, X_train, X_test, y_train, y_test, fit_params):
+    if _is_ensemble(model) and 'n_jobs' in model.get_params():
+        model.set_params(n_jobs=n_threads)
+
+    _reset_peak_memory()
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    # Threading backend: joblib refuses process-based parallelism inside pool workers
+    with threadpool_limits(limits=n_threads), parallel_config(backend='threading', n_jobs=n_threads):
+        model.fit(X_train, y_train, **(fit_params or {}))
+        metrics = metric_fn(model, X_test, y_test)
+    metrics.update({
+        'WallTime': time.perf_counter() - wall_start,
+        'CPUTime': time.process_time() - cpu_start,
+        'PeakMemoryMB': _peak_memory_mb(),
+        'Threads': n_threads,
+        'model': model,
+    })
+    return name, metrics
+
+
+def _fit_task(name, model, n_threads, metric_fn, data_dir):
+    data = joblib.load(os.path.join(data_dir, 'data.joblib'), mmap_mode='r')
+    fit_params = data['fit_params'].get(name, data['fit_params'].get('__all__'))
+    return _fit_and_score(name, model, n_threads, metric_fn, data['X_train'], data['X_test'],
+                          data['y_train'], data['y_test'], fit_params)
+
+
+class TrainingScheduler:
+    """
+    Trains candidate models concurrently under one CPU budget.
+
+    Each model is fitted in its own worker process (one task per process, so
+    peak memory is per model) with its thread pools capped to its share of
+    the budget. Training data is dumped once and memory-mapped by every
+    worker. End-to-end time is bounded by the slowest model instead of the
+    sum of all of them.
+    """
+
+    def __init__(self, n_cpus=None, parallel=True):
+        self.n_cpus = n_cpus or os.cpu_count() or 1
+        self.parallel = parallel
+
+    def run(self, models, metric_fn, X_train, X_test, y_train, y_test, fit_params=None):
+        """
+        Fits every model in models ({name: estimator}) and scores it with
+        metric_fn(model, X_test, y_test) -> dict.
+        fit_params: {name: kwargs} or {'__all__': kwargs} passed to fit.
+        Returns {name: metrics + WallTime, CPUTime, PeakMemoryMB, Threads, model}.
+        """
+        fit_params = fit_params or {}
+        budget, concurrency = split_thread_budget(models, self.n_cpus)
+
+        if not self.parallel or concurrency == 1 or len(models) == 1:
+            results = {}
+            for name, model in models.items():
+                logging.info(f"Training {name} ({self.n_cpus} threads)...")
+                _, results[name] = _fit_and_score(
+                    name, model, self.n_cpus, metric_fn, X_train, X_test, y_train, y_test,
+                    fit_params.get(name, fit_params.get('__all__')))
+            return results
+
+        data_dir = tempfile.mkdtemp(prefix='acis_train_')
+        try:
+            joblib.dump({'X_train': X_train, 'X_test': X_test, 'y_train': y_train, 'y_test': y_test,
+                         'fit_params': fit_params}, os.path.join(data_dir, 'data.joblib'))
+            # Longest-running (most threads) first
+            order = sorted(models, key=lambda name: -budget[name])
+            ctx = mp.get_context('spawn')
+            with ctx.Pool(processes=concurrency, maxtasksperchild=1) as pool:
+                pending = []
+                for name in order:
+                    logging.info(f"Training {name} ({budget[name]} of {self.n_cpus} threads)...")
+                    pending.append(pool.apply_async(
+                        _fit_task, (name, models[name], budget[name], metric_fn, data_dir)))
+                results = dict(job.get() for job in pending)
+        finally:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+        return {name: results[name] for name in models}
+
+
+def widen_features(X):
+    """float64 / int64 copy of a feature frame (the pre-float32 precision)."""
+    return X.astype({col: 'int64' if pd.api.types.is_integer_dtype(dtype) else 'float64'
+                     for col, dtype in X.dtypes.items()})
+
+
+def compare_precision(models, metric_fn, X_train, X_test, y_train, y_test, n_cpus=None, parallel=True,
+                      tolerance=1e-3):
+    """
+    Fits every model in models on the float32 feature frames as given and on
+    float64 / int64 copies, and compares metrics, fit time, peak memory and
+    feature-matrix size. Relative metric differences above tolerance are
+    logged as warnings. Returns one row per model and metric.
+    """
+    scheduler = TrainingScheduler(n_cpus=n_cpus, parallel=parallel)
+    runs = {
+        'float64': (widen_features(X_train), widen_features(X_test)),
+        'float32': (X_train, X_test),
+    }
+    results = {precision: scheduler.run({name: clone(model) for name, model in models.items()}, metric_fn,
+                                        Xtr, Xte, y_train, y_test)
+               for precision, (Xtr, Xte) in runs.items()}
+    size_mb = {precision: Xtr.memory_usage(deep=True).sum() / 1024 ** 2 for precision, (Xtr, _) in runs.items()}
+
+    rows = []
+    for name in models:
+        wide, narrow = results['float64'][name], results['float32'][name]
+        for metric, value in wide.items():
+            if metric in ('WallTime', 'CPUTime', 'PeakMemoryMB', 'Threads', 'model'):
+                continue
+            diff = narrow[metric] - value
+            rows.append({'Model': name, 'Metric': metric, 'Float64': value, 'Float32': narrow[metric],
+                         'Diff': diff, 'FitTime64': wide['WallTime'], 'FitTime32': narrow['WallTime'],
+                         'PeakMemoryMB64': wide['PeakMemoryMB'], 'PeakMemoryMB32': narrow['PeakMemoryMB'],
+                         'TrainMB64': size_mb['float64'], 'TrainMB32': size_mb['float32']})
+            if abs(diff) > tolerance * max(abs(value), 1.0):
+                logging.warning(f"{name} - {metric} changed by {diff:+.6f} with float32 features")
+    logging.info(f"Feature matrix {size_mb['float64']:.1f} MB -> {size_mb['float32']:.1f} MB with float32")
+    return pd.DataFrame(rows)
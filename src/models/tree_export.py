@@ -0,0 +1,301 @@
+import os
+import sys
+import json
+import time
+import argparse
+import logging
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Flat node arrays written by export_trees, one .npy file each
+NODE_ARRAYS = ['feature', 'threshold', 'left', 'right', 'value', 'default_left', 'roots', 'children']
+
+# Inverse link applied to the summed XGBoost margin, per objective
+XGB_LINKS = {
+    'binary:logistic': 'logistic',
+    'reg:logistic': 'logistic',
+    'reg:squarederror': 'identity',
+    'reg:absoluteerror': 'identity',
+    'reg:pseudohubererror': 'identity',
+    'reg:tweedie': 'exp',
+    'reg:gamma': 'exp',
+    'count:poisson': 'exp',
+}
+
+
+def _xgb_booster(model):
+    """(Booster limited to the best iteration, objective) of an XGBoost sklearn model, Booster or BoosterModel."""
+    import xgboost as xgb
+    if isinstance(model, xgb.Booster):
+        booster, best = model, None
+    elif hasattr(model, 'booster') and isinstance(model.booster, xgb.Booster):  # BoosterModel
+        booster, best = model.booster, model.best_iteration
+    else:
+        booster = model.get_booster()
+        best = getattr(model, 'best_iteration', None) if getattr(model, 'early_stopping_rounds', None) else None
+    if best is not None:
+        booster = booster[:best + 1]
+    return booster
+
+
+def _flatten_xgboost(model):
+    booster = _xgb_booster(model)
+    dump = json.loads(booster.save_raw('json'))
+    learner = dump['learner']
+    if learner['gradient_booster']['name'] != 'gbtree':
+        raise ValueError(f"Unsupported booster {learner['gradient_booster']['name']!r}")
+    objective = learner['objective']['name']
+    if objective not in XGB_LINKS:
+        raise ValueError(f"Unsupported objective {objective!r}")
+
+    feature, threshold, left, right, value, default_left, roots = [], [], [], [], [], [], []
+    offset, max_depth = 0, 0
+    for tree in learner['gradient_booster']['model']['trees']:
+        if any(tree['split_type']):
+            raise ValueError("Categorical splits cannot be exported; train on encoded codes instead")
+        lc = np.asarray(tree['left_children'], dtype=np.int32)
+        rc = np.asarray(tree['right_children'], dtype=np.int32)
+        is_leaf = lc < 0
+        cond = np.asarray(tree['split_conditions'], dtype=np.float32)
+        feature.append(np.where(is_leaf, -1, tree['split_indices']).astype(np.int32))
+        threshold.append(np.where(is_leaf, 0, cond).astype(np.float32))
+        left.append(np.where(is_leaf, -1, lc + offset).astype(np.int32))
+        right.append(np.where(is_leaf, -1, rc + offset).astype(np.int32))
+        value.append(np.where(is_leaf, cond, 0).astype(np.float64))
+        default_left.append(np.asarray(tree['default_left'], dtype=bool))
+        roots.append(offset)
+        max_depth = max(max_depth, _depth(lc, rc))
+        offset += len(lc)
+
+    base_score = float(str(learner['learner_model_param']['base_score']).strip('[]'))
+    link = XGB_LINKS[objective]
+    if link == 'logistic':
+        base_margin = np.log(base_score / (1 - base_score))
+    elif link == 'exp':
+        base_margin = np.log(base_score)
+    else:
+        base_margin = base_score
+    meta = {'kind': 'xgboost', 'objective': objective, 'link': link, 'aggregate': 'sum',
+            'base_margin': float(base_margin), 'split': 'lt', 'classifier': link == 'logistic',
+            'n_features': int(learner['learner_model_param']['num_feature']),
+            'feature_names': booster.feature_names, 'max_depth': max_depth}
+    arrays = [feature, threshold, left, right, value, default_left]
+    return [np.concatenate(a) for a in arrays] + [np.asarray(roots, dtype=np.int32)], meta
+
+
+def _flatten_sklearn_forest(model):
+    classifier = hasattr(model, 'classes_')
+    if classifier and len(model.classes_) != 2:
+        raise ValueError("Only binary classifiers can be exported")
+    feature, threshold, left, right, value, default_left, roots = [], [], [], [], [], [], []
+    offset, max_depth = 0, 0
+    for estimator in model.estimators_:
+        tree = estimator.tree_
+        is_leaf = tree.children_left < 0
+        if classifier:
+            counts = tree.value[:, 0, :]
+            node_value = counts[:, 1] / counts.sum(axis=1)
+        else:
+            node_value = tree.value[:, 0, 0]
+        missing_left = getattr(tree, 'missing_go_to_left', None)
+        feature.append(np.where(is_leaf, -1, tree.feature).astype(np.int32))
+        threshold.append(np.where(is_leaf, 0, tree.threshold).astype(np.float64))
+        left.append(np.where(is_leaf, -1, tree.children_left + offset).astype(np.int32))
+        right.append(np.where(is_leaf, -1, tree.children_right + offset).astype(np.int32))
+        value.append(np.where(is_leaf, node_value, 0).astype(np.float64))
+        default_left.append(np.asarray(missing_left, dtype=bool) if missing_left is not None
+                            else np.ones(tree.node_count, dtype=bool))
+        roots.append(offset)
+        max_depth = max(max_depth, int(tree.max_depth))
+        offset += tree.node_count
+
+    names = getattr(model, 'feature_names_in_', None)
+    meta = {'kind': 'sklearn_forest', 'objective': 'classification' if classifier else 'regression',
+            'link': 'identity', 'aggregate': 'mean', 'base_margin': 0.0, 'split': 'le',
+            'classifier': classifier, 'n_features': int(model.n_features_in_),
+            'feature_names': list(names) if names is not None else None, 'max_depth': max_depth}
+    arrays = [feature, threshold, left, right, value, default_left]
+    return [np.concatenate(a) for a in arrays] + [np.asarray(roots, dtype=np.int32)], meta
+
+
+def _depth(left, right):
+    depth, frontier = 0, [0]
+    while True:
+        frontier = [c for n in frontier for c in (left[n], right[n]) if c >= 0]
+        if not frontier:
+            return depth
+        depth += 1
+
+
+def child_table(feature, left, right):
+    """
+    Next-node table of the predictor: children[2 * node + went_right]. Leaves
+    point to themselves so finished rows stay put while deeper trees advance.
+    """
+    leaf = np.asarray(feature) < 0
+    nodes = np.arange(len(leaf), dtype=np.int32)
+    return np.column_stack([np.where(leaf, nodes, left), np.where(leaf, nodes, right)]).ravel().astype(np.int32)
+
+
+def flatten_trees(model):
+    """
+    Flattens a fitted RandomForest (sklearn) or XGBoost model into node arrays.
+    Returns ({name: array} for NODE_ARRAYS, meta dict).
+    """
+    if hasattr(model, 'estimators_') and all(hasattr(e, 'tree_') for e in model.estimators_):
+        arrays, meta = _flatten_sklearn_forest(model)
+    else:
+        arrays, meta = _flatten_xgboost(model)
+    meta['n_trees'] = int(len(arrays[-1]))
+    meta['n_nodes'] = int(len(arrays[0]))
+    arrays.append(child_table(arrays[0], arrays[2], arrays[3]))
+    return dict(zip(NODE_ARRAYS, arrays)), meta
+
+
+def export_trees(model, output_dir):
+    """Writes the flattened trees as contiguous .npy files plus meta.json to output_dir."""
+    arrays, meta = flatten_trees(model)
+    os.makedirs(output_dir, exist_ok=True)
+    for name, arr in arrays.items():
+        np.save(os.path.join(output_dir, f'{name}.npy'), np.ascontiguousarray(arr))
+    with open(os.path.join(output_dir, 'meta.json'), 'w') as f:
+        json.dump(meta, f, indent=2)
+    logging.info(f"Exported {meta['n_trees']} trees ({meta['n_nodes']:,} nodes, depth {meta['max_depth']}) "
+                 f"to {output_dir}")
+    return output_dir
+
+
+class TreeEnsemblePredictor:
+    """
+    NumPy-only evaluator for exported tree ensembles.
+
+    All trees advance one level per step for a block of rows at once
+    (node indices of shape rows x trees), so the Python loop runs max_depth
+    times per block regardless of the number of trees. Comparisons are made
+    in float32 like both libraries, with missing values following each
+    node's default direction. Mirrors predict / predict_proba of the
+    original model.
+    """
+
+    def __init__(self, arrays, meta, block_rows=4096):
+        for name in NODE_ARRAYS:
+            setattr(self, name, arrays.get(name))
+        self.meta = meta
+        self.block_rows = block_rows
+        self.feature_names_in_ = np.array(meta['feature_names']) if meta.get('feature_names') else None
+        if self.children is None:
+            # Exports written before children.npy existed
+            self.children = child_table(self.feature, self.left, self.right)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """Loads an export directory; arrays are memory-mapped so loading is near-instant."""
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        arrays = {name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r' if mmap else None)
+                  for name in NODE_ARRAYS if os.path.exists(os.path.join(path, f'{name}.npy'))}
+        return cls(arrays, meta)
+
+    def _as_matrix(self, X):
+        if isinstance(X, pd.DataFrame):
+            if self.feature_names_in_ is not None:
+                X = X[list(self.feature_names_in_)]
+            X = X.to_numpy(dtype=np.float32)
+        return np.asarray(X, dtype=np.float32)
+
+    def _raw(self, X):
+        X = self._as_matrix(X)
+        n_trees = len(self.roots)
+        out = np.empty(len(X))
+        lt = self.meta['split'] == 'lt'
+        for start in range(0, len(X), self.block_rows):
+            block = X[start:start + self.block_rows]
+            rows = np.arange(len(block))[:, None]
+            node = np.broadcast_to(self.roots, (len(block), n_trees)).copy()
+            has_nan = np.isnan(block).any()
+            for _ in range(self.meta['max_depth']):
+                feature = self.feature[node]
+                if (feature < 0).all():
+                    break
+                # Leaves carry feature -1: they read the last column but never move
+                x = block[rows, feature]
+                went_right = x >= self.threshold[node] if lt else x > self.threshold[node]
+                if has_nan:
+                    went_right = np.where(np.isnan(x), ~self.default_left[node], went_right)
+                node = self.children[2 * node + went_right]
+            leaf_values = self.value[node]
+            agg = leaf_values.mean(axis=1) if self.meta['aggregate'] == 'mean' else leaf_values.sum(axis=1)
+            out[start:start + len(block)] = agg
+        return out + self.meta['base_margin']
+
+    def _transform(self, raw):
+        link = self.meta['link']
+        if link == 'logistic':
+            return 1.0 / (1.0 + np.exp(-raw))
+        if link == 'exp':
+            return np.exp(raw)
+        return raw
+
+    def predict_proba(self, X):
+        p = self._transform(self._raw(X))
+        return np.column_stack([1 - p, p])
+
+    def predict(self, X):
+        pred = self._transform(self._raw(X))
+        if self.meta['classifier']:
+            return (pred >= 0.5).astype(int)
+        return pred
+
+
+def load_model(path):
+    """Loads a scoring model: an exported tree directory, or anything joblib-saved."""
+    if os.path.isdir(path) and os.path.exists(os.path.join(path, 'meta.json')):
+        return TreeEnsemblePredictor.load(path)
+    import joblib
+    return joblib.load(path)
+
+
+def verify_export(model, predictor, X, atol=1e-5, rtol=1e-5):
+    """
+    Compares the exported predictor with the original model on X.
+    Returns max absolute difference and whether it is within tolerance.
+    """
+    if predictor.meta['classifier']:
+        expected, actual = model.predict_proba(X)[:, 1], predictor.predict_proba(X)[:, 1]
+    else:
+        expected, actual = np.asarray(model.predict(X), dtype=float), predictor.predict(X)
+    diff = float(np.max(np.abs(expected - actual))) if len(X) else 0.0
+    ok = bool(np.allclose(expected, actual, atol=atol, rtol=rtol))
+    logging.info(f"Export check on {len(X):,} rows: max abs diff {diff:.3g} ({'OK' if ok else 'MISMATCH'})")
+    return {'MaxAbsDiff': diff, 'Match': ok}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export a saved tree model to NumPy arrays.")
+    parser.add_argument('model', help="joblib RandomForest / XGBoost model")
+    parser.add_argument('output', help="export directory")
+    parser.add_argument('--verify', default=None,
+                        help="Parquet file of transformed features (or raw rows plus --transformer) to check against")
+    parser.add_argument('--transformer', default=None)
+    args = parser.parse_args()
+
+    import joblib
+    model = joblib.load(args.model)
+    export_trees(model, args.output)
+    if args.verify:
+        X = pd.read_parquet(args.verify)
+        if args.transformer:
+            from src.features.preprocessing import FeatureTransformer
+            X = FeatureTransformer.load(args.transformer).transform(X)
+        start = time.perf_counter()
+        predictor = TreeEnsemblePredictor.load(args.output)
+        logging.info(f"Loaded export in {(time.perf_counter() - start) * 1000:.1f}ms")
+        verify_export(model, predictor, X)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+import os
+import json
+import time
+import logging
+import numpy as np
+import pandas as pd
+from scipy.stats import randint, uniform, loguniform
+from sklearn.base import clone
+from sklearn.experimental import enable_halving_search_cv  # noqa: F401
+from sklearn.model_selection import HalvingRandomSearchCV
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Random-search distributions per model name. Models without an entry
+# (e.g. plain LinearRegression) have nothing to tune and are skipped.
+SEARCH_SPACES = {
+    'LogisticRegression': {
+        'C': loguniform(1e-3, 1e2),
+    },
+    'RandomForest': {
+        'max_depth': [None, 6, 10, 16, 24],
+        'min_samples_leaf': randint(1, 50),
+        'max_features': ['sqrt', 'log2', 0.3, 0.6],
+    },
+    'XGBoost': {
+        'learning_rate': loguniform(0.02, 0.3),
+        'max_depth': randint(3, 10),
+        'min_child_weight': loguniform(1, 50),
+        'subsample': uniform(0.5, 0.5),
+        'colsample_bytree': uniform(0.5, 0.5),
+        'reg_lambda': loguniform(1e-2, 10),
+    },
+}
+
+# Budget that grows between halving rounds: boosting rounds for gradient
+# boosting, training rows for everything else.
+RESOURCES = {
+    'XGBoost': {'resource': 'n_estimators', 'min_resources': 25, 'max_resources': 800},
+}
+DEFAULT_RESOURCE = {'resource': 'n_samples', 'min_resources': 'exhaust', 'max_resources': 'auto'}
+
+
+def successive_halving_search(name, model, X, y, scoring, n_candidates=32, factor=3, cv=3,
+                              n_jobs=None, random_state=42):
+    """
+    Successive-halving random search over SEARCH_SPACES[name].
+
+    Every candidate starts on a small budget (rows, or boosting rounds for
+    XGBoost); only the best 1/factor move on to the next round with factor
+    times the budget, so poor configurations are pruned after cheap fits.
+    Candidates within a round are cross-validated in parallel on n_jobs
+    workers, each estimator restricted to one thread.
+    Returns the fitted HalvingRandomSearchCV.
+    """
+    n_jobs = n_jobs or os.cpu_count() or 1
+    estimator = clone(model)
+    if 'n_jobs' in estimator.get_params():
+        estimator.set_params(n_jobs=1)
+    budget = RESOURCES.get(name, DEFAULT_RESOURCE)
+    if budget['resource'] != 'n_samples':
+        max_res = budget['max_resources']
+        n_candidates = min(n_candidates, max(1, max_res // budget['min_resources']))
+
+    search = HalvingRandomSearchCV(
+        estimator, SEARCH_SPACES[name], n_candidates=n_candidates, factor=factor, cv=cv,
+        scoring=scoring, n_jobs=n_jobs, random_state=random_state, refit=True,
+        error_score=np.nan, **budget)
+
+    start = time.perf_counter()
+    search.fit(X, y)
+    logging.info(f"{name}: {len(search.cv_results_['params'])} fits over {search.n_iterations_} rounds "
+                 f"in {time.perf_counter() - start:.1f}s, best {scoring}={search.best_score_:.4f} "
+                 f"with {search.best_params_}")
+    return search
+
+
+def save_search_results(search, output_dir, prefix):
+    """
+    Writes the per-candidate results ({prefix}_search.csv) and the winning
+    configuration ({prefix}_best_params.json) to output_dir.
+    Returns (results path, params path).
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    results = pd.DataFrame(search.cv_results_)
+    results = results.drop(columns=['params']).sort_values(['iter', 'rank_test_score'])
+    results_path = os.path.join(output_dir, f'{prefix}_search.csv')
+    results.to_csv(results_path, index=False)
+
+    params = {k: (v.item() if isinstance(v, np.generic) else v) for k, v in search.best_params_.items()}
+    params_path = os.path.join(output_dir, f'{prefix}_best_params.json')
+    with open(params_path, 'w') as f:
+        json.dump({'params': params, 'score': float(search.best_score_),
+                   'scoring': str(search.scoring), 'resource': search.resource,
+                   'n_iterations': int(search.n_iterations_)}, f, indent=2)
+    return results_path, params_path
+
+
+def tune_models(models, X, y, scoring, output_dir=None, prefix='', model_names=None,
+                n_candidates=32, factor=3, cv=3, n_jobs=None, random_state=42):
+    """
+    Runs successive_halving_search for every model that has a search space and
+    returns ({name: unfitted estimator with the best parameters}, {name: search}).
+    Results are saved to output_dir when given.
+    """
+    tuned, searches = {}, {}
+    for name in model_names or list(models):
+        if name not in SEARCH_SPACES:
+            logging.info(f"{name}: no search space, keeping fixed hyperparameters")
+            continue
+        search = successive_halving_search(name, models[name], X, y, scoring, n_candidates=n_candidates,
+                                           factor=factor, cv=cv, n_jobs=n_jobs, random_state=random_state)
+        # best_params_ includes the final round's resource (e.g. XGBoost's n_estimators)
+        best = clone(models[name]).set_params(**search.best_params_)
+        tuned[name], searches[name] = best, search
+        if output_dir:
+            save_search_results(search, output_dir, f'{prefix}{name}')
+    return tuned, searches
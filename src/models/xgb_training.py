@@ -0,0 +1,227 @@
+import os
+import shutil
+import hashlib
+import time
+import logging
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+from sklearn.model_selection import train_test_split
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Histogram training defaults shared by the severity and claim-probability models
+HIST_PARAMS = {
+    'tree_method': 'hist',
+    'max_bin': 256,
+    'learning_rate': 0.1,
+    'max_depth': 6,
+    'seed': 42,
+}
+
+
+def frame_fingerprint(*arrays):
+    """Content hash of dataframes/series/arrays (values, columns and dtypes)."""
+    h = hashlib.sha1()
+    for arr in arrays:
+        if arr is None:
+            h.update(b'none')
+        elif isinstance(arr, (pd.DataFrame, pd.Series)):
+            h.update(pd.util.hash_pandas_object(arr, index=False).to_numpy().tobytes())
+            cols = arr.columns if isinstance(arr, pd.DataFrame) else [arr.name]
+            dtypes = arr.dtypes if isinstance(arr, pd.DataFrame) else [arr.dtype]
+            h.update(repr(list(zip(cols, map(str, dtypes)))).encode())
+        else:
+            arr = np.ascontiguousarray(arr)
+            h.update(arr.tobytes())
+            h.update(repr((arr.shape, str(arr.dtype))).encode())
+    return h.hexdigest()
+
+
+def _entry_size(path):
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(d, f)) for d, _, files in os.walk(path) for f in files)
+    return os.path.getsize(path)
+
+
+def touch_cache_entry(path):
+    """Marks a cache entry (file or directory) as just used; prune_cache evicts by modification time."""
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def prune_cache(root, max_bytes, keep=()):
+    """
+    Least-recently-used eviction for a content-keyed cache directory: deletes
+    the entries of root (files or subdirectories) with the oldest
+    modification time until the rest fit in max_bytes. Entries in keep (e.g.
+    the one just written) and in-progress '.tmp' files are never deleted.
+    Returns the number of entries removed.
+    """
+    if max_bytes is None or not os.path.isdir(root):
+        return 0
+    keep = {os.path.abspath(path) for path in keep}
+    entries = []
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        try:
+            entries.append((os.path.getmtime(path), _entry_size(path), path))
+        except OSError:
+            continue
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        if os.path.abspath(path) in keep or '.tmp' in os.path.basename(path):
+            continue
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+        total -= size
+        removed += 1
+    if removed:
+        logging.info(f"Evicted {removed} least recently used entries from {root}")
+    return removed
+
+
+def as_native_categorical(X, categorical_cols=None, categories=None):
+    """
+    Converts categorical columns (object/string, or label-encoded codes listed in
+    categorical_cols) to pandas category dtype for XGBoost's native categorical
+    splits. categories: {col: [...]} from training, so new data maps identically.
+    Returns (converted frame, categories).
+    """
+    X = X.copy()
+    cols = list(categories) if categories is not None else \
+        list(dict.fromkeys(list(categorical_cols or []) +
+                           list(X.select_dtypes(include=['object', 'string', 'category']).columns)))
+    out_categories = {}
+    for col in cols:
+        if col not in X.columns:
+            continue
+        # Codes as int64 whatever their stored width, so the category index
+        # type is the same in training and scoring
+        values = X[col].astype(np.int64) if pd.api.types.is_numeric_dtype(X[col]) else X[col]
+        if categories is not None:
+            X[col] = pd.Categorical(values, categories=categories[col])
+        else:
+            X[col] = values.astype('category')
+        out_categories[col] = list(X[col].cat.categories)
+    return X, out_categories
+
+
+class DMatrixCache:
+    """
+    Builds each training/validation QuantileDMatrix once per feature set and
+    reuses it across hyperparameter trials and refits.
+
+    Matrices are keyed by a content fingerprint of the inputs (or an explicit
+    key). The validation matrix is quantised with the training matrix as
+    reference so both share bin boundaries.
+    """
+
+    def __init__(self, max_bin=HIST_PARAMS['max_bin']):
+        self.max_bin = max_bin
+        self._matrices = {}
+
+    def get(self, X_train, y_train, X_valid=None, y_valid=None, weight=None, key=None):
+        """Returns (dtrain, dvalid); dvalid is None without validation data."""
+        key = key or frame_fingerprint(X_train, y_train, X_valid, y_valid, weight)
+        if key not in self._matrices:
+            start = time.perf_counter()
+            dtrain = xgb.QuantileDMatrix(X_train, label=y_train, weight=weight,
+                                         enable_categorical=True, max_bin=self.max_bin)
+            dvalid = None
+            if X_valid is not None:
+                dvalid = xgb.QuantileDMatrix(X_valid, label=y_valid, ref=dtrain,
+                                             enable_categorical=True, max_bin=self.max_bin)
+            self._matrices[key] = (dtrain, dvalid)
+            logging.info(f"Built QuantileDMatrix for {X_train.shape[0]:,} rows in "
+                         f"{time.perf_counter() - start:.2f}s")
+        return self._matrices[key]
+
+    def clear(self):
+        self._matrices = {}
+
+
+class BoosterModel:
+    """
+    sklearn-style predict / predict_proba on top of a trained Booster,
+    limited to the early-stopped best iteration.
+    """
+
+    def __init__(self, booster, objective, categories=None):
+        self.booster = booster
+        self.objective = objective
+        self.categories = categories or {}
+        self.feature_names_in_ = np.array(booster.feature_names or [])
+
+    @property
+    def best_iteration(self):
+        try:
+            return self.booster.best_iteration
+        except AttributeError:
+            return self.booster.num_boosted_rounds() - 1
+
+    def _dmatrix(self, X):
+        if self.categories:
+            X, _ = as_native_categorical(X, categories=self.categories)
+        return xgb.DMatrix(X, enable_categorical=True)
+
+    def _predict_raw(self, X):
+        return self.booster.predict(self._dmatrix(X), iteration_range=(0, self.best_iteration + 1))
+
+    def predict(self, X):
+        pred = self._predict_raw(X)
+        if self.objective.startswith('binary:'):
+            return (pred >= 0.5).astype(int)
+        return pred
+
+    def predict_proba(self, X):
+        p = self._predict_raw(X)
+        return np.column_stack([1 - p, p])
+
+
+def fit_hist_candidates(cache, objective, eval_metric, X_train, y_train, param_grid=None,
+                        valid_size=0.1, stratify=False, num_boost_round=1000,
+                        early_stopping_rounds=50, categorical_cols=None, weight=None):
+    """
+    Trains one booster per entry of param_grid on a cached QuantileDMatrix with
+    'hist' trees, native categorical splits and early stopping on a validation
+    split carved out of the training data.
+    Returns (best BoosterModel, trials DataFrame).
+    """
+    X_native, categories = as_native_categorical(X_train, categorical_cols)
+    split = train_test_split(X_native, y_train, *([weight] if weight is not None else []),
+                             test_size=valid_size, random_state=42,
+                             stratify=y_train if stratify else None)
+    X_tr, X_va, y_tr, y_va = split[:4]
+    w_tr = split[4] if weight is not None else None
+    dtrain, dvalid = cache.get(X_tr, y_tr, X_va, y_va, weight=w_tr)
+
+    maximize = eval_metric in ('auc', 'aucpr', 'map', 'ndcg')
+    trials, best = [], None
+    for i, overrides in enumerate(param_grid or [{}]):
+        params = {**HIST_PARAMS, 'objective': objective, 'eval_metric': eval_metric,
+                  'max_bin': cache.max_bin, **overrides}
+        start = time.perf_counter()
+        booster = xgb.train(params, dtrain, num_boost_round=num_boost_round,
+                            evals=[(dvalid, 'valid')], early_stopping_rounds=early_stopping_rounds,
+                            verbose_eval=False)
+        trials.append({'Trial': i, **overrides, 'BestIteration': booster.best_iteration,
+                       'ValidScore': booster.best_score, 'FitTime': time.perf_counter() - start})
+        better = best is None or (booster.best_score > best.best_score if maximize
+                                  else booster.best_score < best.best_score)
+        if better:
+            best = booster
+        logging.info(f"Trial {i} {overrides}: valid {eval_metric}={booster.best_score:.4f} "
+                     f"at round {booster.best_iteration}")
+
+    return BoosterModel(best, objective, categories), pd.DataFrame(trials)
@@ -18,15 +18,242 @@ import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
 import os
+import sys
 import warnings
 warnings.filterwarnings('ignore')
 
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+from src.stats.sketches import (GroupedHyperLogLog, DEFAULT_PRECISION, estimate_cardinality,
+                                precision_for_error, standard_error, sketch_path)
+
+# Value columns the report aggregates and the ones it needs exact medians of
+REPORT_VALUE_COLS = ('TotalClaims', 'TotalPremium', 'ClaimFrequency', 'ClaimSeverity')
+REPORT_MEDIAN_COLS = ('TotalClaims', 'TotalPremium')
+
+
+def _distinct(keys):
+    """Sorted distinct values of an int64 array (sort and diff; cheaper than np.unique's hash path here)."""
+    keys = np.sort(keys)
+    return keys[np.concatenate([[True], keys[1:] != keys[:-1]])] if len(keys) else keys
+
+
+def _group_codes(series):
+    """Integer codes (-1 for missing) and labels of a grouping column, ordered like groupby(sort=True)."""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        labels = pd.Categorical.from_codes(np.arange(len(series.cat.categories)), dtype=series.dtype)
+        return series.cat.codes.to_numpy(dtype=np.int64), labels
+    codes, labels = pd.factorize(series, sort=True)
+    return codes.astype(np.int64), labels
+
+
+class SegmentAggregates:
+    """
+    All per-segment statistics of the report from one grouped pass.
+
+    Rows are coded once into (Province, RiskSegment) cells, and the count,
+    sum, within-cell M2, min and max of every value column are bincount /
+    ufunc.at reductions over the cell codes. RiskSegment figures are rolled
+    up from the cells (M2 with Chan's parallel update), so the frame is
+    scanned once for all tables. The two statistics that do not add up are
+    computed directly: exact medians from one sort per column (by segment,
+    then value), and distinct policies from the sorted distinct (cell,
+    policy) pairs, reduced again to (segment, policy) pairs for the rollup.
+
+    With distinct='hll', policies are counted approximately instead, from
+    one HyperLogLog sketch per cell (built in the pass at the given
+    precision, or taken from policy_sketches persisted with the data, in
+    which case PolicyID is not read at all); segment counts are the unions
+    of their cells' sketches.
+    """
+
+    def __init__(self, df, segment_col='RiskSegment', province_col='Province', policy_col='PolicyID',
+                 value_cols=REPORT_VALUE_COLS, median_cols=REPORT_MEDIAN_COLS, distinct='exact',
+                 policy_sketches=None, precision=None):
+        self.segment_col = segment_col
+        self.province_col = province_col if province_col in df.columns else None
+        self.n_rows = len(df)
+
+        seg_codes, self.segment_labels = _group_codes(df[segment_col])
+        k_s = len(self.segment_labels)
+        if self.province_col:
+            prov_codes, self.province_labels = _group_codes(df[province_col])
+        else:
+            prov_codes, self.province_labels = np.zeros(len(df), dtype=np.int64), pd.Index([])
+        # Rows with a missing province go to an extra last row of cells: they count
+        # towards their segment but not towards the geographic table
+        k_p = len(self.province_labels) + 1
+        prov_codes = np.where(prov_codes >= 0, prov_codes, k_p - 1)
+
+        keep = seg_codes >= 0
+        seg_codes = seg_codes[keep]
+        cells = prov_codes[keep] * k_s + seg_codes
+        self.shape = (k_p, k_s)
+        n_cells = k_p * k_s
+        self.cell_rows = np.bincount(cells, minlength=n_cells).reshape(self.shape)
+        self.segment_rows = self.cell_rows.sum(axis=0)
+
+        self._cells = {}
+        self._medians = {}
+        # Row positions bucketed by segment (a handful of segments, so one mask each), shared by the medians
+        by_segment = np.concatenate([np.flatnonzero(seg_codes == code) for code in range(k_s)]
+                                    + [np.empty(0, dtype=np.int64)])
+        segment_bounds = np.concatenate([[0], np.cumsum(self.segment_rows)])
+        for col in value_cols:
+            if col not in df.columns:
+                continue
+            values = df[col].to_numpy(dtype=float, na_value=np.nan)[keep]
+            ok = ~np.isnan(values)
+            codes, v = cells[ok], values[ok]
+            count = np.bincount(codes, minlength=n_cells).astype(float)
+            total = np.bincount(codes, weights=v, minlength=n_cells)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                mean = np.where(count > 0, total / count, 0.0)
+            m2 = np.bincount(codes, weights=(v - mean[codes]) ** 2, minlength=n_cells)
+            low, high = np.full(n_cells, np.inf), np.full(n_cells, -np.inf)
+            np.minimum.at(low, codes, v)
+            np.maximum.at(high, codes, v)
+            self._cells[col] = {'count': count.reshape(self.shape), 'sum': total.reshape(self.shape),
+                                'm2': m2.reshape(self.shape), 'min': low.reshape(self.shape),
+                                'max': high.reshape(self.shape),
+                                'integer': pd.api.types.is_integer_dtype(df[col].dtype)}
+            if col in median_cols:
+                self._medians[col] = self._segment_medians(values[by_segment], segment_bounds)
+
+        self._policies = None
+        self.policy_col = policy_col
+        self.distinct = distinct
+        # Relative standard error of approximate policy counts (None when exact)
+        self.policy_error = None
+        if distinct == 'hll':
+            self._policies = self._sketch_policies(df, policy_col, cells, keep, policy_sketches, precision)
+        elif distinct != 'exact':
+            raise ValueError(f"distinct must be 'exact' or 'hll', got {distinct!r}")
+        elif policy_col in df.columns:
+            pol_codes, policies = pd.factorize(df[policy_col])
+            pol_codes = pol_codes[keep]
+            ok = pol_codes >= 0
+            n_pol = max(len(policies), 1)
+            pairs = _distinct(cells[ok] * n_pol + pol_codes[ok])
+            cell_policies = np.bincount(pairs // n_pol, minlength=n_cells)
+            segment_pairs = _distinct((pairs // n_pol) % k_s * n_pol + pairs % n_pol)
+            self._policies = {'cell': cell_policies.reshape(self.shape),
+                              'segment': np.bincount(segment_pairs // n_pol, minlength=k_s)}
+
+    def _sketch_policies(self, df, policy_col, cells, keep, sketches, precision):
+        k_p, k_s = self.shape
+        if sketches is None:
+            if policy_col not in df.columns:
+                return None
+            sketches = GroupedHyperLogLog(precision or DEFAULT_PRECISION, labels=range(k_p * k_s))
+            sketches.update_codes(cells, df[policy_col][keep])
+            registers = sketches.registers.reshape(k_p, k_s, sketches.m)
+        else:
+            # Persisted sketches are keyed by label strings; cells of provinces
+            # missing here (or missing values) fold into the missing-province row
+            registers = np.zeros((k_p, k_s, sketches.m), dtype=np.uint8)
+            key_names = sketches.key_names or [self.segment_col]
+            provinces = {str(label): i for i, label in enumerate(self.province_labels)}
+            segments = {str(label): i for i, label in enumerate(self.segment_labels)}
+            for label, row in zip(sketches.labels, sketches.registers):
+                key = dict(zip(key_names, label if isinstance(label, tuple) else (label,)))
+                segment = segments.get(key.get(self.segment_col))
+                if segment is None:
+                    continue
+                province = provinces.get(key.get(self.province_col), k_p - 1)
+                np.maximum(registers[province, segment], row, out=registers[province, segment])
+        self.policy_error = standard_error(sketches.precision)
+        return {'cell': np.rint(estimate_cardinality(registers)).astype(np.int64),
+                'segment': np.rint(estimate_cardinality(registers.max(axis=0))).astype(np.int64)}
+
+    @staticmethod
+    def _segment_medians(grouped, bounds):
+        # grouped holds the column's values bucketed by segment; sorting each bucket
+        # (NaNs last) makes the whole column one sort, and the medians are read off it
+        medians = np.full(len(bounds) - 1, np.nan)
+        for i, (start, stop) in enumerate(zip(bounds[:-1], bounds[1:])):
+            block = np.sort(grouped[start:stop])
+            n = len(block) - np.isnan(block).sum()
+            if n:
+                medians[i] = (block[(n - 1) // 2] + block[n // 2]) / 2
+        return medians
+
+    def _stat(self, level, col, stat):
+        if stat == 'size':
+            return self.segment_rows if level == 'segment' else self.cell_rows
+        if stat == 'nunique':
+            if col != self.policy_col or self._policies is None:
+                raise KeyError(col)
+            return self._policies[level]
+        if stat == 'median':
+            if level != 'segment' or col not in self._medians:
+                raise KeyError(f"No {level} median for {col}")
+            return self._medians[col]
+
+        acc = self._cells[col]
+        count, total = acc['count'], acc['sum']
+        low, high, m2 = acc['min'], acc['max'], acc['m2']
+        if level == 'segment':
+            with np.errstate(divide='ignore', invalid='ignore'):
+                cell_mean = np.where(count > 0, total / count, 0.0)
+            count, total = count.sum(axis=0), total.sum(axis=0)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                mean = np.where(count > 0, total / count, 0.0)
+            m2 = m2.sum(axis=0) + (acc['count'] * (cell_mean - mean) ** 2).sum(axis=0)
+            low, high = low.min(axis=0), high.max(axis=0)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            if stat == 'count':
+                return count.astype(np.int64)
+            if stat == 'sum':
+                return total
+            if stat == 'mean':
+                return np.where(count > 0, total / count, np.nan)
+            if stat == 'std':
+                return np.where(count > 1, np.sqrt(m2 / (count - 1)), np.nan)
+            if stat in ('min', 'max'):
+                return np.where(count > 0, low if stat == 'min' else high, np.nan)
+        raise ValueError(f"Unknown statistic: {stat}")
+
+    def table(self, by='segment', **named):
+        """
+        One row per observed group, like groupby(...).agg(name=(column, stat)).
+        by: 'segment' (RiskSegment) or 'cell' (Province, RiskSegment).
+        Statistics: size, count, sum, mean, median (segments only), std,
+        min, max and nunique (policy column).
+        """
+        if by == 'segment':
+            index = np.flatnonzero(self.segment_rows > 0)
+            out = {self.segment_col: self.segment_labels[index]}
+        elif by == 'cell':
+            if self.province_col is None:
+                raise KeyError("Province column not available")
+            # Row-major nonzero: sorted by province, then segment; the missing-province row is dropped
+            index = np.nonzero(self.cell_rows[:-1] > 0)
+            out = {self.province_col: self.province_labels[index[0]],
+                   self.segment_col: self.segment_labels[index[1]]}
+        else:
+            raise ValueError(f"Unknown grouping level: {by}")
+        for name, (col, stat) in named.items():
+            values = self._stat(by, col, stat)[index]
+            # Integer columns keep integer sums and extremes, as in pandas
+            if stat in ('sum', 'min', 'max') and self._cells[col]['integer'] and not np.isnan(values).any():
+                values = values.astype(np.int64)
+            out[name] = values
+        return pd.DataFrame(out)
+
 
 class SegmentReporter:
-    """Generate comprehensive segment analysis and visualizations"""
+    """Generate comprehensive segment analysis and visualizations
     
-    def __init__(self, output_dir='outputs/segments'):
+    distinct='hll' counts policies with HyperLogLog sketches at roughly
+    hll_error relative standard error instead of exactly; generate_report
+    then reuses the sketches saved next to the processed data when present.
+    """
+    
+    def __init__(self, output_dir='outputs/segments', distinct='exact', hll_error=0.01):
         self.output_dir = output_dir
+        self.distinct = distinct
+        self.hll_error = hll_error
         os.makedirs(output_dir, exist_ok=True)
         
         # Set visualization style
@@ -41,17 +268,33 @@ class SegmentReporter:
         print(f"  Loaded {len(df):,} rows × {len(df.columns)} columns")
         return df
     
-    def calculate_segment_counts(self, df):
+    def aggregate(self, df, policy_sketches=None):
+        """Single grouped pass over df that every segment table is built from"""
+        aggregates = SegmentAggregates(df, distinct=self.distinct, policy_sketches=policy_sketches,
+                                       precision=precision_for_error(self.hll_error))
+        if self.distinct == 'hll' and aggregates.policy_error is not None:
+            print(f"  Policy counts: HyperLogLog estimates (±{aggregates.policy_error:.1%})")
+        return aggregates
+    
+    def load_policy_sketches(self, data_path):
+        """Policy sketches persisted next to the processed data, or None"""
+        path = sketch_path(data_path)
+        if not os.path.exists(path):
+            print(f"  No policy sketches at {path}; counting from the data")
+            return None
+        print(f"Loading policy sketches from {path}...")
+        return GroupedHyperLogLog.load(path)
+    
+    def calculate_segment_counts(self, df, aggregates=None):
         """Calculate customer counts per segment"""
         print("\nCalculating segment counts...")
         
-        segment_counts = df['RiskSegment'].value_counts().sort_index()
-        segment_pct = (segment_counts / len(df) * 100).round(1)
-        
+        agg = aggregates if aggregates is not None else self.aggregate(df)
+        # Like value_counts: unobserved categories are listed with a zero count
         summary = pd.DataFrame({
-            'Segment': segment_counts.index,
-            'Count': segment_counts.values,
-            'Percentage': segment_pct.values
+            'Segment': agg.segment_labels,
+            'Count': agg.segment_rows,
+            'Percentage': (agg.segment_rows / agg.n_rows * 100).round(1)
         })
         
         print("\nSegment Distribution:")
@@ -59,15 +302,16 @@ class SegmentReporter:
         
         return summary
     
-    def calculate_loss_ratio_by_segment(self, df):
+    def calculate_loss_ratio_by_segment(self, df, aggregates=None):
         """Calculate loss ratios by segment"""
         print("\nCalculating loss ratio by segment...")
         
-        segment_metrics = df.groupby('RiskSegment').agg({
-            'TotalClaims': 'sum',
-            'TotalPremium': 'sum',
-            'PolicyID': 'nunique'
-        }).reset_index()
+        agg = aggregates if aggregates is not None else self.aggregate(df)
+        segment_metrics = agg.table(
+            TotalClaims=('TotalClaims', 'sum'),
+            TotalPremium=('TotalPremium', 'sum'),
+            PolicyID=('PolicyID', 'nunique')
+        )
         
         segment_metrics['LossRatio'] = (
             segment_metrics['TotalClaims'] / segment_metrics['TotalPremium']
@@ -91,15 +335,19 @@ class SegmentReporter:
         
         return segment_metrics
     
-    def calculate_claims_distribution(self, df):
+    def calculate_claims_distribution(self, df, aggregates=None):
         """Calculate claims frequency and severity by segment"""
         print("\nCalculating claims distribution by segment...")
         
-        claims_dist = df.groupby('RiskSegment').agg({
-            'ClaimFrequency': 'mean',
-            'ClaimSeverity': 'mean',
-            'TotalClaims': ['count', 'sum', 'mean', 'median']
-        }).reset_index()
+        agg = aggregates if aggregates is not None else self.aggregate(df)
+        claims_dist = agg.table(
+            ClaimFrequency=('ClaimFrequency', 'mean'),
+            ClaimSeverity=('ClaimSeverity', 'mean'),
+            NumRecords=('TotalClaims', 'count'),
+            TotalClaims=('TotalClaims', 'sum'),
+            AvgClaims=('TotalClaims', 'mean'),
+            MedianClaims=('TotalClaims', 'median')
+        )
         
         claims_dist.columns = [
             'Segment', 'ClaimFrequency', 'AvgClaimSeverity',
@@ -116,13 +364,14 @@ class SegmentReporter:
         
         return claims_dist
     
-    def calculate_average_premium(self, df):
+    def calculate_average_premium(self, df, aggregates=None):
         """Calculate average premium by segment"""
         print("\nCalculating average premium by segment...")
         
-        premium_stats = df.groupby('RiskSegment')['TotalPremium'].agg([
-            'count', 'mean', 'median', 'std', 'min', 'max'
-        ]).reset_index()
+        agg = aggregates if aggregates is not None else self.aggregate(df)
+        premium_stats = agg.table(**{
+            stat: ('TotalPremium', stat) for stat in ['count', 'mean', 'median', 'std', 'min', 'max']
+        })
         
         premium_stats.columns = [
             'Segment', 'Count', 'Mean', 'Median', 'StdDev', 'Min', 'Max'
@@ -136,7 +385,7 @@ class SegmentReporter:
         
         return premium_stats
     
-    def compare_geographic_risk(self, df):
+    def compare_geographic_risk(self, df, aggregates=None):
         """Compare risk across provinces and segments"""
         print("\nComparing geographic risk...")
         
@@ -144,11 +393,13 @@ class SegmentReporter:
             print("  Province column not found, skipping geographic analysis")
             return None
         
-        geo_risk = df.groupby(['Province', 'RiskSegment']).agg({
-            'TotalClaims': 'sum',
-            'TotalPremium': 'sum',
-            'PolicyID': 'nunique'
-        }).reset_index()
+        agg = aggregates if aggregates is not None else self.aggregate(df)
+        geo_risk = agg.table(
+            by='cell',
+            TotalClaims=('TotalClaims', 'sum'),
+            TotalPremium=('TotalPremium', 'sum'),
+            PolicyID=('PolicyID', 'nunique')
+        )
         
         geo_risk['LossRatio'] = (
             geo_risk['TotalClaims'] / geo_risk['TotalPremium']
@@ -326,17 +577,20 @@ class SegmentReporter:
         
         # Load data
         df = self.load_data(data_path)
+        policy_sketches = self.load_policy_sketches(data_path) if self.distinct == 'hll' else None
         
         # Calculate metrics
         print("\n" + "="*80)
         print("CALCULATING SEGMENT METRICS")
         print("="*80)
         
-        segment_counts = self.calculate_segment_counts(df)
-        segment_metrics = self.calculate_loss_ratio_by_segment(df)
-        claims_dist = self.calculate_claims_distribution(df)
-        premium_stats = self.calculate_average_premium(df)
-        geo_risk = self.compare_geographic_risk(df)
+        # One grouped pass; every table below is read off its aggregates
+        aggregates = self.aggregate(df, policy_sketches)
+        segment_counts = self.calculate_segment_counts(df, aggregates)
+        segment_metrics = self.calculate_loss_ratio_by_segment(df, aggregates)
+        claims_dist = self.calculate_claims_distribution(df, aggregates)
+        premium_stats = self.calculate_average_premium(df, aggregates)
+        geo_risk = self.compare_geographic_risk(df, aggregates)
         
         # Generate visualizations
         print("\n" + "="*80)
@@ -0,0 +1,427 @@
+import os
+import sys
+import json
+import time
+import math
+import random
+import argparse
+import logging
+import threading
+import http.client
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+import numpy as np
+import pandas as pd
+from threadpoolctl import threadpool_limits
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+from src.features.preprocessing import FeatureTransformer, matrix_dtype
+from src.models.tree_export import load_model, TreeEnsemblePredictor
+from src.models.registry import registered_scoring_paths
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+DEFAULT_TRANSFORMER = os.path.join('models', 'feature_transformer.joblib')
+
+
+def _to_number(value):
+    """Scalar pd.to_numeric(errors='coerce'): numbers and numeric strings as float, anything else NaN."""
+    if isinstance(value, (bool, int, float, np.number)):
+        return float(value)
+    if isinstance(value, str):
+        try:
+            return float(value)
+        except ValueError:
+            return np.nan
+    return np.nan
+
+
+class LatencyHistogram:
+    """
+    Thread-safe latency histogram with log-spaced millisecond buckets
+    (about 5% relative resolution from 10us to 60s), so percentiles are
+    cheap to record and to query at any time.
+    """
+
+    def __init__(self, min_ms=0.01, max_ms=60_000.0, growth=1.05):
+        self.min_ms = min_ms
+        self.log_growth = math.log(growth)
+        n = int(math.ceil(math.log(max_ms / min_ms) / self.log_growth)) + 2
+        self.upper_ms = min_ms * np.exp(self.log_growth * np.arange(n))
+        self.counts = np.zeros(n, dtype=np.int64)
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, ms):
+        i = 0 if ms <= self.min_ms else int(math.ceil(math.log(ms / self.min_ms) / self.log_growth))
+        with self._lock:
+            self.counts[min(i, len(self.counts) - 1)] += 1
+            self.total_ms += ms
+            self.max_ms = max(self.max_ms, ms)
+
+    def percentile(self, q):
+        """Upper bucket bound below which q percent of the recorded latencies fall."""
+        with self._lock:
+            n = self.counts.sum()
+            if n == 0:
+                return float('nan')
+            i = int(np.searchsorted(np.cumsum(self.counts), math.ceil(n * q / 100)))
+            return float(min(self.upper_ms[i], self.max_ms))
+
+    def snapshot(self):
+        n = int(self.counts.sum())
+        nonzero = np.flatnonzero(self.counts)
+        return {
+            'count': n,
+            'mean_ms': self.total_ms / n if n else float('nan'),
+            'p50_ms': self.percentile(50),
+            'p90_ms': self.percentile(90),
+            'p99_ms': self.percentile(99),
+            'max_ms': self.max_ms,
+            'buckets': [[round(float(self.upper_ms[i]), 4), int(self.counts[i])] for i in nonzero],
+        }
+
+
+def _forest_trees(model):
+    """Low-level sklearn tree objects of a fitted forest, or None for other models."""
+    estimators = getattr(model, 'estimators_', None)
+    if estimators is None or not all(hasattr(e, 'tree_') for e in estimators):
+        return None
+    return [e.tree_ for e in estimators]
+
+
+def fast_predict_fn(model, columns, proba=False):
+    """
+    Returns f(X: float64 ndarray) -> 1-d predictions (P(class 1) if proba).
+
+    For sklearn forests the trees are evaluated directly on a float32 array,
+    skipping per-call input validation and the joblib dispatch that dominate
+    single-row latency; averaged per-tree class fractions (or values) equal
+    predict_proba / predict. Exported trees (TreeEnsemblePredictor) take the
+    array directly; other models go through their own API.
+    """
+    trees = _forest_trees(model)
+    if trees is not None:
+        def predict(X):
+            X32 = np.ascontiguousarray(X, dtype=np.float32)
+            total = 0.0
+            for tree in trees:
+                out = tree.predict(X32)
+                total = total + (out / out.sum(axis=1, keepdims=True) if proba else out)
+            return total[:, 1] / len(trees) if proba else total[:, 0] / len(trees)
+        return predict
+    if isinstance(model, TreeEnsemblePredictor):
+        # Exported trees take the feature matrix as is (columns are in training order)
+        return (lambda X: model.predict_proba(X)[:, 1]) if proba else model.predict
+    if proba:
+        return lambda X: model.predict_proba(pd.DataFrame(X, columns=columns))[:, 1]
+    return lambda X: np.asarray(model.predict(pd.DataFrame(X, columns=columns)), dtype=float)
+
+
+class QuoteScorer:
+    """
+    In-process quote pricing with everything loaded once.
+
+    The feature transformer and both models are loaded at construction and
+    warmed up, so per-request work is only: map the quote fields to a feature
+    row with precomputed dictionaries (no per-call pandas encoding), one
+    pass of each model over the micro-batch (see fast_predict_fn), and the
+    premium formula.
+    Model thread pools are pinned to one thread; concurrency comes from the
+    server's request threads. The pin is process-wide (threadpoolctl limits
+    every BLAS/OpenMP pool) and lasts until close(), or the end of a with
+    block on the scorer, restores the previous settings.
+    """
+
+    def __init__(self, frequency_path, severity_path, transformer_path=DEFAULT_TRANSFORMER,
+                 base_premium=0.0, warmup_rounds=50):
+        start = time.perf_counter()
+        self.transformer = FeatureTransformer.load(transformer_path)
+        self.frequency_model = self._load(frequency_path)
+        self.severity_model = self._load(severity_path)
+        self.base_premium = base_premium
+        self.columns = list(self.transformer.feature_cols)
+        self._codes = {col: {level: i for i, level in enumerate(levels)}
+                       for col, levels in self.transformer.levels.items()}
+        self._fill = self.transformer.fill_values
+        self._fill_row = np.array([self._fill.get(c, -1.0) for c in self.columns])
+        self._dtype = matrix_dtype(self.transformer.dtypes.values())
+        self.model_versions = {'frequency': os.path.basename(frequency_path),
+                               'severity': os.path.basename(severity_path)}
+        self._predict_claim = fast_predict_fn(self.frequency_model, self.columns, proba=True)
+        self._predict_severity = fast_predict_fn(self.severity_model, self.columns)
+        self._limits = threadpool_limits(limits=1)
+        self.warmup(warmup_rounds)
+        self.load_seconds = time.perf_counter() - start
+        logging.info(f"Scorer ready in {self.load_seconds:.2f}s ({len(self.columns)} features)")
+
+    @staticmethod
+    def _load(path):
+        model = load_model(path)
+        if hasattr(model, 'get_params') and 'n_jobs' in model.get_params():
+            model.set_params(n_jobs=1)
+        return model
+
+    def close(self):
+        """Restores the BLAS/OpenMP thread settings the constructor limited to one thread."""
+        if self._limits is not None:
+            self._limits.restore_original_limits()
+            self._limits = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def default_record(self):
+        """A quote with every field at its training default (first level / median)."""
+        record = {col: levels[0] for col, levels in self.transformer.levels.items()}
+        record.update(self._fill)
+        return record
+
+    def warmup(self, rounds=50):
+        """Runs dummy predictions so lazy initialisation happens before the first real quote."""
+        record = self.default_record()
+        for size in (1, 8):
+            for _ in range(rounds):
+                self.score([record] * size)
+
+    def encode(self, records):
+        """
+        Feature matrix for a list of quote dicts, matching FeatureTransformer.transform:
+        unknown levels get code -1, and numeric fields are coerced like
+        pd.to_numeric(errors='coerce') with unparseable or missing values
+        taking the training fill value. Raises TypeError for non-dict records.
+        """
+        for i, record in enumerate(records):
+            if not isinstance(record, dict):
+                raise TypeError(f"Quote {i} must be a JSON object, got {type(record).__name__}")
+        X = np.empty((len(records), len(self.columns)), dtype=np.float64)
+        for j, col in enumerate(self.columns):
+            codes = self._codes.get(col)
+            if codes is not None:
+                # Missing fields take the transformer's 'nan' level
+                X[:, j] = [codes.get('nan' if r.get(col) is None else str(r.get(col)), -1) for r in records]
+            else:
+                X[:, j] = [_to_number(r.get(col)) for r in records]
+        missing = np.isnan(X)
+        if missing.any():
+            X[missing] = self._fill_row[np.nonzero(missing)[1]]
+        # Same rounding as the transformer's float32 columns
+        return X.astype(self._dtype, copy=False)
+
+    def score(self, records):
+        """P(Claim), E(Severity), risk premium and premium for each quote."""
+        X = self.encode(records)
+        prob_claim = self._predict_claim(X)
+        exp_severity = self._predict_severity(X)
+        risk = prob_claim * exp_severity
+        return [{'PClaim': float(p), 'ExpectedSeverity': float(s), 'RiskPremium': float(r),
+                 'Premium': float(r + self.base_premium)}
+                for p, s, r in zip(prob_claim, exp_severity, risk)]
+
+
+class ScoringHandler(BaseHTTPRequestHandler):
+    """POST /score, GET /metrics and GET /health over persistent HTTP/1.1 connections."""
+
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out as separate writes; without this Nagle's
+    # algorithm plus delayed ACKs add ~40ms to every keep-alive response.
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == '/health':
+            self._send_json(200, {'status': 'ok', 'models': self.server.scorer.model_versions,
+                                  'uptime_s': time.time() - self.server.started_at})
+        elif path == '/metrics':
+            self._send_json(200, {'request_latency': self.server.request_latency.snapshot(),
+                                  'model_latency': self.server.model_latency.snapshot(),
+                                  'quotes_scored': self.server.quotes_scored})
+        else:
+            self._send_json(404, {'error': f'unknown path {path}'})
+
+    def do_POST(self):
+        start = time.perf_counter()
+        if urlparse(self.path).path != '/score':
+            self._send_json(404, {'error': f'unknown path {self.path}'})
+            return
+        try:
+            payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            records = payload['policies'] if isinstance(payload, dict) and 'policies' in payload else payload
+            records = records if isinstance(records, list) else [records]
+            model_start = time.perf_counter()
+            scores = self.server.scorer.score(records)
+            self.server.model_latency.record((time.perf_counter() - model_start) * 1000)
+        except (ValueError, KeyError, TypeError) as e:
+            self._send_json(400, {'error': str(e)})
+            return
+        self._send_json(200, {'scores': scores})
+        with self.server.counter_lock:
+            self.server.quotes_scored += len(records)
+        self.server.request_latency.record((time.perf_counter() - start) * 1000)
+
+
+def make_server(scorer, host='127.0.0.1', port=8000):
+    """ThreadingHTTPServer bound to (host, port) serving the given QuoteScorer."""
+    server = ThreadingHTTPServer((host, port), ScoringHandler)
+    server.daemon_threads = True
+    server.scorer = scorer
+    server.request_latency = LatencyHistogram()
+    server.model_latency = LatencyHistogram()
+    server.quotes_scored = 0
+    server.counter_lock = threading.Lock()
+    server.started_at = time.time()
+    return server
+
+
+class LocalClient:
+    """Stand-in for ScoringClient that calls a QuoteScorer in-process (same JSON round-trip)."""
+
+    def __init__(self, scorer):
+        self.scorer = scorer
+
+    def score(self, records):
+        records = json.loads(json.dumps(records, default=str))
+        return json.loads(json.dumps(self.scorer.score(records)))
+
+
+class ScoringClient:
+    """HTTP client for the scoring service, keeping one persistent connection per thread."""
+
+    def __init__(self, url='http://127.0.0.1:8000', timeout=10):
+        parsed = urlparse(url)
+        self.host, self.port, self.timeout = parsed.hostname, parsed.port or 80, timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        if getattr(self._local, 'conn', None) is None:
+            self._local.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        return self._local.conn
+
+    def _request(self, method, path, body=None):
+        conn = self._connection()
+        headers = {'Content-Type': 'application/json'} if body is not None else {}
+        try:
+            conn.request(method, path, body=body, headers=headers)
+            response = conn.getresponse()
+            data = response.read()
+        except (http.client.HTTPException, ConnectionError):
+            self._local.conn = None
+            raise
+        if response.status != 200:
+            raise RuntimeError(f"{method} {path} failed ({response.status}): {data.decode()}")
+        return json.loads(data)
+
+    def score(self, records):
+        return self._request('POST', '/score', json.dumps({'policies': records}, default=str))['scores']
+
+    def metrics(self):
+        return self._request('GET', '/metrics')
+
+    def health(self):
+        return self._request('GET', '/health')
+
+
+def load_test(client, records, n_requests=2000, concurrency=4, batch_size=1, seed=42):
+    """
+    Sends n_requests micro-batches of batch_size quotes (sampled from
+    records) from concurrency threads and measures client-side latency.
+    Returns count, throughput and p50/p90/p99/max latency in ms.
+    """
+    rng = random.Random(seed)
+    batches = [rng.sample(records, batch_size) if batch_size <= len(records) else rng.choices(records, k=batch_size)
+               for _ in range(n_requests)]
+    histogram = LatencyHistogram()
+
+    def send(batch):
+        start = time.perf_counter()
+        client.score(batch)
+        histogram.record((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(send, batches))
+    elapsed = time.perf_counter() - start
+
+    summary = {k: v for k, v in histogram.snapshot().items() if k != 'buckets'}
+    summary.update({'requests_per_sec': n_requests / elapsed, 'quotes_per_sec': n_requests * batch_size / elapsed,
+                    'concurrency': concurrency, 'batch_size': batch_size})
+    logging.info(f"Load test: {n_requests} requests x {batch_size} quotes, {concurrency} threads: "
+                 f"p50 {summary['p50_ms']:.2f}ms, p99 {summary['p99_ms']:.2f}ms, "
+                 f"{summary['requests_per_sec']:,.0f} req/s")
+    return summary
+
+
+def sample_records(path, n=1000, seed=42):
+    """Quote dicts sampled from a Parquet or pipe-delimited file, for load tests."""
+    df = pd.read_parquet(path) if path.endswith('.parquet') or os.path.isdir(path) else \
+        pd.read_csv(path, sep='|', low_memory=False, nrows=max(n * 10, 10_000))
+    df = df.sample(n=min(n, len(df)), random_state=seed)
+    return json.loads(df.to_json(orient='records', date_format='iso'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Single-quote risk-premium scoring service.")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    for name in ('serve', 'loadtest'):
+        p = sub.add_parser(name)
+        p.add_argument('--registry', default=None,
+                       help="model registry directory: serve the promoted claim/severity versions")
+        p.add_argument('--frequency-model', help="joblib claim-probability model or exported tree directory")
+        p.add_argument('--severity-model', help="joblib claim-severity model or exported tree directory")
+        p.add_argument('--transformer', default=DEFAULT_TRANSFORMER)
+        p.add_argument('--base-premium', type=float, default=0.0)
+    sub.choices['serve'].add_argument('--host', default='127.0.0.1')
+    sub.choices['serve'].add_argument('--port', type=int, default=8000)
+
+    lt = sub.choices['loadtest']
+    lt.add_argument('data', help="Parquet/pipe-delimited file to sample quotes from")
+    lt.add_argument('--url', default=None, help="running service to test; default: in-process LocalClient")
+    lt.add_argument('--requests', type=int, default=2000)
+    lt.add_argument('--concurrency', type=int, default=4)
+    lt.add_argument('--batch-size', type=int, default=1)
+    args = parser.parse_args()
+    if args.registry:
+        args.transformer, args.frequency_model, args.severity_model = registered_scoring_paths(args.registry)
+    elif not getattr(args, 'url', None) and not (args.frequency_model and args.severity_model):
+        parser.error("--frequency-model and --severity-model are required without --registry")
+
+    if args.command == 'serve':
+        scorer = QuoteScorer(args.frequency_model, args.severity_model, args.transformer, args.base_premium)
+        server = make_server(scorer, args.host, args.port)
+        logging.info(f"Serving on http://{args.host}:{args.port} (/score, /metrics, /health)")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            server.server_close()
+        finally:
+            scorer.close()
+        return
+
+    if args.url:
+        client = ScoringClient(args.url)
+    else:
+        client = LocalClient(QuoteScorer(args.frequency_model, args.severity_model, args.transformer,
+                                         args.base_premium))
+    summary = load_test(client, sample_records(args.data), args.requests, args.concurrency, args.batch_size)
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
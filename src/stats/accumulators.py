@@ -0,0 +1,162 @@
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+
+class GroupStats:
+    """
+    Mergeable online accumulator of count, mean, M2 (sum of squared deviations),
+    min, max and sum per group.
+
+    Each chunk is reduced with vectorized bincount / np.minimum.at calls and
+    folded in with Chan et al.'s parallel Welford update, so results over
+    chunks (or over partial accumulators from other processes, via merge)
+    match a single pass over all data. Instances hold only small numpy arrays
+    and a label list, so they pickle cheaply between processes.
+    """
+
+    def __init__(self, labels=None):
+        self.labels = list(labels) if labels is not None else []
+        self._index = {label: i for i, label in enumerate(self.labels)}
+        k = len(self.labels)
+        self.count = np.zeros(k)
+        self.mean = np.zeros(k)
+        self.m2 = np.zeros(k)
+        self.sum = np.zeros(k)
+        self.min = np.full(k, np.inf)
+        self.max = np.full(k, -np.inf)
+
+    def _grow(self, k):
+        extra = k - len(self.count)
+        if extra <= 0:
+            return
+        self.count = np.append(self.count, np.zeros(extra))
+        self.mean = np.append(self.mean, np.zeros(extra))
+        self.m2 = np.append(self.m2, np.zeros(extra))
+        self.sum = np.append(self.sum, np.zeros(extra))
+        self.min = np.append(self.min, np.full(extra, np.inf))
+        self.max = np.append(self.max, np.full(extra, -np.inf))
+
+    def encode(self, keys):
+        """Maps group keys to codes, registering unseen keys. Missing keys map to -1."""
+        keys = pd.Series(keys)
+        uniques = pd.unique(keys.dropna())
+        for key in uniques:
+            if key not in self._index:
+                self._index[key] = len(self.labels)
+                self.labels.append(key)
+        self._grow(len(self.labels))
+        codes = keys.map(self._index)
+        return codes.fillna(-1).to_numpy(dtype=np.int64)
+
+    def update(self, values, keys=None):
+        """Folds a chunk of values (grouped by keys, or a single '__all__' group) into the totals."""
+        if keys is None:
+            keys = np.full(len(values), '__all__', dtype=object)
+        return self.update_codes(self.encode(keys), values)
+
+    def update_codes(self, codes, values):
+        """Like update, for values already coded 0..k-1 (negative codes are skipped)."""
+        codes = np.asarray(codes, dtype=np.int64)
+        values = np.asarray(values, dtype=float)
+        keep = (codes >= 0) & ~np.isnan(values)
+        codes, values = codes[keep], values[keep]
+        k = max(len(self.count), codes.max() + 1 if len(codes) else 0)
+        self._grow(k)
+
+        n_b = np.bincount(codes, minlength=k).astype(float)
+        sum_b = np.bincount(codes, weights=values, minlength=k)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean_b = np.where(n_b > 0, sum_b / n_b, 0.0)
+        m2_b = np.bincount(codes, weights=(values - mean_b[codes]) ** 2, minlength=k)
+        min_b = np.full(k, np.inf)
+        max_b = np.full(k, -np.inf)
+        np.minimum.at(min_b, codes, values)
+        np.maximum.at(max_b, codes, values)
+
+        self._combine(n_b, mean_b, m2_b, sum_b, min_b, max_b)
+        return self
+
+    def _combine(self, n_b, mean_b, m2_b, sum_b, min_b, max_b):
+        n_a = self.count
+        n = n_a + n_b
+        delta = mean_b - self.mean
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.mean = np.where(n > 0, self.mean + delta * n_b / n, 0.0)
+            self.m2 = np.where(n > 0, self.m2 + m2_b + delta ** 2 * n_a * n_b / n, 0.0)
+        self.count = n
+        self.sum = self.sum + sum_b
+        self.min = np.minimum(self.min, min_b)
+        self.max = np.maximum(self.max, max_b)
+
+    def merge(self, other):
+        """Folds another accumulator (e.g. from a worker process) into this one."""
+        codes = self.encode(other.labels)
+        k = len(self.labels)
+
+        def aligned(values, fill):
+            out = np.full(k, fill)
+            out[codes] = values
+            return out
+
+        self._combine(aligned(other.count, 0.0), aligned(other.mean, 0.0), aligned(other.m2, 0.0),
+                      aligned(other.sum, 0.0), aligned(other.min, np.inf), aligned(other.max, -np.inf))
+        return self
+
+    def variance(self, ddof=1):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(self.count > ddof, self.m2 / (self.count - ddof), np.nan)
+
+    def std(self, ddof=1):
+        return np.sqrt(self.variance(ddof))
+
+    def get(self, key):
+        """(count, mean, std) for one group."""
+        i = self._index[key]
+        return self.count[i], self.mean[i], self.std()[i]
+
+    def to_frame(self, ddof=1):
+        """One row per group: Count, Sum, Mean, Std, Min, Max."""
+        return pd.DataFrame({
+            'Group': self.labels,
+            'Count': self.count.astype(int),
+            'Sum': self.sum,
+            'Mean': self.mean,
+            'Std': self.std(ddof),
+            'Min': np.where(self.count > 0, self.min, np.nan),
+            'Max': np.where(self.count > 0, self.max, np.nan),
+        })
+
+
+def accumulate_chunks(chunks, value_col, group_col=None, accumulator=None):
+    """
+    Runs a GroupStats accumulator over an iterable of dataframes,
+    e.g. pd.read_csv(..., chunksize=...).
+    """
+    acc = accumulator if accumulator is not None else GroupStats()
+    for chunk in chunks:
+        values = pd.to_numeric(chunk[value_col], errors='coerce')
+        acc.update(values, chunk[group_col] if group_col else None)
+    return acc
+
+
+def anova_from_stats(acc):
+    """One-way ANOVA F-test from accumulated group moments. Returns (F, p)."""
+    keep = acc.count > 0
+    n, mean, m2 = acc.count[keep], acc.mean[keep], acc.m2[keep]
+    k, N = len(n), n.sum()
+    if k < 2 or N <= k:
+        return np.nan, np.nan
+    grand = (n * mean).sum() / N
+    ss_between = (n * (mean - grand) ** 2).sum()
+    ss_within = m2.sum()
+    F = (ss_between / (k - 1)) / (ss_within / (N - k))
+    return F, stats.f.sf(F, k - 1, N - k)
+
+
+def welch_ttest_from_stats(acc, group_a, group_b):
+    """Welch's t-test between two groups of an accumulator. Returns (t, p)."""
+    n1, m1, s1 = acc.get(group_a)
+    n2, m2, s2 = acc.get(group_b)
+    result = stats.ttest_ind_from_stats(m1, s1, n1, m2, s2, n2, equal_var=False)
+    return result.statistic, result.pvalue
@@ -0,0 +1,306 @@
+import sys
+import os
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+import numpy as np
+from scipy import stats
+from statsmodels.stats.multitest import multipletests
+
+# Add src to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from src.stats.shared_arrays import SharedFrame
+from src.stats.resampling import PERMUTATION_STATISTICS, claim_quantities, permutation_pvalue
+
+# Test types a spec can request.
+# 'chi2' treats the metric as categorical (e.g. HasClaim) and builds a contingency table.
+# 'permutation' takes a metric of 'loss_ratio', 'frequency', 'severity' (computed from
+# TotalClaims/TotalPremium) or a column name (group means), see src.stats.resampling.
+# The rest compare the metric's distribution across groups.
+TEST_NAMES = {
+    'chi2': 'Chi-Square',
+    'kruskal': 'Kruskal-Wallis',
+    'anova': 'ANOVA',
+    'mannwhitney': 'Mann-Whitney U',
+    'ttest': "Welch's t-test",
+    'permutation': 'Permutation',
+}
+
+# Named row filters a spec can apply before testing, with the columns they need.
+SUBSETS = {
+    'claimants': (['TotalClaims'], lambda shared: shared.array('TotalClaims') > 0),
+}
+
+CORRECTIONS = {
+    'bh': 'fdr_bh',
+    'fdr_bh': 'fdr_bh',
+    'holm': 'holm',
+}
+
+# Default metrics used when screening every categorical column.
+SCREEN_METRICS = [
+    {'label': 'Frequency', 'metric': 'HasClaim', 'test': 'chi2'},
+    {'label': 'Severity', 'metric': 'TotalClaims', 'test': 'kruskal', 'subset': 'claimants'},
+    {'label': 'Margin', 'metric': 'Margin', 'test': 'kruskal'},
+]
+
+_SHARED = None
+
+
+def make_spec(group_col, metric, test, hypothesis=None, label=None, subset=None, levels=None,
+              n_resamples=999):
+    """
+    Builds a declarative test specification.
+    group_col: column defining the groups, metric: column being compared,
+    test: key of TEST_NAMES, subset: key of SUBSETS, levels: restrict to these group labels,
+    n_resamples: number of permutations for test='permutation'.
+    """
+    if test not in TEST_NAMES:
+        raise ValueError(f"Unknown test type '{test}'. Expected one of {sorted(TEST_NAMES)}")
+    if subset is not None and subset not in SUBSETS:
+        raise ValueError(f"Unknown subset '{subset}'. Expected one of {sorted(SUBSETS)}")
+    return {
+        'hypothesis': hypothesis or f'{metric} vs {group_col}',
+        'label': label or metric,
+        'group_col': group_col,
+        'metric': metric,
+        'test': test,
+        'subset': subset,
+        'levels': list(levels) if levels is not None else None,
+        'n_resamples': n_resamples,
+    }
+
+
+def screen_specs(df, metrics=None, exclude=('PolicyID',), max_levels=None):
+    """
+    Specs testing every categorical (object/string/category) column of df
+    against each of the screening metrics.
+    """
+    metrics = metrics or SCREEN_METRICS
+    group_cols = [
+        c for c in df.select_dtypes(include=['object', 'string', 'category']).columns
+        if c not in exclude
+    ]
+    specs = []
+    for col in group_cols:
+        n_levels = df[col].nunique()
+        if n_levels < 2 or (max_levels is not None and n_levels > max_levels):
+            continue
+        for m in metrics:
+            if m['metric'] not in df.columns:
+                continue
+            specs.append(make_spec(col, m['metric'], m['test'],
+                                   hypothesis=f"Risk vs {col}", label=m.get('label'),
+                                   subset=m.get('subset')))
+    return specs
+
+
+def _required_columns(specs):
+    columns, group_cols = [], []
+    for spec in specs:
+        if spec['test'] == 'permutation' and spec['metric'] in PERMUTATION_STATISTICS:
+            columns += [spec['group_col'], 'TotalClaims', 'TotalPremium']
+        else:
+            columns += [spec['group_col'], spec['metric']]
+        group_cols.append(spec['group_col'])
+        if spec['subset']:
+            columns += SUBSETS[spec['subset']][0]
+    return list(dict.fromkeys(columns)), list(dict.fromkeys(group_cols))
+
+
+def _split_groups(codes, values):
+    """Splits values into one array per group code (codes sorted once)."""
+    order = np.argsort(codes, kind='stable')
+    codes, values = codes[order], values[order]
+    boundaries = np.flatnonzero(np.diff(codes)) + 1
+    return np.split(values, boundaries)
+
+
+def _metric_values(spec, shared):
+    """Per-row values the test works on, shape (n,) or (n, q) for permutation tests."""
+    if spec['test'] == 'permutation':
+        if spec['metric'] in PERMUTATION_STATISTICS:
+            return claim_quantities(shared.array('TotalClaims'), shared.array('TotalPremium'))
+        x = np.asarray(shared.array(spec['metric']), dtype=float)
+        return np.column_stack([x, np.ones(len(x))])
+    return np.asarray(shared.array(spec['metric']))
+
+
+def _run_test(spec, shared):
+    codes = np.asarray(shared.array(spec['group_col']))
+    metric = _metric_values(spec, shared)
+    metric_is_coded = spec['test'] != 'permutation' and shared.labels(spec['metric']) is not None
+
+    mask = codes >= 0
+    if metric_is_coded:
+        mask &= metric >= 0
+    elif metric.ndim == 2:
+        mask &= ~np.isnan(metric).any(axis=1)
+    else:
+        mask &= ~np.isnan(metric)
+    if spec['subset']:
+        mask &= SUBSETS[spec['subset']][1](shared)
+    if spec['levels'] is not None:
+        mask &= np.isin(codes, shared.codes_for(spec['group_col'], spec['levels']))
+
+    codes, values = codes[mask], metric[mask]
+    test = spec['test']
+
+    if len(values) == 0:
+        return np.nan, np.nan, 'Insufficient Groups', 0, 0
+
+    if test == 'permutation':
+        statistic = spec['metric'] if spec['metric'] in PERMUTATION_STATISTICS else 'mean'
+        stat, p = permutation_pvalue(codes, values, statistic, n_perm=spec['n_resamples'])
+        return stat, p, TEST_NAMES[test], len(np.unique(codes)), len(values)
+
+    if test == 'chi2':
+        group_labels, group_idx = np.unique(codes, return_inverse=True)
+        metric_labels, metric_idx = np.unique(values, return_inverse=True)
+        n_metric = len(metric_labels)
+        table = np.bincount(group_idx * n_metric + metric_idx,
+                            minlength=len(group_labels) * n_metric).reshape(-1, n_metric)
+        if table.shape[0] < 2 or table.shape[1] < 2:
+            return np.nan, np.nan, 'Insufficient Groups', table.shape[0], len(values)
+        chi2, p, dof, ex = stats.chi2_contingency(table)
+        return chi2, p, TEST_NAMES[test], table.shape[0], len(values)
+
+    groups = [g for g in _split_groups(codes, values) if len(g) > 1]
+    if len(groups) < 2:
+        return np.nan, np.nan, 'Insufficient Groups', len(groups), len(values)
+
+    if test == 'kruskal':
+        stat, p = stats.kruskal(*groups)
+    elif test == 'anova':
+        stat, p = stats.f_oneway(*groups)
+    else:
+        if len(groups) != 2:
+            raise ValueError(f"{TEST_NAMES[test]} needs exactly 2 groups, got {len(groups)} "
+                             f"for '{spec['group_col']}'. Restrict with levels=[...]")
+        if test == 'mannwhitney':
+            stat, p = stats.mannwhitneyu(groups[0], groups[1], alternative='two-sided')
+        else:
+            stat, p = stats.ttest_ind(groups[0], groups[1], equal_var=False)
+    return stat, p, TEST_NAMES[test], len(groups), len(values)
+
+
+def _init_worker(shared):
+    global _SHARED
+    _SHARED = shared
+
+
+def _run_spec(spec, shared=None):
+    shared = shared if shared is not None else _SHARED
+    start = time.perf_counter()
+    stat, p, test_name, n_groups, n_obs = _run_test(spec, shared)
+    return {
+        'Hypothesis': spec['hypothesis'],
+        'Metric': spec['label'],
+        'GroupCol': spec['group_col'],
+        'MetricCol': spec['metric'],
+        'Test': test_name,
+        'Statistic': stat,
+        'pValue': p,
+        'NGroups': n_groups,
+        'NObs': n_obs,
+        'RuntimeSec': time.perf_counter() - start,
+    }
+
+
+# Columns of the run_battery result table
+RESULT_COLUMNS = ['Hypothesis', 'Metric', 'GroupCol', 'MetricCol', 'Test', 'Statistic',
+                  'pValue', 'pAdjusted', 'Correction', 'Reject', 'NGroups', 'NObs', 'RuntimeSec']
+
+
+def apply_correction(p_values, method='bh', alpha=0.05):
+    """
+    Multiple-testing correction. method: 'bh' (Benjamini-Hochberg), 'holm' or None.
+    NaN p-values are left out of the family and stay NaN.
+    Returns (adjusted p-values, reject flags).
+    """
+    p_values = np.asarray(p_values, dtype=float)
+    adjusted = p_values.copy()
+    reject = np.zeros(len(p_values), dtype=bool)
+    valid = ~np.isnan(p_values)
+
+    if method is None:
+        reject[valid] = p_values[valid] < alpha
+        return adjusted, reject
+    if method not in CORRECTIONS:
+        raise ValueError(f"Unknown correction '{method}'. Expected one of {sorted(CORRECTIONS)} or None")
+    if valid.any():
+        rej, p_adj, _, _ = multipletests(p_values[valid], alpha=alpha, method=CORRECTIONS[method])
+        adjusted[valid] = p_adj
+        reject[valid] = rej
+    return adjusted, reject
+
+
+def run_battery(df, specs, n_workers=None, correction='bh', alpha=0.05,
+                output_path="outputs/stats_results.csv"):
+    """
+    Runs every spec in a process pool that memory-maps the same column store,
+    applies the multiple-testing correction and writes the result table.
+    n_workers=1 runs serially in-process. An empty spec list (e.g. screening
+    found no grouping column) gives an empty table with the result columns.
+    """
+    specs = list(specs)
+    if not specs:
+        res_df = pd.DataFrame(columns=RESULT_COLUMNS)
+    else:
+        columns, group_cols = _required_columns(specs)
+        n_workers = n_workers or min(len(specs), os.cpu_count() or 1)
+
+        with SharedFrame.from_frame(df, columns, categorical=group_cols) as shared:
+            if n_workers <= 1:
+                rows = [_run_spec(spec, shared) for spec in specs]
+            else:
+                with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker,
+                                         initargs=(shared,)) as pool:
+                    rows = list(pool.map(_run_spec, specs))
+
+        res_df = pd.DataFrame(rows)
+        res_df['pAdjusted'], res_df['Reject'] = apply_correction(res_df['pValue'], correction, alpha)
+        res_df['Correction'] = correction or 'none'
+        res_df = res_df[RESULT_COLUMNS]
+
+    if output_path:
+        os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+        res_df.to_csv(output_path, index=False)
+    return res_df
+
+
+def main():
+    from src.stats.metrics import load_and_clean_data, calculate_kpis
+
+    parser = argparse.ArgumentParser(description="Run a battery of hypothesis tests.")
+    parser.add_argument('data', help="Path to the pipe-delimited raw data file")
+    parser.add_argument('--screen', action='store_true',
+                        help="Screen every categorical column against frequency, severity and margin")
+    parser.add_argument('--max-levels', type=int, default=None,
+                        help="Skip grouping columns with more levels than this when screening")
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--correction', default='bh', choices=['bh', 'holm', 'none'])
+    parser.add_argument('--alpha', type=float, default=0.05)
+    parser.add_argument('--output', default="outputs/stats_results.csv")
+    args = parser.parse_args()
+
+    df = load_and_clean_data(args.data, keep_all_categoricals=args.screen)
+    df = calculate_kpis(df)
+
+    if args.screen:
+        specs = screen_specs(df, max_levels=args.max_levels)
+    else:
+        from src.stats.analysis_pipeline import HYPOTHESES
+        specs = HYPOTHESES
+
+    correction = None if args.correction == 'none' else args.correction
+    res_df = run_battery(df, specs, n_workers=args.workers, correction=correction,
+                         alpha=args.alpha, output_path=args.output)
+    print(res_df.to_string(index=False))
+    print(f"\nResults saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -75,3 +75,130 @@ def calculate_effect_size_cohens_d(group1, group2):
     if pooled_se == 0:
         return 0
     return diff / pooled_se
+
+def _group_moments(codes, values, n_groups):
+    """Count, mean and sample variance per group code from bincount reductions."""
+    n = np.bincount(codes, minlength=n_groups).astype(float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = np.bincount(codes, weights=values, minlength=n_groups) / n
+        m2 = np.bincount(codes, weights=(values - mean[codes]) ** 2, minlength=n_groups)
+        var = m2 / (n - 1)
+    return n, mean, var
+
+
+def _pairwise_mannwhitney(codes, values, n_groups, max_cells=10_000_000):
+    """
+    Mann-Whitney U and two-sided asymptotic p-values for every pair of groups
+    from a single shared sort of the values.
+
+    With C[v, g] = count of group g at distinct value v, the U statistic of
+    group i against group j is sum_v C[v, i] * (#j below v + 0.5 * C[v, j]),
+    i.e. one matrix product C.T @ (Below + C/2) for all pairs. Tie
+    corrections use the same counts. Distinct values are processed in
+    blocks to bound memory.
+    """
+    _, value_idx = np.unique(values, return_inverse=True)
+    n_values = value_idx.max() + 1 if len(value_idx) else 0
+    order = np.argsort(value_idx, kind='stable')
+    value_idx, codes = value_idx[order], codes[order]
+    boundaries = np.searchsorted(value_idx, np.arange(n_values + 1))
+
+    U = np.zeros((n_groups, n_groups))
+    cross = np.zeros((n_groups, n_groups))  # sum_v C_i^2 C_j
+    cubes = np.zeros(n_groups)
+    below = np.zeros(n_groups)
+    block = max(1, int(max_cells // max(n_groups, 1)))
+
+    for start in range(0, n_values, block):
+        stop = min(start + block, n_values)
+        rows = slice(boundaries[start], boundaries[stop])
+        counts = np.bincount((value_idx[rows] - start) * n_groups + codes[rows],
+                             minlength=(stop - start) * n_groups).reshape(-1, n_groups).astype(float)
+        cum_below = below + np.cumsum(counts, axis=0) - counts
+        U += counts.T @ (cum_below + 0.5 * counts)
+        cross += (counts ** 2).T @ counts
+        cubes += (counts ** 3).sum(axis=0)
+        below += counts.sum(axis=0)
+
+    n = below
+    n_i, n_j = n[:, None], n[None, :]
+    N = n_i + n_j
+    ties = cubes[:, None] + cubes[None, :] + 3 * cross + 3 * cross.T - N
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sigma = np.sqrt(n_i * n_j / 12 * ((N + 1) - ties / (N * (N - 1))))
+        mu = n_i * n_j / 2
+        U_big = np.maximum(U, n_i * n_j - U)
+        z = (U_big - mu - 0.5) / sigma
+        p = np.clip(2 * stats.norm.sf(z), 0, 1)
+    return U, p
+
+
+def pairwise_effect_sizes(df, group_col, metric_col='TotalClaims', claims_col='TotalClaims',
+                          premium_col='TotalPremium', claimants_only=True):
+    """
+    Effect sizes for every pair of levels of group_col, computed vectorially
+    from per-group moments rather than by looping pairs over raw data.
+
+    CohensD and the Mann-Whitney U/p-value compare metric_col (among claimants
+    if claimants_only). FreqDiff (claim frequency A - B) and LossRatioRatio
+    (loss ratio A / B) use all rows.
+    Returns one row per unordered pair (LevelA, LevelB).
+    """
+    data = df[df[group_col].notna()]
+    codes, labels = pd.factorize(data[group_col], sort=True)
+    k = len(labels)
+
+    claims = data[claims_col].to_numpy(dtype=float)
+    premium = data[premium_col].to_numpy(dtype=float)
+    policies = np.bincount(codes, minlength=k)
+    claimants = np.bincount(codes, weights=claims > 0, minlength=k)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        frequency = claimants / policies
+        loss_ratio = (np.bincount(codes, weights=claims, minlength=k) /
+                      np.bincount(codes, weights=premium, minlength=k))
+
+    metric = data[metric_col].to_numpy(dtype=float)
+    keep = ~np.isnan(metric)
+    if claimants_only:
+        keep &= claims > 0
+    m_codes, m_values = codes[keep], metric[keep]
+
+    n, mean, var = _group_moments(m_codes, m_values, k)
+    n_i, n_j = n[:, None], n[None, :]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pooled = np.sqrt(((n_i - 1) * var[:, None] + (n_j - 1) * var[None, :]) / (n_i + n_j - 2))
+        cohens_d = np.where(pooled == 0, 0.0, (mean[:, None] - mean[None, :]) / pooled)
+        lr_ratio = loss_ratio[:, None] / loss_ratio[None, :]
+    U, p_mw = _pairwise_mannwhitney(m_codes, m_values, k)
+
+    a, b = np.triu_indices(k, 1)
+    return pd.DataFrame({
+        'LevelA': labels[a],
+        'LevelB': labels[b],
+        'NA': n[a].astype(int),
+        'NB': n[b].astype(int),
+        'MeanA': mean[a],
+        'MeanB': mean[b],
+        'CohensD': cohens_d[a, b],
+        'FreqDiff': frequency[a] - frequency[b],
+        'LossRatioRatio': lr_ratio[a, b],
+        'MannWhitneyU': U[a, b],
+        'MannWhitneyP': p_mw[a, b],
+    })
+
+
+def pairwise_matrix(pairs, value_col, antisymmetric=False):
+    """
+    Square LevelA x LevelB matrix of one column of pairwise_effect_sizes.
+    antisymmetric: fill the lower triangle with -value (CohensD, FreqDiff);
+    otherwise ratios are inverted and other values mirrored.
+    """
+    upper = pairs.pivot(index='LevelA', columns='LevelB', values=value_col)
+    levels = sorted(set(pairs['LevelA']) | set(pairs['LevelB']))
+    upper = upper.reindex(index=levels, columns=levels)
+    lower = upper.T
+    if antisymmetric:
+        lower = -lower
+    elif value_col == 'LossRatioRatio':
+        lower = 1 / lower
+    return upper.combine_first(lower)
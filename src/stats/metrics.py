@@ -2,10 +2,12 @@ import pandas as pd
 import numpy as np
 from scipy.stats import mstats
 
-def load_and_clean_data(file_path):
+def load_and_clean_data(file_path, keep_all_categoricals=False):
     """
     Loads insurance data, aggregates by PolicyID to create a policy-level dataset,
     and performs basic cleaning.
+    keep_all_categoricals: also carry every other text column through the
+    aggregation (first value per policy), e.g. for screening all columns.
     """
     # Load with correct delimiter
     df = pd.read_csv(file_path, sep='|')
@@ -32,6 +34,10 @@ def load_and_clean_data(file_path):
         'PostalCode': 'first',
         'StatutoryRiskType': 'first'
     }
+    if keep_all_categoricals:
+        for col in df.select_dtypes(include=['object', 'string']).columns:
+            if col not in agg_rules and col != 'PolicyID':
+                agg_rules[col] = 'first'
     
     # Keep only columns we need for efficiency if dataset is huge, 
     # but for now let's stick to the core ones + agg
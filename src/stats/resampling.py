@@ -0,0 +1,277 @@
+import sys
+import os
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+import numpy as np
+from scipy import sparse
+
+# Add src to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from src.stats.shared_arrays import SharedFrame
+
+# Per-row quantities summed per group. Loss ratio, frequency and severity
+# are ratios of these sums, so every replicate only needs group totals.
+CLAIM_QUANTITIES = ['Claims', 'Premium', 'Claimants', 'Policies']
+
+# Between-group dispersion statistics for permutation tests, keyed by name.
+# Each is a weighted sum of squared deviations of the group ratio from the pooled ratio.
+PERMUTATION_STATISTICS = ('loss_ratio', 'frequency', 'severity')
+
+# Upper bound on replicate x row cells held in memory at once.
+MAX_CELLS = 20_000_000
+
+_SHARED = None
+
+
+def claim_quantities(claims, premium):
+    """Stacks the per-row quantities (claims, premium, claimant flag, 1) into an (n, 4) matrix."""
+    claims = np.asarray(claims, dtype=float)
+    premium = np.asarray(premium, dtype=float)
+    return np.column_stack([claims, premium, (claims > 0).astype(float), np.ones(len(claims))])
+
+
+def group_totals(codes, values, n_groups, weights=None):
+    """
+    Per-group totals of each column of values for many replicates at once.
+
+    codes (n,) with weights (B, n): bootstrap totals, computed as one matrix
+    multiply of the weight matrix against a sparse group-indicator matrix.
+    codes (B, n) without weights: totals for B relabellings of the rows
+    (permutations), computed with one offset bincount per value column.
+    Returns an array of shape (B, n_groups, q).
+    """
+    values = np.asarray(values, dtype=float)
+    if values.ndim == 1:
+        values = values[:, None]
+    n, q = values.shape
+
+    if weights is not None:
+        n_reps = weights.shape[0]
+        rows = np.repeat(np.arange(n), q)
+        cols = np.repeat(codes, q) * q + np.tile(np.arange(q), n)
+        indicator = sparse.csr_matrix((values.ravel(), (rows, cols)), shape=(n, n_groups * q))
+        totals = np.asarray(indicator.T @ weights.T).T
+        return totals.reshape(n_reps, n_groups, q)
+
+    n_reps = codes.shape[0]
+    offset = (codes + (np.arange(n_reps) * n_groups)[:, None]).ravel()
+    totals = np.empty((n_reps, n_groups, q))
+    for j in range(q):
+        totals[:, :, j] = np.bincount(offset, weights=np.tile(values[:, j], n_reps),
+                                      minlength=n_reps * n_groups).reshape(n_reps, n_groups)
+    return totals
+
+
+def metrics_from_totals(totals):
+    """Loss ratio, claim frequency and claim severity from CLAIM_QUANTITIES totals."""
+    claims, premium, claimants, policies = np.moveaxis(totals, -1, 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return {
+            'LossRatio': claims / premium,
+            'ClaimFrequency': claimants / policies,
+            'ClaimSeverity': claims / claimants,
+        }
+
+
+def dispersion_statistic(totals, statistic):
+    """
+    Weighted between-group dispersion for each replicate in totals (B, k, q).
+    statistic: one of PERMUTATION_STATISTICS (totals of CLAIM_QUANTITIES),
+    or 'mean' (totals of [value, 1]).
+    """
+    if statistic == 'mean':
+        numerator, weight = totals[..., 0], totals[..., 1]
+    elif statistic == 'loss_ratio':
+        numerator, weight = totals[..., 0], totals[..., 1]
+    elif statistic == 'frequency':
+        numerator, weight = totals[..., 2], totals[..., 3]
+    elif statistic == 'severity':
+        numerator, weight = totals[..., 0], totals[..., 2]
+    else:
+        raise ValueError(f"Unknown statistic '{statistic}'. Expected 'mean' or one of {PERMUTATION_STATISTICS}")
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pooled = numerator.sum(axis=-1, keepdims=True) / weight.sum(axis=-1, keepdims=True)
+        group_ratio = numerator / weight
+    return np.nansum(weight * (group_ratio - pooled) ** 2, axis=-1)
+
+
+def bootstrap_totals(codes, values, n_groups, n_reps, rng, method='poisson', max_cells=MAX_CELLS):
+    """
+    Bootstrap replicate group totals, generated chunk by chunk over rows.
+
+    method='poisson' draws independent Poisson(1) weights per row.
+    method='multinomial' is the classic bootstrap: each replicate first
+    splits its n draws across row chunks, then across rows within a chunk,
+    which is exactly a Multinomial(n, 1/n) draw without holding it whole.
+    """
+    n = len(codes)
+    rows_per_chunk = max(1, int(max_cells // max(n_reps, 1)))
+    starts = np.arange(0, n, rows_per_chunk)
+    sizes = np.diff(np.append(starts, n))
+
+    if method == 'multinomial':
+        chunk_draws = rng.multinomial(n, sizes / n, size=n_reps)
+    elif method != 'poisson':
+        raise ValueError(f"Unknown bootstrap method '{method}'. Expected 'poisson' or 'multinomial'")
+
+    totals = np.zeros((n_reps, n_groups, values.shape[1]))
+    for c, (start, size) in enumerate(zip(starts, sizes)):
+        if method == 'poisson':
+            weights = rng.poisson(1.0, size=(n_reps, size)).astype(float)
+        else:
+            weights = rng.multinomial(chunk_draws[:, c], np.full(size, 1.0 / size)).astype(float)
+        totals += group_totals(codes[start:start + size], values[start:start + size], n_groups, weights)
+    return totals
+
+
+def permutation_statistics(codes, values, n_groups, n_reps, rng, statistic, max_cells=MAX_CELLS):
+    """Dispersion statistic for n_reps random relabellings of the rows, in replicate chunks."""
+    n = len(codes)
+    reps_per_chunk = max(1, int(max_cells // max(n, 1)))
+    out = []
+    for start in range(0, n_reps, reps_per_chunk):
+        b = min(reps_per_chunk, n_reps - start)
+        permuted = rng.permuted(np.tile(codes, (b, 1)), axis=1)
+        out.append(dispersion_statistic(group_totals(permuted, values, n_groups), statistic))
+    return np.concatenate(out) if out else np.empty(0)
+
+
+def permutation_pvalue(codes, values, statistic, n_perm=999, seed=42, max_cells=MAX_CELLS):
+    """
+    Permutation test of 'no difference between groups' for the given statistic.
+    codes: group codes (0..k-1), values: per-row quantities matching the statistic.
+    Returns (observed statistic, p-value).
+    """
+    _, codes = np.unique(codes, return_inverse=True)
+    n_groups = codes.max() + 1 if len(codes) else 0
+    if n_groups < 2:
+        return np.nan, np.nan
+
+    values = np.asarray(values, dtype=float)
+    values = values[:, None] if values.ndim == 1 else values
+    observed = dispersion_statistic(group_totals(codes[None, :], values, n_groups), statistic)[0]
+    rng = np.random.default_rng(seed)
+    permuted = permutation_statistics(codes, values, n_groups, n_perm, rng, statistic, max_cells)
+    p = (1 + np.sum(permuted >= observed * (1 - 1e-12))) / (1 + n_perm)
+    return observed, p
+
+
+def _init_worker(shared):
+    global _SHARED
+    _SHARED = shared
+
+
+def _shared_inputs(shared, group_col, claims_col, premium_col, value_col):
+    codes = np.asarray(shared.array(group_col))
+    if value_col is None:
+        values = claim_quantities(shared.array(claims_col), shared.array(premium_col))
+    else:
+        x = np.asarray(shared.array(value_col), dtype=float)
+        values = np.column_stack([x, np.ones(len(x))])
+    keep = (codes >= 0) & ~np.isnan(values).any(axis=1)
+    return codes[keep], values[keep]
+
+
+def _bootstrap_task(task):
+    (group_col, claims_col, premium_col, n_reps, method, seed, max_cells) = task
+    codes, values = _shared_inputs(_SHARED, group_col, claims_col, premium_col, None)
+    n_groups = len(_SHARED.labels(group_col))
+    rng = np.random.default_rng(seed)
+    return bootstrap_totals(codes, values, n_groups, n_reps, rng, method, max_cells)
+
+
+def _permutation_task(task):
+    (group_col, claims_col, premium_col, value_col, statistic, n_reps, seed, max_cells) = task
+    codes, values = _shared_inputs(_SHARED, group_col, claims_col, premium_col, value_col)
+    _, codes = np.unique(codes, return_inverse=True)
+    rng = np.random.default_rng(seed)
+    return permutation_statistics(codes, values, codes.max() + 1, n_reps, rng, statistic, max_cells)
+
+
+def _split_replicates(n_reps, n_workers, seed):
+    n_workers = max(1, min(n_workers, n_reps))
+    counts = np.full(n_workers, n_reps // n_workers)
+    counts[:n_reps % n_workers] += 1
+    seeds = np.random.SeedSequence(seed).spawn(n_workers)
+    return list(zip(counts.tolist(), seeds))
+
+
+def _map_replicates(shared, fn, tasks):
+    if len(tasks) == 1:
+        _init_worker(shared)
+        return [fn(tasks[0])]
+    with ProcessPoolExecutor(max_workers=len(tasks), initializer=_init_worker,
+                             initargs=(shared,)) as pool:
+        return list(pool.map(fn, tasks))
+
+
+def bootstrap_group_metrics(df, group_col, n_boot=2000, method='poisson', ci=0.95,
+                            n_workers=None, seed=42, max_cells=MAX_CELLS,
+                            claims_col='TotalClaims', premium_col='TotalPremium'):
+    """
+    Bootstrap confidence intervals for loss ratio, claim frequency and
+    claim severity of every level of group_col.
+    Replicates are split across worker processes that memory-map the same data.
+    Returns one row per (group, metric) with estimate, standard error and percentile CI.
+    """
+    n_workers = n_workers or os.cpu_count() or 1
+    with SharedFrame.from_frame(df, [group_col, claims_col, premium_col],
+                                categorical=[group_col]) as shared:
+        labels = shared.labels(group_col)
+        codes, values = _shared_inputs(shared, group_col, claims_col, premium_col, None)
+        point = metrics_from_totals(group_totals(codes, values, len(labels),
+                                                 weights=np.ones((1, len(codes)))))
+        n_policies = np.bincount(codes, minlength=len(labels))
+
+        tasks = [(group_col, claims_col, premium_col, n, method, s, max_cells)
+                 for n, s in _split_replicates(n_boot, n_workers, seed)]
+        totals = np.concatenate(_map_replicates(shared, _bootstrap_task, tasks))
+
+    replicates = metrics_from_totals(totals)
+    alpha = (1 - ci) / 2
+    rows = []
+    for metric, reps in replicates.items():
+        lower, upper = np.nanpercentile(reps, [100 * alpha, 100 * (1 - alpha)], axis=0)
+        se = np.nanstd(reps, axis=0, ddof=1)
+        for g, label in enumerate(labels):
+            rows.append({
+                group_col: label,
+                'Metric': metric,
+                'Estimate': point[metric][0, g],
+                'SE': se[g],
+                'CILower': lower[g],
+                'CIUpper': upper[g],
+                'NPolicies': n_policies[g],
+            })
+    return pd.DataFrame(rows)
+
+
+def permutation_test(df, group_col, statistic='loss_ratio', value_col=None, n_perm=999,
+                     n_workers=None, seed=42, max_cells=MAX_CELLS,
+                     claims_col='TotalClaims', premium_col='TotalPremium'):
+    """
+    Permutation test of H0: no difference between the levels of group_col.
+    statistic: 'loss_ratio', 'frequency', 'severity', or 'mean' of value_col.
+    Returns (observed statistic, p-value).
+    """
+    n_workers = n_workers or os.cpu_count() or 1
+    if statistic == 'mean' and value_col is None:
+        raise ValueError("statistic='mean' needs value_col")
+    value_col = value_col if statistic == 'mean' else None
+    columns = [group_col] + ([value_col] if value_col else [claims_col, premium_col])
+
+    with SharedFrame.from_frame(df, columns, categorical=[group_col]) as shared:
+        codes, values = _shared_inputs(shared, group_col, claims_col, premium_col, value_col)
+        _, codes = np.unique(codes, return_inverse=True)
+        if len(codes) == 0 or codes.max() < 1:
+            return np.nan, np.nan
+        observed = dispersion_statistic(group_totals(codes[None, :], values, codes.max() + 1),
+                                        statistic)[0]
+        tasks = [(group_col, claims_col, premium_col, value_col, statistic, n, s, max_cells)
+                 for n, s in _split_replicates(n_perm, n_workers, seed)]
+        permuted = np.concatenate(_map_replicates(shared, _permutation_task, tasks))
+
+    p = (1 + np.sum(permuted >= observed * (1 - 1e-12))) / (1 + n_perm)
+    return observed, p
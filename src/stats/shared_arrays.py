@@ -0,0 +1,101 @@
+import os
+import json
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+
+
+class SharedFrame:
+    """
+    Column store backed by .npy files so worker processes can memory-map
+    the same data instead of receiving a pickled copy of the dataframe.
+
+    Numeric columns are stored as float64 (NaN preserved). Grouping/text
+    columns are stored as int32 codes (-1 = missing) plus their labels.
+    Only the directory path and manifest are pickled when the object is
+    sent to a worker; arrays are opened lazily with mmap_mode='r'. close()
+    deletes the directory only if from_frame created it.
+    """
+
+    def __init__(self, directory, manifest, owned=False):
+        self.directory = directory
+        self.manifest = manifest
+        self.owned = owned
+        self._arrays = {}
+
+    @classmethod
+    def from_frame(cls, df, columns, categorical=None, directory=None):
+        """Dumps the requested columns of df to a (temporary) directory."""
+        owned = directory is None
+        directory = directory or tempfile.mkdtemp(prefix='acis_shared_')
+        os.makedirs(directory, exist_ok=True)
+        categorical = set(categorical or [])
+        manifest = {}
+
+        for i, col in enumerate(dict.fromkeys(columns)):
+            series = df[col]
+            path = os.path.join(directory, f'{i:04d}.npy')
+            is_numeric = (
+                pd.api.types.is_numeric_dtype(series)
+                and not isinstance(series.dtype, pd.CategoricalDtype)
+            )
+            if col in categorical or not is_numeric:
+                labelled = series.where(series.isna(), series.astype(str))
+                codes, uniques = pd.factorize(labelled, sort=True)
+                np.save(path, codes.astype(np.int32))
+                manifest[col] = {'path': path, 'labels': [str(u) for u in uniques]}
+            else:
+                np.save(path, series.to_numpy(dtype=np.float64, na_value=np.nan))
+                manifest[col] = {'path': path, 'labels': None}
+
+        with open(os.path.join(directory, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f)
+        return cls(directory, manifest, owned=owned)
+
+    @classmethod
+    def open(cls, directory):
+        """Re-opens a SharedFrame previously written to directory."""
+        with open(os.path.join(directory, 'manifest.json')) as f:
+            return cls(directory, json.load(f))
+
+    def __getstate__(self):
+        return {'directory': self.directory, 'manifest': self.manifest}
+
+    def __setstate__(self, state):
+        self.__init__(state['directory'], state['manifest'])
+
+    def __contains__(self, col):
+        return col in self.manifest
+
+    def __len__(self):
+        if not self.manifest:
+            return 0
+        return len(self.array(next(iter(self.manifest))))
+
+    def array(self, col):
+        """Memory-mapped values (or codes) of a column."""
+        if col not in self._arrays:
+            self._arrays[col] = np.load(self.manifest[col]['path'], mmap_mode='r')
+        return self._arrays[col]
+
+    def labels(self, col):
+        """Labels for a coded column, or None for numeric columns."""
+        return self.manifest[col]['labels']
+
+    def codes_for(self, col, levels):
+        """Maps a list of labels of a coded column to their integer codes."""
+        lookup = {label: code for code, label in enumerate(self.labels(col))}
+        return [lookup[str(level)] for level in levels if str(level) in lookup]
+
+    def close(self):
+        """Drops open maps and deletes the backing directory if it is a temporary one from from_frame."""
+        self._arrays = {}
+        if self.owned:
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
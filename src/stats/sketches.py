@@ -0,0 +1,242 @@
+import os
+import numpy as np
+import pandas as pd
+
+# A sketch of precision p has 2**p one-byte registers and a relative
+# standard error of about 1.04 / sqrt(2**p) (p=14: 16 KB, ~0.8%).
+MIN_PRECISION = 4
+MAX_PRECISION = 18
+DEFAULT_PRECISION = 14
+
+# Persisted group keys are strings; missing key values are stored as ''
+MISSING_KEY = ''
+
+
+def standard_error(precision):
+    """Relative standard error of a distinct count estimated at this precision."""
+    return 1.04 / np.sqrt(2 ** precision)
+
+
+def precision_for_error(error):
+    """Smallest precision whose standard error is at most error (clipped to the supported range)."""
+    p = int(np.ceil(np.log2((1.04 / error) ** 2)))
+    return int(np.clip(p, MIN_PRECISION, MAX_PRECISION))
+
+
+def hash_values(values):
+    """
+    64-bit hashes of the non-missing values, plus the mask of those values.
+    Integral floats hash like integers, so an ID column read as int64 from
+    one partition and as float64 (because of gaps) from another gives the
+    same registers.
+    """
+    values = pd.Series(values).reset_index(drop=True)
+    valid = values.notna().to_numpy()
+    values = values[valid]
+    if pd.api.types.is_float_dtype(values.dtype) and (values % 1 == 0).all():
+        values = values.astype(np.int64)
+    return pd.util.hash_array(np.asarray(values.to_numpy())), valid
+
+
+def _register_ranks(hashes, precision):
+    """Register index (top precision bits) and rank (1 + leading zeros of the other bits) of each hash."""
+    q = 64 - precision
+    index = (hashes >> np.uint64(q)).astype(np.int64)
+    rest = hashes & np.uint64((1 << q) - 1)
+    # frexp's exponent is the exact bit length while the value fits a float64 mantissa
+    shift = max(q - 53, 0)
+    bit_length = np.frexp((rest >> np.uint64(shift)).astype(np.float64))[1] + shift
+    return index, (q - bit_length + 1).astype(np.uint8)
+
+
+def estimate_cardinality(registers):
+    """
+    Distinct-count estimates from HyperLogLog registers of shape (..., 2**p):
+    the harmonic-mean estimator, with linear counting for small sets.
+    """
+    registers = np.asarray(registers)
+    m = registers.shape[-1]
+    alpha = {16: 0.673, 32: 0.697, 64: 0.709}.get(m, 0.7213 / (1 + 1.079 / m))
+    raw = alpha * m * m / np.exp2(-registers.astype(float)).sum(axis=-1)
+    zeros = (registers == 0).sum(axis=-1)
+    with np.errstate(divide='ignore'):
+        small = m * np.log(m / np.maximum(zeros, 1))
+    return np.where((raw <= 2.5 * m) & (zeros > 0), small, raw)
+
+
+class GroupedHyperLogLog:
+    """
+    Mergeable approximate distinct counters (HyperLogLog), one per group.
+
+    Values are hashed to 64 bits; the top precision bits pick a register and
+    each register keeps the highest rank seen, updated for a whole chunk with
+    one np.maximum.at call. Registers of the same group from different
+    chunks, partitions or processes combine with an element-wise max (merge),
+    and the union of several groups is the max over their registers, so
+    distinct counts of any rollup come from the sketches alone. Labels work
+    like GroupStats labels; tuples key multi-column groups, whose column
+    names can be kept in key_names.
+    """
+
+    def __init__(self, precision=DEFAULT_PRECISION, labels=None, key_names=None):
+        if not MIN_PRECISION <= precision <= MAX_PRECISION:
+            raise ValueError(f"precision must be between {MIN_PRECISION} and {MAX_PRECISION}, got {precision}")
+        self.precision = int(precision)
+        self.m = 1 << self.precision
+        self.labels = list(labels) if labels is not None else []
+        self._index = {label: i for i, label in enumerate(self.labels)}
+        self.registers = np.zeros((len(self.labels), self.m), dtype=np.uint8)
+        self.key_names = list(key_names) if key_names is not None else None
+
+    @classmethod
+    def with_error(cls, error, labels=None):
+        """Sketches sized for a target relative standard error (e.g. 0.01)."""
+        return cls(precision_for_error(error), labels)
+
+    @property
+    def standard_error(self):
+        return standard_error(self.precision)
+
+    def _grow(self, k):
+        extra = k - len(self.registers)
+        if extra > 0:
+            self.registers = np.vstack([self.registers, np.zeros((extra, self.m), dtype=np.uint8)])
+
+    def encode(self, keys):
+        """Maps group keys to codes, registering unseen keys. Missing keys map to -1."""
+        keys = pd.Series(list(keys) if isinstance(keys, (list, tuple)) else keys, dtype=object)
+        for key in pd.unique(keys.dropna()):
+            if key not in self._index:
+                self._index[key] = len(self.labels)
+                self.labels.append(key)
+        self._grow(len(self.labels))
+        return keys.map(self._index).fillna(-1).to_numpy(dtype=np.int64)
+
+    def update(self, values, keys=None):
+        """Adds a chunk of values (grouped by keys, or a single '__all__' group) to the sketches."""
+        if keys is None:
+            keys = np.full(len(values), '__all__', dtype=object)
+        return self.update_codes(self.encode(keys), values)
+
+    def update_codes(self, codes, values):
+        """Like update, for groups already coded 0..k-1 (negative codes are skipped)."""
+        codes = np.asarray(codes, dtype=np.int64)
+        hashes, valid = hash_values(values)
+        codes = codes[valid]
+        keep = codes >= 0
+        codes, hashes = codes[keep], hashes[keep]
+        self._grow(codes.max() + 1 if len(codes) else 0)
+        index, rank = _register_ranks(hashes, self.precision)
+        np.maximum.at(self.registers.reshape(-1), codes * self.m + index, rank)
+        return self
+
+    def merge(self, other):
+        """Folds another set of sketches (same precision) into this one, group by group."""
+        if other.precision != self.precision:
+            raise ValueError(f"Cannot merge precision {other.precision} sketches into precision {self.precision}")
+        codes = self.encode(other.labels)
+        np.maximum.at(self.registers, codes, other.registers)
+        return self
+
+    def estimate(self):
+        """Estimated distinct count of every group, in label order."""
+        return estimate_cardinality(self.registers)
+
+    def union(self, labels):
+        """Estimated distinct count over the union of the given groups."""
+        rows = [self._index[label] for label in labels if label in self._index]
+        if not rows:
+            return 0.0
+        return float(estimate_cardinality(self.registers[rows].max(axis=0)))
+
+    def rollup(self, key):
+        """
+        Sketches of coarser groups: key maps each label to its new group
+        (e.g. lambda label: label[1] to drop the first of two key columns).
+        """
+        rolled = GroupedHyperLogLog(self.precision)
+        codes = rolled.encode([key(label) for label in self.labels])
+        rolled._grow(len(rolled.labels))
+        np.maximum.at(rolled.registers, codes, self.registers)
+        return rolled
+
+    def to_frame(self):
+        """One row per group: Group, DistinctCount (rounded estimate)."""
+        return pd.DataFrame({
+            'Group': self.labels,
+            'DistinctCount': np.rint(self.estimate()).astype(np.int64),
+        })
+
+    def to_arrays(self):
+        """{name: array} for persisting; labels are stored as strings (tuples as rows)."""
+        arrays = {'precision': np.array(self.precision),
+                  'labels': np.array([[str(v) for v in label] if isinstance(label, tuple) else str(label)
+                                      for label in self.labels], dtype=str),
+                  'registers': self.registers}
+        if self.key_names is not None:
+            arrays['key_names'] = np.array(self.key_names, dtype=str)
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        labels = arrays['labels']
+        labels = [tuple(row) for row in labels.tolist()] if labels.ndim == 2 else labels.tolist()
+        key_names = arrays['key_names'].tolist() if 'key_names' in arrays else None
+        sketches = cls(int(arrays['precision']), labels, key_names)
+        sketches.registers = np.array(arrays['registers'], dtype=np.uint8)
+        return sketches
+
+    def save(self, path):
+        np.savez_compressed(path, **self.to_arrays())
+        return path
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            return cls.from_arrays({name: data[name] for name in data.files})
+
+
+def group_keys(frame, group_cols):
+    """
+    (codes, keys): a code per row of frame and the key of each code, as a
+    string (a tuple of strings for several columns; missing values become
+    MISSING_KEY). Each column is factorized, so keys are built only once
+    per distinct combination.
+    """
+    combined = np.zeros(len(frame), dtype=np.int64)
+    uniques = []
+    for col in group_cols:
+        codes, values = pd.factorize(frame[col], use_na_sentinel=False)
+        combined = combined * len(values) + codes
+        uniques.append([MISSING_KEY if pd.isna(v) else str(v) for v in values])
+    codes, combos = pd.factorize(combined)
+    keys = []
+    for combo in combos:
+        key = []
+        for values in reversed(uniques):
+            combo, i = divmod(combo, len(values))
+            key.append(values[i])
+        keys.append(tuple(reversed(key)) if len(key) > 1 else key[0])
+    return codes, keys
+
+
+def sketch_chunks(chunks, value_col, group_cols=None, sketches=None, precision=DEFAULT_PRECISION):
+    """
+    Runs GroupedHyperLogLog sketches of value_col (grouped by group_cols)
+    over an iterable of dataframes, e.g. the partitions of a split.
+    """
+    if sketches is None:
+        sketches = GroupedHyperLogLog(precision, key_names=group_cols)
+    for chunk in chunks:
+        if group_cols:
+            codes, keys = group_keys(chunk, group_cols)
+            sketches.update_codes(sketches.encode(keys)[codes], chunk[value_col])
+        else:
+            sketches.update(chunk[value_col])
+    return sketches
+
+
+def sketch_path(data_path, name='policy_hll'):
+    """Where the sketches of a processed split live: next to it, e.g. train.parquet -> train_policy_hll.npz."""
+    root = os.path.splitext(os.path.normpath(data_path))[0]
+    return f'{root}_{name}.npz'
@@ -2,11 +2,16 @@
 Visualization Utilities for AlphaCare Insurance Solutions
 """
 
+import os
+import sys
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
-from typing import Optional, List, Tuple
+from typing import Optional, List, Tuple, Sequence
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from src.data.sampling import StratifiedSampler, DEFAULT_STRATA
 
 
 def set_plot_style(style: str = 'whitegrid', context: str = 'notebook'):
@@ -38,7 +43,8 @@ def plot_loss_ratio_by_group(data: pd.DataFrame,
     Parameters:
     -----------
     data : pd.DataFrame
-        Grouped data with loss ratios
+        Grouped data with loss ratios, e.g. one of the frames returned by
+        data_cleaning.calculate_group_metrics
     group_col : str
         Column name for groups
     loss_ratio_col : str, default 'LossRatio'
@@ -310,7 +316,8 @@ def plot_scatter(df: pd.DataFrame,
                 sample_size: Optional[int] = None,
                 title: str = 'Scatter Plot',
                 save_path: Optional[str] = None,
-                figsize: Tuple[int, int] = (12, 8)) -> None:
+                figsize: Tuple[int, int] = (12, 8),
+                stratify: Optional[Sequence[str]] = DEFAULT_STRATA) -> None:
     """
     Plot scatter plot with optional sampling.
     
@@ -330,8 +337,13 @@ def plot_scatter(df: pd.DataFrame,
         Path to save the plot
     figsize : tuple, default (12, 8)
         Figure size
+    stratify : sequence of str, optional
+        Columns to stratify the sample by (HasClaim, Province and RiskSegment
+        where present), so rare claimants are not lost; None samples uniformly
     """
-    if sample_size and sample_size < len(df):
+    if sample_size and sample_size < len(df) and stratify:
+        df_plot, _ = StratifiedSampler(sample_size, strata=stratify).sample(df)
+    elif sample_size and sample_size < len(df):
         df_plot = df.sample(n=sample_size, random_state=42)
     else:
         df_plot = df
@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+import pytest
+from scipy import stats
+
+from src.data_cleaning import detect_outliers_zscore, detect_outliers_zscore_chunked
+from src.stats.accumulators import GroupStats, accumulate_chunks, anova_from_stats, welch_ttest_from_stats
+
+
+@pytest.fixture
+def frame():
+    rng = np.random.default_rng(0)
+    n = 3000
+    df = pd.DataFrame({'Province': rng.choice(['Gauteng', 'KwaZulu-Natal', 'Limpopo', 'Western Cape'], n),
+                       'TotalClaims': rng.gamma(2, 1000, n) * (1 + 1e6 * (rng.random(n) < 0.01))})
+    df.loc[rng.random(n) < 0.05, 'TotalClaims'] = np.nan
+    df.loc[rng.random(n) < 0.02, 'Province'] = None
+    return df
+
+
+def test_merged_group_stats_match_groupby(frame):
+    # Two "workers" over interleaved chunks, merged afterwards
+    chunks = [frame.iloc[i:i + 250] for i in range(0, len(frame), 250)]
+    first = accumulate_chunks(chunks[::2], 'TotalClaims', 'Province')
+    second = accumulate_chunks(chunks[1::2], 'TotalClaims', 'Province')
+    result = first.merge(second).to_frame().set_index('Group').sort_index()
+
+    expected = frame.groupby('Province')['TotalClaims'].agg(['count', 'sum', 'mean', 'std', 'min', 'max'])
+    np.testing.assert_array_equal(result['Count'], expected['count'])
+    for ours, theirs in [('Sum', 'sum'), ('Mean', 'mean'), ('Std', 'std'), ('Min', 'min'), ('Max', 'max')]:
+        np.testing.assert_allclose(result[ours], expected[theirs], rtol=1e-10)
+
+
+def test_single_group_matches_numpy(frame):
+    acc = GroupStats()
+    for start in range(0, len(frame), 700):
+        acc.update(frame['TotalClaims'].iloc[start:start + 700])
+    values = frame['TotalClaims'].dropna()
+    count, mean, std = acc.get('__all__')
+    assert count == len(values)
+    assert mean == pytest.approx(values.mean(), rel=1e-12)
+    assert std == pytest.approx(values.std(), rel=1e-10)
+
+
+def test_tests_from_stats_match_scipy(frame):
+    acc = accumulate_chunks([frame], 'TotalClaims', 'Province')
+    groups = {k: g.dropna().to_numpy() for k, g in frame.groupby('Province')['TotalClaims']}
+    F, p = anova_from_stats(acc)
+    expected = stats.f_oneway(*groups.values())
+    assert F == pytest.approx(expected.statistic, rel=1e-9)
+    assert p == pytest.approx(expected.pvalue, rel=1e-6)
+
+    t, p = welch_ttest_from_stats(acc, 'Gauteng', 'Limpopo')
+    expected = stats.ttest_ind(groups['Gauteng'], groups['Limpopo'], equal_var=False)
+    assert t == pytest.approx(expected.statistic, rel=1e-9)
+    assert p == pytest.approx(expected.pvalue, rel=1e-6)
+
+
+def test_chunked_zscore_outliers_match_in_memory(frame, tmp_path):
+    path = tmp_path / 'insurance.txt'
+    frame.to_csv(path, sep='|', index=False)
+    chunked = detect_outliers_zscore_chunked(str(path), 'TotalClaims', chunksize=400)
+    in_memory = detect_outliers_zscore(pd.read_csv(path, sep='|'), 'TotalClaims')
+    assert len(chunked) > 0
+    np.testing.assert_allclose(np.sort(chunked['TotalClaims'].to_numpy()),
+                               np.sort(in_memory['TotalClaims'].to_numpy()))
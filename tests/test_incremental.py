@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+
+from src.models.incremental import IncrementalTrainer, ModelStore, feature_drift, feature_reference
+
+
+def _frame(n, share_y, seed):
+    rng = np.random.default_rng(seed)
+    X = pd.DataFrame({
+        'Province': pd.Series(np.where(rng.random(n) < share_y, 'y', 'x'), dtype='str'),
+        'SumInsured': rng.normal(100, 10, n),
+    })
+    y = (rng.random(n) < np.where(X['Province'] == 'y', 0.4, 0.2)).astype(int)
+    return X, pd.Series(y)
+
+
+def test_categorical_reference_for_str_columns():
+    X, _ = _frame(1000, 0.5, 0)
+    reference = feature_reference(X)
+    assert reference['Province']['type'] == 'categorical'
+    assert reference['SumInsured']['type'] == 'numeric'
+
+    shifted, _ = _frame(1000, 1.0, 1)
+    drift = feature_drift(reference, shifted)
+    assert drift['Province'] > 0.25
+
+
+def test_categorical_shift_forces_full_refit(tmp_path):
+    store = ModelStore(str(tmp_path))
+    kwargs = dict(num_boost_round=20, incremental_rounds=10, early_stopping_rounds=5)
+    X, y = _frame(2000, 0.5, 0)
+    X_val, y_val = _frame(500, 0.5, 1)
+    first = IncrementalTrainer(store, 'claim', 'binary:logistic', 'auc', **kwargs).update(
+        X, y, X_val, y_val, last_month='2015-01')
+    assert first['Decision'] == 'full'
+
+    X_new, y_new = _frame(2000, 1.0, 2)
+    trainer = IncrementalTrainer(store, 'claim', 'binary:logistic', 'auc', psi_threshold=0.25, **kwargs)
+    summary = trainer.update(X_new, y_new, X_val, y_val, last_month='2015-02', X_history=X, y_history=y)
+    assert 'Province' in summary['DriftedFeatures']
+    assert summary['MaxPSI'] > trainer.psi_threshold
+    assert summary['Decision'] == 'full'
@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+import pytest
+from scipy import stats
+
+from src.stats.hypothesis_tests import (_pairwise_mannwhitney, calculate_effect_size_cohens_d,
+                                        pairwise_effect_sizes, pairwise_matrix)
+
+
+@pytest.fixture
+def claims():
+    rng = np.random.default_rng(0)
+    n = 800
+    vehicle = rng.choice(['Bus', 'Passenger', 'Taxi', 'Truck'], n)
+    scale = pd.Series(vehicle).map({'Bus': 400, 'Passenger': 500, 'Taxi': 700, 'Truck': 500}).to_numpy()
+    # Rounded amounts so the tie correction is exercised
+    amount = np.round(rng.gamma(2, scale) / 100) * 100
+    claimed = rng.random(n) < 0.4
+    return pd.DataFrame({'VehicleType': vehicle, 'TotalClaims': np.where(claimed, amount, 0.0),
+                         'TotalPremium': rng.gamma(5, 40, n)})
+
+
+def test_pairwise_mannwhitney_matches_scipy(claims):
+    data = claims[claims['TotalClaims'] > 0]
+    codes, labels = pd.factorize(data['VehicleType'], sort=True)
+    values = data['TotalClaims'].to_numpy()
+    # A tiny cell budget processes the distinct values in many blocks
+    for max_cells in (10_000_000, 12):
+        U, p = _pairwise_mannwhitney(codes, values, len(labels), max_cells=max_cells)
+        for i in range(len(labels)):
+            for j in range(len(labels)):
+                if i == j:
+                    continue
+                expected = stats.mannwhitneyu(values[codes == i], values[codes == j], method='asymptotic')
+                assert U[i, j] == pytest.approx(expected.statistic)
+                assert p[i, j] == pytest.approx(expected.pvalue, rel=1e-9)
+
+
+def test_pairwise_effect_sizes_match_per_pair_computations(claims):
+    pairs = pairwise_effect_sizes(claims, 'VehicleType')
+    assert len(pairs) == 6
+    for row in pairs.itertuples():
+        a = claims[claims['VehicleType'] == row.LevelA]
+        b = claims[claims['VehicleType'] == row.LevelB]
+        sev_a, sev_b = a.loc[a['TotalClaims'] > 0, 'TotalClaims'], b.loc[b['TotalClaims'] > 0, 'TotalClaims']
+        assert (row.NA, row.NB) == (len(sev_a), len(sev_b))
+        assert row.CohensD == pytest.approx(calculate_effect_size_cohens_d(sev_a, sev_b))
+        assert row.FreqDiff == pytest.approx((a['TotalClaims'] > 0).mean() - (b['TotalClaims'] > 0).mean())
+        assert row.LossRatioRatio == pytest.approx((a['TotalClaims'].sum() / a['TotalPremium'].sum()) /
+                                                   (b['TotalClaims'].sum() / b['TotalPremium'].sum()))
+        assert row.MannWhitneyP == pytest.approx(
+            stats.mannwhitneyu(sev_a, sev_b, method='asymptotic').pvalue, rel=1e-9)
+
+
+def test_pairwise_matrix_fills_lower_triangle(claims):
+    pairs = pairwise_effect_sizes(claims, 'VehicleType')
+    d = pairwise_matrix(pairs, 'CohensD', antisymmetric=True)
+    np.testing.assert_allclose(d.to_numpy(), -d.T.to_numpy())
+    ratio = pairwise_matrix(pairs, 'LossRatioRatio')
+    off_diagonal = ~np.eye(len(ratio), dtype=bool)
+    np.testing.assert_allclose((ratio * ratio.T).to_numpy()[off_diagonal], 1.0)
@@ -0,0 +1,93 @@
+import numpy as np
+import pandas as pd
+import pytest
+from scipy import stats
+
+from src.stats.resampling import (bootstrap_group_metrics, bootstrap_totals, claim_quantities,
+                                  dispersion_statistic, group_totals, permutation_pvalue, permutation_test)
+
+
+@pytest.fixture
+def policies():
+    rng = np.random.default_rng(0)
+    n = 600
+    province = rng.choice(['Gauteng', 'Limpopo', 'Western Cape'], n)
+    claims = np.where(rng.random(n) < np.where(province == 'Gauteng', 0.3, 0.1), rng.gamma(2, 500, n), 0.0)
+    return pd.DataFrame({'Province': province, 'TotalClaims': claims, 'TotalPremium': rng.gamma(5, 40, n)})
+
+
+def test_group_totals_with_weights_match_weighted_bincount():
+    rng = np.random.default_rng(1)
+    codes = rng.integers(0, 4, 200)
+    values = rng.normal(size=(200, 3))
+    weights = rng.poisson(1.0, size=(5, 200)).astype(float)
+    totals = group_totals(codes, values, 4, weights)
+    for b in range(5):
+        for j in range(3):
+            expected = np.bincount(codes, weights=weights[b] * values[:, j], minlength=4)
+            np.testing.assert_allclose(totals[b, :, j], expected)
+
+
+def test_group_totals_of_relabelled_rows_match_bincount():
+    rng = np.random.default_rng(2)
+    codes = np.stack([rng.permutation(np.repeat(np.arange(3), 20)) for _ in range(4)])
+    values = rng.normal(size=(60, 2))
+    totals = group_totals(codes, values, 3)
+    for b in range(4):
+        for j in range(2):
+            np.testing.assert_allclose(totals[b, :, j], np.bincount(codes[b], weights=values[:, j], minlength=3))
+
+
+def test_multinomial_bootstrap_draws_n_rows_per_replicate():
+    rng = np.random.default_rng(3)
+    codes = rng.integers(0, 3, 500)
+    values = claim_quantities(rng.random(500), np.ones(500))
+    # A small cell budget splits the rows into many chunks
+    totals = bootstrap_totals(codes, values, 3, 50, rng, method='multinomial', max_cells=1000)
+    np.testing.assert_array_equal(totals[..., 3].sum(axis=1), 500)
+
+
+def test_bootstrap_estimates_match_groupby(policies):
+    result = bootstrap_group_metrics(policies, 'Province', n_boot=300, n_workers=1)
+    sums = policies.assign(Claimant=policies['TotalClaims'] > 0).groupby('Province').agg(
+        Claims=('TotalClaims', 'sum'), Premium=('TotalPremium', 'sum'),
+        Claimants=('Claimant', 'sum'), Policies=('Claimant', 'size'))
+    expected = {
+        'LossRatio': sums['Claims'] / sums['Premium'],
+        'ClaimFrequency': sums['Claimants'] / sums['Policies'],
+        'ClaimSeverity': sums['Claims'] / sums['Claimants'],
+    }
+    for metric, values in expected.items():
+        rows = result[result['Metric'] == metric].set_index('Province')
+        np.testing.assert_allclose(rows['Estimate'], values.loc[rows.index])
+        assert (rows['SE'] > 0).all()
+        assert ((rows['CILower'] <= rows['Estimate']) & (rows['Estimate'] <= rows['CIUpper'])).all()
+        np.testing.assert_array_equal(rows['NPolicies'], sums['Policies'].loc[rows.index])
+
+
+def test_permutation_pvalue_matches_scipy():
+    rng = np.random.default_rng(4)
+    codes = np.repeat([0, 1, 2], 40)
+    values = rng.normal(size=120) + 0.4 * (codes == 2)
+
+    def statistic(x):
+        return dispersion_statistic(group_totals(codes[None, :], np.column_stack([x, np.ones(len(x))]), 3),
+                                    'mean')[0]
+
+    observed, p = permutation_pvalue(codes, np.column_stack([values, np.ones(120)]), 'mean', n_perm=4999, seed=0)
+    reference = stats.permutation_test((values,), statistic, permutation_type='pairings',
+                                       n_resamples=4999, alternative='greater', random_state=0)
+    assert observed == pytest.approx(reference.statistic)
+    assert p == pytest.approx(reference.pvalue, abs=0.02)
+
+
+def test_permutation_test_statistics(policies):
+    observed, p = permutation_test(policies, 'Province', 'frequency', n_perm=499, n_workers=1)
+    assert p < 0.01
+    codes = pd.factorize(policies['Province'], sort=True)[0]
+    values = claim_quantities(policies['TotalClaims'], policies['TotalPremium'])
+    assert observed == pytest.approx(permutation_pvalue(codes, values, 'frequency', n_perm=9)[0])
+
+    shuffled = policies.assign(Province=np.random.default_rng(5).permutation(['A', 'B'] * 300))
+    _, p = permutation_test(shuffled, 'Province', 'mean', value_col='TotalPremium', n_perm=499, n_workers=2)
+    assert p > 0.01
@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.stats.sketches import GroupedHyperLogLog, group_keys, precision_for_error, sketch_chunks, standard_error
+
+
+@pytest.fixture
+def policies():
+    rng = np.random.default_rng(0)
+    sizes = {'Gauteng': 200_000, 'Limpopo': 20_000, 'Northern Cape': 2_000, 'Free State': 500}
+    frames = []
+    for province, size in sizes.items():
+        ids = rng.choice(10**9, size, replace=False)
+        # Every policy appears on one to five monthly rows
+        frames.append(pd.DataFrame({'PolicyID': np.repeat(ids, rng.integers(1, 6, size)), 'Province': province}))
+    return pd.concat(frames).sample(frac=1, random_state=0).reset_index(drop=True)
+
+
+def test_estimates_within_three_standard_errors(policies):
+    sketches = GroupedHyperLogLog(precision=12)
+    sketches.update(policies['PolicyID'], policies['Province'])
+    exact = policies.groupby('Province')['PolicyID'].nunique()
+    estimate = pd.Series(sketches.estimate(), index=sketches.labels)
+    relative_error = (estimate[exact.index] / exact - 1).abs()
+    assert (relative_error <= 3 * standard_error(12)).all()
+    union = sketches.union(['Limpopo', 'Northern Cape'])
+    assert union == pytest.approx(exact['Limpopo'] + exact['Northern Cape'], rel=3 * standard_error(12))
+
+
+def test_merged_chunks_equal_a_single_pass(policies):
+    single = GroupedHyperLogLog(precision=10)
+    single.update(policies['PolicyID'], policies['Province'])
+    chunks = [policies.iloc[i:i + 50_000] for i in range(0, len(policies), 50_000)]
+    merged = sketch_chunks(chunks[::2], 'PolicyID', ['Province'], precision=10)
+    merged.merge(sketch_chunks(chunks[1::2], 'PolicyID', ['Province'], precision=10))
+    order = [merged.labels.index(label) for label in single.labels]
+    np.testing.assert_array_equal(merged.registers[order], single.registers)
+
+    total = merged.rollup(lambda label: 'all')
+    assert total.estimate()[0] == pytest.approx(GroupedHyperLogLog(10).update(policies['PolicyID']).estimate()[0])
+
+
+def test_float_ids_hash_like_integers():
+    ids = pd.Series(np.arange(1000, dtype=np.int64))
+    as_int = GroupedHyperLogLog(precision=8).update(ids)
+    as_float = GroupedHyperLogLog(precision=8).update(ids.astype(float).where(ids % 7 != 0))
+    with_gaps = GroupedHyperLogLog(precision=8).update(ids[ids % 7 != 0])
+    np.testing.assert_array_equal(as_float.registers, with_gaps.registers)
+    assert (as_int.registers >= as_float.registers).all()
+
+
+def test_save_and_load_round_trip(policies, tmp_path):
+    sketches = sketch_chunks([policies.assign(Segment=policies['Province'].str.len() % 3)], 'PolicyID',
+                             ['Province', 'Segment'], precision=precision_for_error(0.02))
+    loaded = GroupedHyperLogLog.load(sketches.save(str(tmp_path / 'train_policy_hll.npz')))
+    assert loaded.key_names == ['Province', 'Segment']
+    assert loaded.labels == sketches.labels
+    assert all(isinstance(label, tuple) for label in loaded.labels)
+    np.testing.assert_array_equal(loaded.registers, sketches.registers)
+
+
+def test_group_keys_match_groupby():
+    df = pd.DataFrame({'Province': ['A', 'B', None, 'A', 'B', 'A'], 'Segment': [1, 2, 1, 1, np.nan, 2]})
+    codes, keys = group_keys(df, ['Province', 'Segment'])
+    assert keys[codes[0]] == ('A', '1.0') and keys[codes[2]] == ('', '1.0') and keys[codes[4]] == ('B', '')
+    assert codes[0] == codes[3] and len(keys) == df.groupby(['Province', 'Segment'], dropna=False).ngroups
@@ -0,0 +1,54 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+import xgboost as xgb
+from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
+
+from src.models.tree_export import TreeEnsemblePredictor, export_trees, verify_export
+
+
+@pytest.fixture
+def data():
+    rng = np.random.default_rng(0)
+    n = 1500
+    X = pd.DataFrame({'SumInsured': rng.gamma(2, 1e5, n), 'VehicleAge': rng.integers(0, 25, n).astype(float),
+                      'Province': rng.integers(0, 9, n).astype(float), 'Premium': rng.gamma(5, 40, n)})
+    logit = -2 + 0.1 * X['VehicleAge'] - 0.2 * X['Province'] + X['SumInsured'] / 2e5
+    y_class = (rng.random(n) < 1 / (1 + np.exp(-logit))).astype(int)
+    y_reg = X['Premium'] * 10 + X['VehicleAge'] * 50 + rng.normal(0, 50, n)
+    # Missing values in every column, following each node's default direction
+    X = X.mask(rng.random(X.shape) < 0.1)
+    return X, y_class, y_reg
+
+
+MODELS = {
+    'rf_classifier': lambda: RandomForestClassifier(n_estimators=20, max_depth=8, random_state=0),
+    'rf_regressor': lambda: RandomForestRegressor(n_estimators=20, max_depth=8, random_state=0),
+    'xgb_classifier': lambda: xgb.XGBClassifier(n_estimators=30, max_depth=5, tree_method='hist'),
+    'xgb_regressor': lambda: xgb.XGBRegressor(n_estimators=30, max_depth=5, tree_method='hist'),
+    'xgb_poisson': lambda: xgb.XGBRegressor(n_estimators=30, max_depth=5, objective='count:poisson'),
+}
+
+
+@pytest.mark.parametrize('name', list(MODELS))
+def test_exported_predictor_matches_model(name, data, tmp_path):
+    X, y_class, y_reg = data
+    # The Poisson model predicts claim counts, here 0/1
+    y = y_reg if name.endswith('regressor') else y_class
+    model = MODELS[name]().fit(X, y)
+    predictor = TreeEnsemblePredictor.load(export_trees(model, str(tmp_path)))
+    assert verify_export(model, predictor, X)['Match']
+    np.testing.assert_array_equal(predictor.predict(X.to_numpy()), predictor.predict(X))
+    if 'classifier' in name:
+        np.testing.assert_array_equal(predictor.predict(X), model.predict(X))
+
+
+def test_export_without_child_table_loads(data, tmp_path):
+    X, y_class, _ = data
+    model = xgb.XGBClassifier(n_estimators=10, max_depth=4).fit(X, y_class)
+    path = export_trees(model, str(tmp_path))
+    expected = TreeEnsemblePredictor.load(path).predict_proba(X)
+    os.remove(os.path.join(path, 'children.npy'))
+    np.testing.assert_array_equal(TreeEnsemblePredictor.load(path).predict_proba(X), expected)